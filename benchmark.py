@@ -0,0 +1,582 @@
+"""Benchmarks for the search engines.
+
+    python benchmark.py arrivaltime schedule.csv --queries 50
+    python benchmark.py goal schedule.csv --cost-function stops
+    python benchmark.py generate synthetic.csv --trains 5000
+    python benchmark.py suite --json results.json
+    python benchmark.py compare old.json results.json
+    python benchmark.py loader schedule.csv
+
+``arrivaltime`` runs the same random queries through ``dijkstra_arrivaltime``,
+the connection scan (``csa``), ``raptor`` and trip-based routing (``trip``)
+and reports timings and agreement with the dijkstra costs; building the
+trip-based transfer sets (one per change time) is timed separately. ``goal`` compares the engines of stops / timeintrain
+or price (every engine in ``solver.ENGINES``), including the number of
+settled nodes per query.
+
+``suite`` measures how solving scales with the size of the network. It
+generates reproducible synthetic schedules (``generate_schedule``, the
+``schedule.csv`` format, 10 to 20,000 trains on a network of hubs) and times
+each phase on them: parsing, station index, graphs, and per cost function
+the latency percentiles of random queries, plus the peak RSS after every
+phase. ``--json`` writes the results, tagged with the git commit, and
+``compare`` reports the timings that got slower between two such files.
+
+``loader`` times the row-by-row and the vectorised (NumPy) schedule loader
+on the same file and checks that both build the same timetable; it exits
+non-zero if they differ.
+"""
+
+import argparse
+import csv
+import datetime
+import heapq
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterable, List, Tuple
+
+import schedule_utils
+from schedule_utils import DAY, Timetable, load_schedule, build_station_index, build_departure_index
+from schedule_cache import load_compiled
+from graph_builder import ScheduleGraph
+from search import dijkstra_arrivaltime
+from csa import ConnectionArray, csa_arrivaltime
+from raptor import raptor_arrivaltime
+from trip_based import TransferSet, trip_arrivaltime
+import solver
+
+
+def _random_queries(trains, n: int, seed: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    codes = trains.station_codes
+    return [
+        {
+            "from": rnd.choice(codes),
+            "to": rnd.choice(codes),
+            "start": rnd.randrange(0, 24 * 3600, 60),
+            "change": rnd.randint(1, 10) * 60,
+        }
+        for _ in range(n)
+    ]
+
+
+# --- synthetic schedules -------------------------------------------------
+
+SCHEDULE_HEADER = ["Train No.", "train Name", "islno", "station Code", "Station Name", "Arrival time",
+                   "Departure time", "Distance", "Source Station Code", "source Station Name",
+                   "Destination station Code", "Destination Station Name"]
+
+# mean distance between neighbouring stations, km
+_SPACING_KM = 20
+# rail links per station to its nearest neighbours
+_LINKS = 3
+# (share of trains, km/h, importance a station needs for a stop; 0: every station)
+_SERVICES = ((0.3, 100, 0.05), (0.3, 75, 0.01), (0.4, 55, 0.0))
+
+
+def _station_code(i: int) -> str:
+    letters = ""
+    i += 26 * 26  # at least three letters
+    while i:
+        i, r = divmod(i, 26)
+        letters = chr(ord("A") + r) + letters
+    return letters
+
+
+def _clock(t: int) -> str:
+    t %= DAY
+    return f"'{t // 3600:02d}:{t % 3600 // 60:02d}:{t % 60:02d}'"
+
+
+def _rail_network(rnd: random.Random, n_stations: int):
+    """Station positions (km), importances and rail links.
+
+    The country is a square sized for about ``_SPACING_KM`` between
+    neighbouring stations. A few hubs with Zipf-distributed importance sit
+    anywhere in it; most other stations cluster around a hub, the rest are
+    rural. Every
+    station links to its nearest neighbours, and the components this leaves
+    are joined to the largest one, so every station is reachable.
+    """
+    side = _SPACING_KM * math.sqrt(n_stations)
+    n_hubs = max(2, n_stations // 40)
+    pos: List[Tuple[float, float]] = []
+    weight: List[float] = []
+    for i in range(n_stations):
+        if i < n_hubs:
+            pos.append((rnd.uniform(0, side), rnd.uniform(0, side)))
+            weight.append(1.0 / (i + 1))
+        elif rnd.random() < 0.75:
+            hx, hy = pos[int(rnd.paretovariate(1.0)) % n_hubs]
+            spread = 0.4 * side / math.sqrt(n_hubs)
+            pos.append((min(max(rnd.gauss(hx, spread), 0), side), min(max(rnd.gauss(hy, spread), 0), side)))
+            weight.append(0.02 * rnd.random() ** 3)
+        else:
+            pos.append((rnd.uniform(0, side), rnd.uniform(0, side)))
+            weight.append(0.005 * rnd.random() ** 3)
+
+    # nearest neighbours through a grid of about two stations per cell
+    cell = side / max(1, int(math.sqrt(n_stations / 2)))
+    grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for i, (x, y) in enumerate(pos):
+        grid[int(x // cell), int(y // cell)].append(i)
+    links: List[set] = [set() for _ in range(n_stations)]
+    for i, (x, y) in enumerate(pos):
+        cx, cy = int(x // cell), int(y // cell)
+        near: List[int] = []
+        r = 1
+        while len(near) < _LINKS and r <= 4:
+            near = [j for dx in range(-r, r + 1) for dy in range(-r, r + 1)
+                    for j in grid.get((cx + dx, cy + dy), ()) if j != i]
+            r += 1
+        for j in sorted(near, key=lambda j: math.dist(pos[i], pos[j]))[:_LINKS]:
+            links[i].add(j)
+            links[j].add(i)
+
+    # join the components to the largest one
+    component = [-1] * n_stations
+    members: List[List[int]] = []
+    for s in range(n_stations):
+        if component[s] < 0:
+            component[s] = len(members)
+            todo, comp = [s], []
+            while todo:
+                v = todo.pop()
+                comp.append(v)
+                for w in links[v]:
+                    if component[w] < 0:
+                        component[w] = component[s]
+                        todo.append(w)
+            members.append(comp)
+    main = max(members, key=len)
+    for comp in members:
+        if comp is not main:
+            v = comp[0]
+            w = min(main, key=lambda w: math.dist(pos[v], pos[w]))
+            links[v].add(w)
+            links[w].add(v)
+    return pos, weight, links
+
+
+def _route(pos, links, a: int, b: int) -> List[int]:
+    """Shortest rail route from ``a`` to ``b`` (A* on distance)."""
+    dist = {a: 0.0}
+    prev: Dict[int, int] = {}
+    pq = [(math.dist(pos[a], pos[b]), 0.0, a)]
+    while pq:
+        _, d, v = heapq.heappop(pq)
+        if v == b:
+            break
+        if d != dist[v]:
+            continue
+        for w in links[v]:
+            nd = d + math.dist(pos[v], pos[w])
+            if nd < dist.get(w, math.inf):
+                dist[w] = nd
+                prev[w] = v
+                heapq.heappush(pq, (nd + math.dist(pos[w], pos[b]), nd, w))
+    route = [b]
+    while route[-1] != a:
+        route.append(prev[route[-1]])
+    route.reverse()
+    return route
+
+
+def generate_schedule(path: str, n_trains: int, seed: int = 1, n_stations: int | None = None) -> Dict[str, Any]:
+    """Write a reproducible synthetic schedule in the ``schedule.csv`` format.
+
+    Trains run between stations drawn by importance, so most of them serve
+    the hubs, along the shortest rail route. Express, fast and stopping
+    services call at progressively less important stations and run at
+    different speeds. Returns the schedule's size.
+    """
+    rnd = random.Random(seed)
+    n_stations = n_stations or max(10, n_trains // 2)
+    pos, weight, links = _rail_network(rnd, n_stations)
+    codes = [_station_code(i) for i in range(n_stations)]
+    names = [f"STATION {c}" for c in codes]
+    cum_weight = list(itertools.accumulate(weight))
+    routes: Dict[Tuple[int, int], List[int]] = {}
+
+    n_stops = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(SCHEDULE_HEADER)
+        for number in sorted(rnd.sample(range(10000, 100000), n_trains)):
+            a, b = rnd.choices(range(n_stations), cum_weights=cum_weight, k=2)
+            while b == a:
+                b = rnd.randrange(n_stations)
+            route = routes.get((a, b))
+            if route is None:
+                route = routes[a, b] = _route(pos, links, a, b)
+            level = rnd.choices(range(len(_SERVICES)), weights=[p for p, _, _ in _SERVICES])[0]
+            _, speed, importance = _SERVICES[level]
+            km = [0.0]
+            for u, v in zip(route, route[1:]):
+                km.append(km[-1] + math.dist(pos[u], pos[v]))
+            # positions on the route the train calls at; no hop longer than
+            # half a day, so consecutive times stay unambiguous
+            stops = [0]
+            for k in range(1, len(route)):
+                if (k == len(route) - 1 or weight[route[k]] >= importance
+                        or km[k + 1] - km[stops[-1]] > speed * 12):
+                    stops.append(k)
+            name = f"{codes[a]} {codes[b]} {('EXP', 'FAST', 'PASS')[level]}"
+
+            t = rnd.randrange(0, DAY, 300)
+            for i, k in enumerate(stops):
+                s = route[k]
+                if i > 0:
+                    t += max(60, round((km[k] - km[stops[i - 1]]) / speed * 60) * 60)
+                arrival = "'00:00:00'" if i == 0 else _clock(t)
+                if 0 < i < len(stops) - 1:
+                    t += 60 * rnd.choice((1, 2, 2, 5, 10) if weight[s] >= 0.05 else (1, 1, 2))
+                departure = "'00:00:00'" if i == len(stops) - 1 else _clock(t)
+                writer.writerow([f"'{number:05d}'", name, i + 1, f"{codes[s]:<4s}", f"{names[s]:<15s}", arrival,
+                                 departure, round(km[k]), f"{codes[a]:<4s}", f"{names[a]:<15s}",
+                                 f"{codes[b]:<4s}", f"{names[b]:<15s}"])
+            n_stops += len(stops)
+    return {"trains": n_trains, "stations": n_stations, "stops": n_stops, "csv_bytes": os.path.getsize(path)}
+
+
+def bench_arrivaltime(schedule_file: str, n_queries: int = 50, seed: int = 1) -> Dict[str, Any]:
+    trains, station_index = load_compiled(schedule_file)
+    departures = build_departure_index(trains)
+
+    t0 = time.perf_counter()
+    connections = ConnectionArray(trains)
+    build_time = time.perf_counter() - t0
+
+    queries = _random_queries(trains, n_queries, seed)
+    transfers: Dict[int, TransferSet] = {}
+    t0 = time.perf_counter()
+    for change in sorted({q["change"] for q in queries}):
+        transfers[change] = TransferSet.build(trains, departures, change)
+    trip_build_time = time.perf_counter() - t0
+
+    engines = {
+        "csa": lambda q: csa_arrivaltime(trains, connections, q["from"], [q["to"]], q["start"], q["change"]),
+        "raptor": lambda q: raptor_arrivaltime(trains, station_index, q["from"], [q["to"]], q["start"],
+                                               q["change"]),
+        "trip": lambda q: trip_arrivaltime(trains, station_index, transfers[q["change"]], q["from"], [q["to"]],
+                                           q["start"]),
+    }
+    timings: Dict[str, List[float]] = {"dijkstra": [], **{name: [] for name in engines}}
+    same = dict.fromkeys(engines, 0)
+    for q in queries:
+        t0 = time.perf_counter()
+        _, dist, goal = dijkstra_arrivaltime(trains, station_index, q["from"], q["to"], q["start"], q["change"],
+                                             departures=departures)
+        timings["dijkstra"].append(time.perf_counter() - t0)
+        cost = dist[goal] if goal is not None else None
+
+        for name, run in engines.items():
+            t0 = time.perf_counter()
+            _, engine_dist, goals = run(q)
+            timings[name].append(time.perf_counter() - t0)
+
+            engine_goal = goals.get(trains.station_ids.get(q["to"], -1))
+            same[name] += cost == (engine_dist[engine_goal] if engine_goal is not None else None)
+
+    total = {name: sum(ts) for name, ts in timings.items()}
+    res: Dict[str, Any] = {
+        "schedule": schedule_file,
+        "stops": trains.n_stops,
+        "queries": n_queries,
+        "csa_build_s": build_time,
+        "trip_build_s": trip_build_time,
+        "trip_transfers": sum(len(ts.stop) for ts in transfers.values()),
+    }
+    for name, ts in timings.items():
+        res[f"{name}_total_s"] = total[name]
+        res[f"{name}_median_ms"] = 1000 * statistics.median(ts)
+    for name in engines:
+        res[f"{name}_speedup"] = total["dijkstra"] / total[name] if total[name] else float("inf")
+        res[f"{name}_same_cost"] = same[name]
+    return res
+
+
+def bench_goal_directed(schedule_file: str, cost_function: str = "stops", n_queries: int = 50,
+                        seed: int = 1) -> Dict[str, Any]:
+    schedule_data = solver._get_schedule({}, schedule_file)
+    trains = schedule_data["trains"]
+
+    t0 = time.perf_counter()
+    if "alt" in solver.ENGINES[cost_function]:
+        solver._get_landmarks(schedule_data, cost_function)
+    build_time = time.perf_counter() - t0
+
+    engines = solver.ENGINES[cost_function]
+    timings: Dict[str, List[float]] = {name: [] for name in engines}
+    settled: Dict[str, List[int]] = {name: [] for name in engines}
+    same = dict.fromkeys(engines, 0)
+    for q in _random_queries(trains, n_queries, seed):
+        costs = {}
+        for name in engines:
+            count = 0
+
+            def on_settle(_node) -> bool:
+                nonlocal count
+                count += 1
+                return False
+
+            t0 = time.perf_counter()
+            _, dist, goal = solver._search(schedule_data, cost_function, q["from"], q["to"], None, 0, on_settle,
+                                           name)
+            timings[name].append(time.perf_counter() - t0)
+            settled[name].append(count)
+            costs[name] = dist[goal] if goal is not None else None
+        for name in engines:
+            same[name] += costs[name] == costs[engines[0]]
+
+    res: Dict[str, Any] = {
+        "schedule": schedule_file,
+        "cost_function": cost_function,
+        "stations": trains.n_stations,
+        "queries": n_queries,
+        "landmarks_build_s": build_time,
+    }
+    for name in engines:
+        res[f"{name}_total_s"] = sum(timings[name])
+        res[f"{name}_median_ms"] = 1000 * statistics.median(timings[name])
+        res[f"{name}_mean_settled"] = statistics.mean(settled[name])
+        res[f"{name}_same_cost"] = same[name]
+    return res
+
+
+# --- scaling suite -------------------------------------------------------
+
+# train counts of the default suite
+SUITE_SIZES = (10, 100, 1000, 5000, 20000)
+SCALING_COST_FUNCTIONS = ("stops", "timeintrain", "price", "arrivaltime")
+
+
+def bench_loader(schedule_file: str) -> Dict[str, Any]:
+    if schedule_utils.np is None:
+        raise SystemExit("the vectorised schedule loader needs numpy")
+    t0 = time.perf_counter()
+    rows = load_schedule(schedule_file, vectorised=False)
+    t1 = time.perf_counter()
+    columns = load_schedule(schedule_file, vectorised=True)
+    t2 = time.perf_counter()
+    differing = [slot for slot in Timetable.__slots__ if getattr(rows, slot) != getattr(columns, slot)]
+    return {
+        "schedule": schedule_file,
+        "stops": rows.n_stops,
+        "row_s": t1 - t0,
+        "vectorised_s": t2 - t1,
+        "speedup": (t1 - t0) / (t2 - t1) if t2 > t1 else float("inf"),
+        "differing": ", ".join(differing) or "none",
+    }
+
+
+def _peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KiB elsewhere
+
+
+def _percentiles_ms(timings: List[float]) -> Dict[str, float]:
+    ms = sorted(1000 * t for t in timings)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {"p50_ms": cuts[49], "p90_ms": cuts[89], "p99_ms": cuts[98], "mean_ms": statistics.mean(ms),
+            "max_ms": ms[-1]}
+
+
+def bench_scaling(schedule_file: str, n_queries: int = 50, seed: int = 1) -> Dict[str, Any]:
+    """Time the phases of solving on one schedule, from the CSV up.
+
+    Phases: ``parse`` (``load_schedule``), ``index`` (``build_station_index``),
+    ``graph`` (``ScheduleGraph``), then the same random queries per cost
+    function with the default engines. Peak RSS is sampled after each phase.
+    """
+    res: Dict[str, Any] = {"schedule": schedule_file}
+
+    t0 = time.perf_counter()
+    trains = load_schedule(schedule_file)
+    res["parse_s"] = time.perf_counter() - t0
+    res["peak_rss_kb"] = {"parse": _peak_rss_kb()}
+
+    t0 = time.perf_counter()
+    station_index = build_station_index(trains)
+    res["index_s"] = time.perf_counter() - t0
+    res["peak_rss_kb"]["index"] = _peak_rss_kb()
+
+    t0 = time.perf_counter()
+    graph = ScheduleGraph(trains, station_index)
+    res["graph_s"] = time.perf_counter() - t0
+    res["peak_rss_kb"]["graph"] = _peak_rss_kb()
+    res.update(stations=trains.n_stations, trains=trains.n_trains, stops=trains.n_stops)
+
+    schedule_data = {"schedule_file": schedule_file, "trains": trains, "station_index": station_index,
+                     "graph": graph}
+    departures = build_departure_index(trains)
+    queries = _random_queries(trains, n_queries, seed)
+    res["queries"] = {}
+    for cost_function in SCALING_COST_FUNCTIONS:
+        timings = []
+        for q in queries:
+            t0 = time.perf_counter()
+            if cost_function == "arrivaltime":
+                dijkstra_arrivaltime(trains, station_index, q["from"], q["to"], q["start"], q["change"],
+                                     departures=departures)
+            else:
+                solver._search(schedule_data, cost_function, q["from"], q["to"], None, 0)
+            timings.append(time.perf_counter() - t0)
+        res["queries"][cost_function] = _percentiles_ms(timings)
+        res["peak_rss_kb"][cost_function] = _peak_rss_kb()
+    return res
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _suite_case(n_trains: int, work_dir: str, n_queries: int, seed: int) -> Dict[str, Any]:
+    """One suite size, run in a fresh process so its peak RSS is its own."""
+    path = os.path.join(work_dir, f"synthetic-{n_trains}-{seed}.csv")
+    t0 = time.perf_counter()
+    if not os.path.exists(path):
+        generate_schedule(path + ".tmp", n_trains, seed)
+        os.replace(path + ".tmp", path)
+    generate_time = time.perf_counter() - t0
+    res = bench_scaling(path, n_queries, seed)
+    res["generate_s"] = generate_time
+    res["csv_bytes"] = os.path.getsize(path)
+    return res
+
+
+def run_suite(sizes: Iterable[int] = SUITE_SIZES, work_dir: str = "bench-schedules", n_queries: int = 50,
+              seed: int = 1) -> Dict[str, Any]:
+    """Generate (once) and benchmark a synthetic schedule per train count.
+
+    Schedules are kept in ``work_dir``, so later runs time the same inputs.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for n_trains in sizes:
+        with ProcessPoolExecutor(1) as pool:
+            results.append(pool.submit(_suite_case, n_trains, work_dir, n_queries, seed).result())
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "queries": n_queries,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def _suite_metrics(suite: Dict[str, Any]) -> Dict[Tuple[int, str], float]:
+    """Comparable timings of a suite run: ``(trains, metric) -> seconds or ms``."""
+    metrics = {}
+    for res in suite["results"]:
+        for phase in ("parse_s", "index_s", "graph_s"):
+            metrics[res["trains"], phase] = res[phase]
+        for cost_function, stats in res["queries"].items():
+            for name in ("p50_ms", "p90_ms"):
+                metrics[res["trains"], f"{cost_function}_{name}"] = stats[name]
+    return metrics
+
+
+def compare_suites(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.1
+                   ) -> List[Tuple[int, str, float, float, bool]]:
+    """``(trains, metric, old, new, regressed)`` for the metrics of both runs.
+
+    A metric regressed if it got slower by more than ``threshold`` (relative).
+    """
+    old_metrics = _suite_metrics(old)
+    rows = []
+    for key, value in sorted(_suite_metrics(new).items()):
+        if key in old_metrics:
+            before = old_metrics[key]
+            rows.append((*key, before, value, value > before * (1 + threshold)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("arrivaltime", help="dijkstra_arrivaltime vs connection scan, raptor and trip")
+    p.add_argument("schedule")
+    p.add_argument("--queries", type=int, default=50)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("goal", help="engines of stops, timeintrain or price")
+    p.add_argument("schedule")
+    p.add_argument("--cost-function", choices=("stops", "timeintrain", "price"), default="stops")
+    p.add_argument("--queries", type=int, default=50)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("generate", help="write a synthetic schedule")
+    p.add_argument("output")
+    p.add_argument("--trains", type=int, default=1000)
+    p.add_argument("--stations", type=int, default=None)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("suite", help="phase timings and peak RSS on synthetic schedules of growing size")
+    p.add_argument("--trains", type=int, nargs="+", default=list(SUITE_SIZES))
+    p.add_argument("--queries", type=int, default=50)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--work-dir", default="bench-schedules", help="where generated schedules are kept")
+    p.add_argument("--json", default=None, help="write the results to this file")
+    p = sub.add_parser("compare", help="timings that regressed between two suite --json files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.1, help="relative slowdown counted as regression")
+    p = sub.add_parser("loader", help="row-by-row vs vectorised schedule loading, checked for equality")
+    p.add_argument("schedule")
+    args = parser.parse_args()
+
+    if args.bench == "generate":
+        res = generate_schedule(args.output, args.trains, args.seed, args.stations)
+    elif args.bench == "suite":
+        suite = run_suite(args.trains, args.work_dir, args.queries, args.seed)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(suite, f, indent=2)
+        print(f"{'trains':>7s} {'stops':>8s} {'parse_s':>8s} {'index_s':>8s} {'graph_s':>8s} "
+              + " ".join(f"{cf[:11] + '_p50':>15s}" for cf in SCALING_COST_FUNCTIONS) + f" {'peak_rss_kb':>12s}")
+        for res in suite["results"]:
+            print(f"{res['trains']:7d} {res['stops']:8d} {res['parse_s']:8.3f} {res['index_s']:8.3f} "
+                  f"{res['graph_s']:8.3f} "
+                  + " ".join(f"{res['queries'][cf]['p50_ms']:15.3f}" for cf in SCALING_COST_FUNCTIONS)
+                  + f" {max(res['peak_rss_kb'].values()):12d}")
+        return
+    elif args.bench == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        rows = compare_suites(old, new, args.threshold)
+        for n_trains, metric, before, after, regressed in rows:
+            print(f"{n_trains:7d} {metric:24s} {before:10.3f} {after:10.3f} {after / before if before else 1:6.2f}x"
+                  + ("  REGRESSED" if regressed else ""))
+        sys.exit(1 if any(row[-1] for row in rows) else 0)
+    elif args.bench == "arrivaltime":
+        res = bench_arrivaltime(args.schedule, args.queries, args.seed)
+    elif args.bench == "loader":
+        res = bench_loader(args.schedule)
+    else:
+        res = bench_goal_directed(args.schedule, args.cost_function, args.queries, args.seed)
+    for key, value in res.items():
+        print(f"{key:26s} {value:.3f}" if isinstance(value, float) else f"{key:26s} {value}")
+    if args.bench == "loader" and res["differing"] != "none":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""Distributed solving: a coordinator hands shards of a problem file to workers.
+
+    python main.py --mode coordinator --host 0.0.0.0 --port 8100 --workers 0
+    python main.py --mode worker --host coordinator.example --port 8100
+
+The coordinator reads the whole problem file and splits it into shards
+(``make_shards``). The problems of one schedule and origin station stay
+together, so a worker answers them from shared origin searches, and a
+shard never mixes schedules. A shard goes to a worker that already has its
+schedule loaded whenever there is one, else preferably one whose schedule
+no worker has loaded yet, so every worker keeps few timetables warm.
+
+Workers connect to the coordinator and pull work over TCP, one line of
+JSON per message::
+
+    worker -> coordinator   {"type": "hello", "worker": name}
+    coordinator -> worker   {"type": "shard", "id": n, "engines": {...}, "problems": [...]}
+    worker -> coordinator   {"type": "ping"}      every HEARTBEAT_S seconds while solving
+    worker -> coordinator   {"type": "result", "id": n, "rows": [[connection, cost], ...]}
+    coordinator -> worker   {"type": "done"}      once every shard is answered
+
+A worker that disconnects, or stays silent for ``dead_after`` seconds, is
+given up and its shard is queued again for another worker. A shard that
+lost ``max_attempts`` workers is answered with ``solver.ERROR_COST``, like
+a problem that fails to solve. The output is the usual
+``ProblemNo,Connection,Cost`` CSV in problem file order, written as soon as
+a prefix of the problems is answered.
+
+Schedules are named by their path in the problem file, so every node must
+see them under the same paths (a shared directory, or copies).
+"""
+
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Set, TextIO, Tuple
+
+import solver
+from schedule_manager import ScheduleManager
+
+PORT = 8100
+# problems per shard; a shard keeps all problems of one origin, so it may be larger
+SHARD_SIZE = 500
+HEARTBEAT_S = 5.0
+DEAD_AFTER_S = 60.0
+MAX_ATTEMPTS = 3
+# how long a worker keeps trying to reach a coordinator that is not up yet
+CONNECT_WAIT_S = 60.0
+# longest accepted message line
+MAX_MESSAGE = 64 << 20
+
+
+def make_shards(problems: List[Dict[str, Any]], shard_size: int = SHARD_SIZE) -> List[List[int]]:
+    """Indices of ``problems`` in shards of about ``shard_size``, see the module docstring.
+
+    Shards of one schedule are consecutive.
+    """
+    by_origin: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for i, p in enumerate(problems):
+        by_origin[(p["Schedule"].strip(), p["FromStation"].strip())].append(i)
+
+    shards: List[List[int]] = []
+    shard: List[int] = []
+    shard_schedule = None
+    for (schedule, _), members in sorted(by_origin.items()):
+        if shard and (schedule != shard_schedule or len(shard) + len(members) > shard_size):
+            shards.append(shard)
+            shard = []
+        shard.extend(members)
+        shard_schedule = schedule
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader, timeout: float | None = None) -> Dict[str, Any]:
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"nothing received for {timeout:g}s") from None
+    if not line:
+        raise ConnectionError("connection closed")
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError(f"not a message: {line[:80]!r}")
+    return message
+
+
+class Coordinator:
+    """Hands out the shards of ``problems`` and collects their answers.
+
+    ``handle`` serves one worker connection; ``wait`` returns once every
+    shard is answered (or given up). Answers are written to ``output`` as
+    they come in; ``log``, if given, receives a line per worker event.
+    """
+
+    def __init__(self, problems: List[Dict[str, Any]], output: TextIO, engines: Dict[str, str] | None = None,
+                 shard_size: int = SHARD_SIZE, dead_after: float = DEAD_AFTER_S, max_attempts: int = MAX_ATTEMPTS,
+                 log: Callable[[str], None] | None = None):
+        self.problems = problems
+        self.engines = engines
+        self.dead_after = dead_after
+        self.max_attempts = max_attempts
+        self.log = log
+        self.shards = make_shards(problems, shard_size)
+        # shards waiting for a worker, next first
+        self.pending: List[int] = list(range(len(self.shards)))
+        self.attempts = [0] * len(self.shards)
+        self.unanswered = len(self.shards)
+        self.results: List[Tuple[str, Any] | None] = [None] * len(problems)
+        # connected workers with each schedule loaded
+        self.warm: Counter = Counter()
+        self._changed = asyncio.Condition()
+        self._handlers: Set[asyncio.Task] = set()
+
+        self.output = output
+        self.writer = csv.writer(output)
+        self.writer.writerow(["ProblemNo", "Connection", "Cost"])
+        self.written = 0
+
+        self.workers = 0
+        self.retries = 0
+        self.given_up = 0
+
+    def _schedule(self, shard: int) -> str:
+        return self.problems[self.shards[shard][0]]["Schedule"].strip()
+
+    def _take(self, warm: Set[str]) -> int:
+        """Remove and return the pending shard best for a worker with ``warm`` schedules."""
+        shard = next((n for n in self.pending if self._schedule(n) in warm), None)
+        if shard is None:
+            shard = next((n for n in self.pending if not self.warm[self._schedule(n)]), self.pending[0])
+        self.pending.remove(shard)
+        return shard
+
+    def _answer(self, shard: int, rows: List[List[Any]]):
+        for i, (conn, cost) in zip(self.shards[shard], rows):
+            self.results[i] = (conn, cost)
+        self.unanswered -= 1
+        while self.written < len(self.problems) and self.results[self.written] is not None:
+            conn, cost = self.results[self.written]
+            self.writer.writerow([self.problems[self.written]["ProblemNo"], conn, cost])
+            self.written += 1
+        self.output.flush()
+
+    def _give_back(self, shard: int, worker: str):
+        self.attempts[shard] += 1
+        if self.attempts[shard] >= self.max_attempts:
+            self.given_up += 1
+            self._log(f"shard {shard} lost {self.attempts[shard]} workers, last {worker}; given up")
+            self._answer(shard, [["", solver.ERROR_COST]] * len(self.shards[shard]))
+        else:
+            self.retries += 1
+            self._log(f"shard {shard} queued again after losing {worker}")
+            self.pending.insert(0, shard)
+
+    def _log(self, line: str):
+        if self.log is not None:
+            self.log(line)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one worker until every shard is answered or the worker is lost."""
+        self._handlers.add(asyncio.current_task())
+        worker = str(writer.get_extra_info("peername"))
+        warm: Set[str] = set()
+        shard = None
+        try:
+            hello = await _receive(reader, self.dead_after)
+            if hello.get("type") != "hello":
+                raise ValueError("expected hello")
+            worker = str(hello.get("worker", worker))
+            self.workers += 1
+            self._log(f"worker {worker} connected")
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self.pending or not self.unanswered)
+                    if not self.unanswered:
+                        break
+                    shard = self._take(warm)
+                members = self.shards[shard]
+                await _send(writer, {"type": "shard", "id": shard, "engines": self.engines,
+                                     "problems": [self.problems[i] for i in members]})
+                while True:
+                    message = await _receive(reader, self.dead_after)
+                    if message.get("type") == "result" and message.get("id") == shard:
+                        break
+                    if message.get("type") != "ping":
+                        raise ValueError(f"unexpected {message.get('type')!r} message")
+                rows = message.get("rows")
+                if (not isinstance(rows, list) or len(rows) != len(members)
+                        or not all(isinstance(row, list) and len(row) == 2 for row in rows)):
+                    raise ValueError(f"malformed result for shard {shard}")
+                schedule = self._schedule(shard)
+                if schedule not in warm:
+                    warm.add(schedule)
+                    self.warm[schedule] += 1
+                async with self._changed:
+                    self._answer(shard, rows)
+                    shard = None
+                    self._changed.notify_all()
+            await _send(writer, {"type": "done"})
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self._log(f"worker {worker} lost: {type(e).__name__}: {e}")
+        finally:
+            for schedule in warm:
+                self.warm[schedule] -= 1
+            if shard is not None:
+                async with self._changed:
+                    self._give_back(shard, worker)
+                    self._changed.notify_all()
+            writer.close()
+            self._handlers.discard(asyncio.current_task())
+
+    async def wait(self, linger: float = 5.0):
+        """Wait until every shard is answered, then up to ``linger`` seconds for workers to hear so."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self.unanswered)
+        handlers = self._handlers - {asyncio.current_task()}
+        if handlers:
+            await asyncio.wait(handlers, timeout=linger)
+
+    def summary(self) -> str:
+        return (f"{len(self.problems)} problems in {len(self.shards)} shards, {self.workers} workers, "
+                f"{self.retries} shards retried, {self.given_up} given up")
+
+
+async def coordinate(problem_file: str, output_file: str, host: str = "127.0.0.1", port: int = PORT,
+                     local_workers: int = 0, force_schedule: str | None = None,
+                     engines: Dict[str, str] | None = None, shard_size: int = SHARD_SIZE,
+                     dead_after: float = DEAD_AFTER_S, max_attempts: int = MAX_ATTEMPTS,
+                     schedule_memory: int | None = None, log: Callable[[str], None] | None = None) -> Coordinator:
+    """Solve ``problem_file`` into ``output_file`` on the workers that connect to ``host:port``.
+
+    ``local_workers`` worker processes are started on this host as well
+    (with ``schedule_memory``, see ``run_worker``); ``port`` 0 picks a free
+    port. Raises ``RuntimeError`` if all of them fail while no other worker
+    is connected.
+    """
+    problems = list(solver._iter_problems(problem_file))
+    if force_schedule is not None:
+        problems = [{**p, "Schedule": force_schedule} for p in problems]
+
+    with open(output_file, "w", newline="", encoding="utf-8") as output:
+        coordinator = Coordinator(problems, output, engines, shard_size, dead_after, max_attempts, log)
+        server = await asyncio.start_server(coordinator.handle, host, port, limit=MAX_MESSAGE)
+        port = server.sockets[0].getsockname()[1]
+        connect_host = "127.0.0.1" if host in ("", "0.0.0.0") else host
+        ctx = multiprocessing.get_context("spawn")
+        processes = [ctx.Process(target=run_worker, args=(connect_host, port, schedule_memory), daemon=True)
+                     for _ in range(local_workers)]
+        for process in processes:
+            process.start()
+        try:
+            async with server:
+                waiting = asyncio.ensure_future(coordinator.wait())
+                while not (await asyncio.wait({waiting}, timeout=1.0))[0]:
+                    if (processes and not coordinator._handlers
+                            and not any(process.is_alive() or process.exitcode == 0 for process in processes)):
+                        waiting.cancel()
+                        raise RuntimeError(f"all {len(processes)} local workers failed "
+                                           f"(exit code {processes[0].exitcode})")
+        finally:
+            for process in processes:
+                await asyncio.get_running_loop().run_in_executor(None, process.join, 10)
+                if process.is_alive():
+                    process.terminate()
+    return coordinator
+
+
+async def work(host: str = "127.0.0.1", port: int = PORT, name: str | None = None,
+               trains_cache: Dict[str, Dict[str, Any]] | ScheduleManager | None = None,
+               heartbeat: float = HEARTBEAT_S, connect_wait: float = CONNECT_WAIT_S) -> int:
+    """Solve shards from the coordinator at ``host:port`` until it is done.
+
+    Schedules are kept in ``trains_cache`` (by default the process-wide
+    ``solver._worker_cache``). Returns the number of shards solved.
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.monotonic() + connect_wait
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE)
+            break
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(1.0)
+
+    loop = asyncio.get_running_loop()
+    solved = 0
+    # solving runs on a thread of its own, so heartbeats go out meanwhile
+    pool = ThreadPoolExecutor(1)
+    try:
+        await _send(writer, {"type": "hello", "worker": name})
+        while True:
+            message = await _receive(reader)
+            if message.get("type") == "done":
+                break
+            if message.get("type") != "shard":
+                raise ValueError(f"unexpected {message.get('type')!r} message")
+            future = loop.run_in_executor(pool, solver._solve_task, message["problems"], message.get("engines"),
+                                          trains_cache)
+            while not (await asyncio.wait({future}, timeout=heartbeat))[0]:
+                await _send(writer, {"type": "ping"})
+            rows = [[conn, solver.cost_cell(cost)] for conn, cost in future.result()]
+            await _send(writer, {"type": "result", "id": message["id"], "rows": rows})
+            solved += 1
+    finally:
+        writer.close()
+        pool.shutdown()
+    return solved
+
+
+def run_worker(host: str = "127.0.0.1", port: int = PORT, schedule_memory: int | None = None) -> int:
+    """Process entry point of a worker; ``schedule_memory`` bounds its loaded schedules (bytes)."""
+    trains_cache = None
+    if schedule_memory is not None:
+        trains_cache = ScheduleManager(solver.load_schedule_data, schedule_memory, prefetch=0)
+    return asyncio.run(work(host, port, trains_cache=trains_cache))
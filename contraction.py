@@ -0,0 +1,383 @@
+"""Contraction hierarchy (CH) for `stops` queries.
+
+Preprocessing contracts the stations of the `stops` graph one by one, in
+order of importance. Contracting ``v`` removes it from the remaining graph
+and adds a shortcut ``u -> w`` for every pair of in- and out-neighbours
+whose shortest path runs through ``v`` (no "witness" path without ``v`` is
+at most as short). A query then only needs to search *upwards*, towards
+later-contracted stations: forwards from the origin and backwards from the
+destination, meeting at the most important station of the best path.
+
+Edges are kept in one table. An original edge carries the stop id its
+segment departs from (as edge data of ``build_graph_stops``); a shortcut
+carries its two child edges, so a path unpacks recursively into exactly
+the segments ``reconstruct_path`` expects.
+
+The hierarchy is written next to the schedule (``<schedule>.ch``) and keyed
+by the source CSV like the compiled timetable, with the helpers of
+``schedule_cache``.
+
+Layout (native byte order)::
+
+    header    _HEADER
+    columns   _COLUMNS in order, as 32-bit ints
+"""
+
+import heapq
+import os
+import struct
+from array import array
+from typing import Callable, Dict, List, Tuple
+
+from graph_builder import ScheduleGraph
+from schedule_cache import (SOURCE_HEADER, SourceKey, is_current, pack_header, source_key, unpack_header,
+                            write_atomic)
+
+CH_SUFFIX = ".ch"
+
+_MAGIC = b"CH01"
+_FORMAT_VERSION = 1
+
+# n_stations, n_edges, n_up, n_down
+_HEADER = struct.Struct(SOURCE_HEADER + "IIII")
+
+# (attribute, length) where length is a function of (n_stations, n_edges, n_up, n_down)
+_COLUMNS = (
+    ("edge_tail", lambda n, m, up, down: m),
+    ("edge_head", lambda n, m, up, down: m),
+    ("edge_weight", lambda n, m, up, down: m),
+    ("edge_stop", lambda n, m, up, down: m),
+    ("edge_first", lambda n, m, up, down: m),
+    ("edge_second", lambda n, m, up, down: m),
+    ("up_start", lambda n, m, up, down: n + 1),
+    ("up_edges", lambda n, m, up, down: up),
+    ("down_start", lambda n, m, up, down: n + 1),
+    ("down_edges", lambda n, m, up, down: down),
+)
+
+# witness searches give up after settling this many stations; a missed
+# witness only costs a superfluous shortcut, never a wrong answer
+_WITNESS_SETTLE_LIMIT = 60
+
+
+def ch_path_for(schedule_file: str) -> str:
+    return schedule_file + CH_SUFFIX
+
+
+class ContractionHierarchy:
+    """Upward search graphs and edge table of a contracted station graph.
+
+    Edge ``e`` runs from ``edge_tail[e]`` to ``edge_head[e]`` and counts
+    ``edge_weight[e]`` stations. Original edges have ``edge_stop[e]`` set
+    and ``edge_first[e] == -1``; shortcuts have ``edge_stop[e] == -1`` and
+    consist of ``edge_first[e]`` followed by ``edge_second[e]``.
+
+    ``up_edges[up_start[v]:up_start[v + 1]]`` are the edges leaving ``v``
+    towards later-contracted stations, ``down_edges`` likewise the edges
+    *entering* ``v`` from later-contracted stations.
+    """
+
+    __slots__ = tuple(name for name, _ in _COLUMNS)
+
+    @classmethod
+    def build(cls, graph: ScheduleGraph) -> "ContractionHierarchy":
+        """Contract the station graph of ``graph``."""
+        n = graph.trains.n_stations
+        tail: List[int] = []
+        head: List[int] = []
+        weight: List[int] = []
+        stop: List[int] = []
+        first: List[int] = []
+        second: List[int] = []
+        # remaining graph: neighbour -> edge id, per station and direction
+        out_adj: List[Dict[int, int]] = [{} for _ in range(n)]
+        in_adj: List[Dict[int, int]] = [{} for _ in range(n)]
+
+        def add_edge(u: int, w: int, wt: int, s: int, e1: int, e2: int) -> int:
+            tail.append(u)
+            head.append(w)
+            weight.append(wt)
+            stop.append(s)
+            first.append(e1)
+            second.append(e2)
+            e = len(tail) - 1
+            out_adj[u][w] = e
+            in_adj[w][u] = e
+            return e
+
+        # parallel segments of different trains collapse into one edge; the
+        # first one in adjacency order is kept, as dijkstra would relax it first
+        for a in range(n):
+            for j in range(graph.stops_start[a], graph.stops_start[a + 1]):
+                b = graph.stops_to[j]
+                if b != a and b not in out_adj[a]:
+                    add_edge(a, b, 1, graph.stops_edge[j], -1, -1)
+
+        deleted_neighbours = [0] * n
+        # length of the longest chain of contracted stations below each one
+        depth = [0] * n
+
+        def witness(u: int, v: int, limit: int) -> Dict[int, int]:
+            """Distances from ``u`` avoiding ``v``, up to ``limit``."""
+            dist = {u: 0}
+            pq = [(0, u)]
+            settled = 0
+            while pq and settled < _WITNESS_SETTLE_LIMIT:
+                d, x = heapq.heappop(pq)
+                if d != dist[x]:
+                    continue
+                settled += 1
+                for y, e in out_adj[x].items():
+                    if y == v:
+                        continue
+                    nd = d + weight[e]
+                    if nd <= limit and nd < dist.get(y, limit + 1):
+                        dist[y] = nd
+                        heapq.heappush(pq, (nd, y))
+            return dist
+
+        def shortcuts(v: int) -> List[Tuple[int, int, int, int, int]]:
+            """Shortcuts (u, w, weight, e1, e2) contracting ``v`` needs."""
+            needed = []
+            outs = list(out_adj[v].items())
+            if not outs:
+                return needed
+            max_out = max(weight[e] for _, e in outs)
+            for u, e1 in in_adj[v].items():
+                w1 = weight[e1]
+                dist = witness(u, v, w1 + max_out)
+                for w, e2 in outs:
+                    if w == u:
+                        continue
+                    via = w1 + weight[e2]
+                    if dist.get(w, via + 1) > via:
+                        needed.append((u, w, via, e1, e2))
+            return needed
+
+        def priority(v: int) -> int:
+            # edge difference plus terms spreading contraction evenly
+            return (2 * (len(shortcuts(v)) - len(out_adj[v]) - len(in_adj[v]))
+                    + deleted_neighbours[v] + depth[v])
+
+        pq = [(priority(v), v) for v in range(n)]
+        heapq.heapify(pq)
+        up: List[List[int]] = [[] for _ in range(n)]
+        down: List[List[int]] = [[] for _ in range(n)]
+
+        while pq:
+            _, v = heapq.heappop(pq)
+            # lazy update: re-evaluate and defer if no longer the minimum
+            p = priority(v)
+            if pq and p > pq[0][0]:
+                heapq.heappush(pq, (p, v))
+                continue
+
+            for u, w, via, e1, e2 in shortcuts(v):
+                existing = out_adj[u].get(w)
+                if existing is None or weight[existing] > via:
+                    add_edge(u, w, via, -1, e1, e2)
+
+            # all remaining neighbours are contracted later, i.e. upwards
+            up[v] = list(out_adj[v].values())
+            down[v] = list(in_adj[v].values())
+            for w in out_adj[v]:
+                del in_adj[w][v]
+                deleted_neighbours[w] += 1
+                depth[w] = max(depth[w], depth[v] + 1)
+            for u in in_adj[v]:
+                del out_adj[u][v]
+                deleted_neighbours[u] += 1
+                depth[u] = max(depth[u], depth[v] + 1)
+            out_adj[v].clear()
+            in_adj[v].clear()
+
+        ch = cls()
+        ch.edge_tail = array("i", tail)
+        ch.edge_head = array("i", head)
+        ch.edge_weight = array("i", weight)
+        ch.edge_stop = array("i", stop)
+        ch.edge_first = array("i", first)
+        ch.edge_second = array("i", second)
+        ch.up_start, ch.up_edges = _csr(up)
+        ch.down_start, ch.down_edges = _csr(down)
+        return ch
+
+    @property
+    def n_stations(self) -> int:
+        return len(self.up_start) - 1
+
+    def query(self, source: int, target: int,
+              on_settle: Callable[[int], bool] | None = None) -> Tuple[int, List[int]] | None:
+        """Fewest stations from ``source`` to ``target``.
+
+        Returns ``(cost, stops)`` with the departing stop id of every
+        segment along the path, or None if ``target`` is unreachable.
+        ``on_settle`` sees the stations settled by either side, as in
+        ``search.bidirectional_dijkstra``.
+        """
+        if source < 0 or target < 0:
+            return None
+        if source == target:
+            return 0, []
+
+        # upward search spaces are small: search backwards from the target
+        # to completion, then forwards until no meeting can improve any more
+        dist_b, via_b, _, _ = self._upward(target, self.down_start, self.down_edges, self.edge_tail,
+                                           self.up_start, self.up_edges, self.edge_head, on_settle)
+        if dist_b is None:
+            return None
+        dist_f, via_f, best, meet = self._upward(source, self.up_start, self.up_edges, self.edge_head,
+                                                 self.down_start, self.down_edges, self.edge_tail, on_settle,
+                                                 dist_b)
+        if meet < 0:
+            return None
+
+        # CH edges of the path: source .. meet forwards, meet .. target backwards
+        path: List[int] = []
+        v = meet
+        while via_f[v] >= 0:
+            path.append(via_f[v])
+            v = self.edge_tail[via_f[v]]
+        path.reverse()
+        v = meet
+        while via_b[v] >= 0:
+            path.append(via_b[v])
+            v = self.edge_head[via_b[v]]
+        return best, self.unpack(path)
+
+    def _upward(self, source: int, start, edges, far_end, stall_start, stall_edges, stall_end,
+                on_settle: Callable[[int], bool] | None, other: Dict[int, int] | None = None):
+        """Dijkstra over the upward edges of one side.
+
+        Returns ``(dist, via edge, best, meet)``. With the labels of the
+        ``other`` side, ``meet`` is the station where the two add up to the
+        smallest total ``best`` (-1 if none), and the search stops once its
+        own distances reach ``best``.
+
+        Stall-on-demand: if a station above ``v`` reaches it more cheaply
+        (over ``stall_edges``, the opposite direction), ``v``'s label cannot
+        be on a shortest path and ``v`` is not expanded.
+        """
+        edge_weight = self.edge_weight
+        inf = float("inf")
+        dist = {source: 0}
+        via = {source: -1}
+        best = inf
+        meet = -1
+        pq = [(0, source)]
+        while pq:
+            d, v = heapq.heappop(pq)
+            if d != dist[v]:
+                continue
+            if d >= best:
+                break
+            if on_settle is not None and on_settle(v):
+                return None, None, inf, -1
+            if other is not None and v in other and d + other[v] < best:
+                best = d + other[v]
+                meet = v
+            stalled = False
+            for j in range(stall_start[v], stall_start[v + 1]):
+                e = stall_edges[j]
+                if dist.get(stall_end[e], inf) + edge_weight[e] < d:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+            for j in range(start[v], start[v + 1]):
+                e = edges[j]
+                x = far_end[e]
+                nd = d + edge_weight[e]
+                if nd < dist.get(x, inf):
+                    dist[x] = nd
+                    via[x] = e
+                    heapq.heappush(pq, (nd, x))
+        return dist, via, best, meet
+
+    def unpack(self, edges: List[int]) -> List[int]:
+        """Departing stop ids of the original segments behind ``edges``."""
+        stops: List[int] = []
+        stack = list(reversed(edges))
+        while stack:
+            e = stack.pop()
+            if self.edge_first[e] < 0:
+                stops.append(self.edge_stop[e])
+            else:
+                stack.append(self.edge_second[e])
+                stack.append(self.edge_first[e])
+        return stops
+
+
+def _csr(lists: List[List[int]]) -> Tuple[array, array]:
+    start = array("i", [0])
+    flat = array("i")
+    for items in lists:
+        flat.extend(items)
+        start.append(len(flat))
+    return start, flat
+
+
+def _write(ch_file: str, ch: ContractionHierarchy, key: SourceKey):
+    header = pack_header(
+        _HEADER, _MAGIC, _FORMAT_VERSION, key,
+        ch.n_stations, len(ch.edge_tail), len(ch.up_edges), len(ch.down_edges),
+    )
+    write_atomic(ch_file, [header, *(getattr(ch, name).tobytes() for name, _ in _COLUMNS)])
+
+
+def _read(ch_file: str) -> Tuple[tuple, ContractionHierarchy] | None:
+    """Read ``ch_file``; return (source key, hierarchy) or None."""
+    try:
+        with open(ch_file, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    unpacked = unpack_header(_HEADER, data, _MAGIC, _FORMAT_VERSION)
+    if unpacked is None:
+        return None
+    key, counts = unpacked
+    if len(data) != _HEADER.size + 4 * sum(length(*counts) for _, length in _COLUMNS):
+        return None
+
+    ch = ContractionHierarchy()
+    pos = _HEADER.size
+    for name, length in _COLUMNS:
+        column = array("i")
+        n = 4 * length(*counts)
+        column.frombytes(data[pos:pos + n])
+        setattr(ch, name, column)
+        pos += n
+    return key, ch
+
+
+def compile_hierarchy(schedule_file: str, graph: ScheduleGraph,
+                      ch_file: str | None = None) -> ContractionHierarchy:
+    """Contract ``graph`` (of ``schedule_file``) and write the hierarchy file."""
+    key = source_key(schedule_file)
+    ch = ContractionHierarchy.build(graph)
+    _write(ch_file or ch_path_for(schedule_file), ch, key)
+    return ch
+
+
+def load_hierarchy(schedule_file: str, graph: ScheduleGraph,
+                   ch_file: str | None = None) -> ContractionHierarchy:
+    """Return the hierarchy of ``schedule_file``, contracting ``graph`` if needed.
+
+    The file is trusted like the compiled timetable: matching size and
+    mtime, or else a matching SHA-256. A stale or missing file is rebuilt
+    (and written if possible).
+    """
+    ch_file = ch_file or ch_path_for(schedule_file)
+    st = os.stat(schedule_file)
+
+    cached = _read(ch_file)
+    if cached is not None:
+        key, ch = cached
+        if ch.n_stations == graph.trains.n_stations and is_current(ch_file, schedule_file, st, key):
+            return ch
+
+    try:
+        return compile_hierarchy(schedule_file, graph, ch_file)
+    except OSError:
+        return ContractionHierarchy.build(graph)
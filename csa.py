@@ -0,0 +1,368 @@
+"""Connection Scan Algorithm (CSA) for `arrivaltime` queries.
+
+Every pair of consecutive stops of a train is an *elementary connection*.
+Trains run daily, so a connection departing at ``dep`` (seconds in the
+train's own normalised frame, possibly beyond 24h) also departs at
+``dep + k * DAY`` for every day ``k >= 0`` after the query day, exactly the
+instances ``dijkstra_arrivaltime`` reaches through ``roll_forward``.
+
+The connections are stored once per schedule, sorted by departure time of
+day. A query scans them day by day from its start time, so it only ever
+touches connections in time order and needs no priority queue:
+
+* a connection is usable if its train instance is already boarded, or if
+  it departs at least ``change_time`` after the earliest arrival at its
+  station (at the origin: at or after the start time);
+* the scan ends once departures are later than the best arrival at every
+  target, or once nothing can improve any more (see ``_exhausted``).
+
+Labels are per stop, like the states of ``dijkstra_arrivaltime``, and the
+returned ``prev`` / ``dist`` maps have the same shape, so results go
+through ``reconstruct_path`` unchanged.
+
+One deliberate difference: ``dijkstra_arrivaltime`` adds at most one day to
+an arrival, so a train boarded two or more days after its first run can
+"arrive" before it departed. The scan uses the consistent ``arr + k * DAY``.
+"""
+
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+from schedule_utils import DAY, Timetable
+
+
+class ConnectionArray:
+    """Elementary connections of a timetable, sorted by departure time of day.
+
+    Position ``i`` describes the connection from stop ``stop[i]`` to
+    ``stop[i] + 1``, departing at ``tod[i]`` (seconds after midnight) on day
+    ``base_day[i]`` of its train's first run.
+    """
+
+    __slots__ = ("stop", "tod", "base_day", "max_base_day")
+
+    def __init__(self, trains: Timetable):
+        stop_arr = trains.stop_arr
+        stop_dep = trains.stop_dep
+        train_start = trains.train_start
+
+        conns = []
+        for t in range(trains.n_trains):
+            for s in range(train_start[t], train_start[t + 1] - 1):
+                dep = stop_dep[s]
+                # ties: zero-length connections first, so an arrival at the
+                # departure time is known before anything leaves then
+                conns.append((dep % DAY, stop_arr[s + 1] - dep, s, dep // DAY))
+        conns.sort()
+
+        self.stop = array("i", [c[2] for c in conns])
+        self.tod = array("i", [c[0] for c in conns])
+        self.base_day = array("i", [c[3] for c in conns])
+        self.max_base_day = max(self.base_day, default=0)
+
+    def amended(self, update) -> "ConnectionArray":
+        """The connections of an amended timetable (a ``timetable_delta.TimetableUpdate``).
+
+        The surviving connections keep their order, as ``update.stop_map``
+        preserves the order of the stops it keeps; those of the added and
+        replaced trains are merged in.
+        """
+        trains = update.trains
+        stop_map = update.stop_map
+        stop_arr = trains.stop_arr
+        stop_dep = trains.stop_dep
+        train_start = trains.train_start
+        fresh = []
+        for t in sorted(trains.train_ids[no] for no in update.added | update.replaced):
+            for s in range(train_start[t], train_start[t + 1] - 1):
+                dep = stop_dep[s]
+                fresh.append((dep % DAY, stop_arr[s + 1] - dep, s, dep // DAY))
+        fresh.sort()
+
+        mapped = array("i", map(stop_map.__getitem__, self.stop))
+        tod = self.tod
+        # (position, 0, c): insert c before the connection at position;
+        # (position, 1, None): drop that connection, its train is gone
+        edits: List[Tuple[int, int, Any]] = []
+        pos = -1
+        while True:
+            try:
+                pos = mapped.index(-1, pos + 1)
+            except ValueError:
+                break
+            edits.append((pos, 1, None))
+        for c in fresh:
+            # after every surviving connection that sorts before c
+            pos = bisect_left(tod, c[0])
+            end = bisect_right(tod, c[0])
+            while pos < end and (mapped[pos] < 0 or
+                                 (stop_arr[mapped[pos] + 1] - stop_dep[mapped[pos]], mapped[pos]) < c[1:3]):
+                pos += 1
+            edits.append((pos, 0, c))
+        edits.sort()
+
+        conns = ConnectionArray.__new__(ConnectionArray)
+        conns.stop = array("i")
+        conns.tod = array("i")
+        conns.base_day = array("i")
+        done = 0
+        for pos, drop, c in edits:
+            conns.stop.extend(mapped[done:pos])
+            conns.tod.extend(tod[done:pos])
+            conns.base_day.extend(self.base_day[done:pos])
+            if not drop:
+                conns.stop.append(c[2])
+                conns.tod.append(c[0])
+                conns.base_day.append(c[3])
+                done = pos
+            else:
+                done = pos + 1
+        conns.stop.extend(mapped[done:])
+        conns.tod.extend(tod[done:])
+        conns.base_day.extend(self.base_day[done:])
+        conns.max_base_day = max(conns.base_day, default=0)
+        return conns
+
+
+def csa_arrivaltime(
+    trains: Timetable,
+    connections: ConnectionArray,
+    from_station: str,
+    to_stations: Iterable[str] | None,
+    start_time: int,
+    change_time_seconds: int,
+) -> Tuple[Dict[Hashable, Tuple[Hashable | None, Any]], Dict[Hashable, int], Dict[int, int]]:
+    """Earliest arrival from ``from_station`` at ``start_time``.
+
+    Returns ``(prev, dist, goals)``: ``prev`` and ``dist`` as in
+    ``dijkstra_arrivaltime`` (dist is elapsed seconds since ``start_time``),
+    and ``goals`` mapping station id -> stop id of the earliest arrival there.
+    With ``to_stations=None`` every reachable station is answered.
+    """
+    station_ids = trains.station_ids
+    origin = station_ids.get(from_station, -1)
+    if to_stations is None:
+        targets = None
+    else:
+        targets = {station_ids[s] for s in to_stations if s in station_ids}
+
+    prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
+    dist: Dict[Hashable, int] = {}
+    if origin < 0 or targets == set():
+        return prev, dist, {}
+
+    stop_station = trains.stop_station
+    stop_train = trains.stop_train
+    stop_arr = trains.stop_arr
+    train_start = trains.train_start
+    c_stop = connections.stop
+    c_tod = connections.tod
+    c_base = connections.base_day
+    n_conn = len(c_stop)
+
+    # earliest arrival per station and the stop it was reached at
+    arrival = [math.inf] * trains.n_stations
+    arrival_stop = [-1] * trains.n_stations
+    # boarded train instances (train, day) -> boarding stop
+    boarded: Dict[Tuple[int, int], int] = {}
+    # where a boarding came from: boarding stop -> arrival stop (None at origin)
+    came_from: Dict[Tuple[int, int], int | None] = {}
+
+    # scan bound: departures at or after this cannot improve any target
+    bound = math.inf
+    latest_arrival = start_time
+    active_until = start_time
+
+    day = 0
+    while True:
+        if day > 0 and _exhausted(day, connections, latest_arrival, active_until, change_time_seconds):
+            break
+        day_start = day * DAY
+        if day_start >= bound:
+            break
+
+        i = bisect_left(c_tod, start_time) if day == 0 else 0
+        while i < n_conn:
+            dep = day_start + c_tod[i]
+            if dep >= bound:
+                break
+            k = day - c_base[i]
+            s = c_stop[i]
+            i += 1
+            if k < 0:
+                continue
+
+            instance = (stop_train[s], k)
+            board = boarded.get(instance)
+            if board is None:
+                station = stop_station[s]
+                if station == origin and dep >= start_time:
+                    src = None
+                elif arrival[station] + change_time_seconds <= dep:
+                    src = arrival_stop[station]
+                else:
+                    continue
+                if k > 0 and dep >= latest_arrival + change_time_seconds + DAY:
+                    # the same train a day earlier was boardable too (see
+                    # _exhausted) and arrived a day earlier everywhere
+                    continue
+                board = boarded[instance] = s
+                came_from[instance] = src
+                t = stop_train[s]
+                active_until = max(active_until, stop_arr[train_start[t + 1] - 1] + k * DAY)
+
+            arr = stop_arr[s + 1] + k * DAY
+            nxt = s + 1
+            if arr < dist.get(nxt, math.inf) + start_time:
+                dist[nxt] = arr - start_time
+                prev[nxt] = (came_from[instance] if s == board else s, s)
+
+                station = stop_station[nxt]
+                if arr < arrival[station]:
+                    arrival[station] = arr
+                    arrival_stop[station] = nxt
+                    latest_arrival = max(latest_arrival, arr)
+                    if targets is not None and station in targets:
+                        bound = max(arrival[st] for st in targets)
+        day += 1
+
+    if targets is None:
+        goals = {st: s for st, s in enumerate(arrival_stop) if s >= 0}
+    else:
+        goals = {st: arrival_stop[st] for st in targets if arrival_stop[st] >= 0}
+    return prev, dist, goals
+
+
+class ProfileEntry:
+    """One Pareto-optimal way to travel on from a station.
+
+    Depart at ``dep`` from stop ``stop`` on day ``day`` of its train's
+    schedule, ride to ``exit_stop`` and continue with ``next`` (None: the
+    exit is at the target), arriving at the target at ``arr``.
+    """
+
+    __slots__ = ("dep", "arr", "stop", "exit_stop", "next")
+
+    def __init__(self, dep: int, arr: int, stop: int, exit_stop: int, next: "ProfileEntry | None"):
+        self.dep = dep
+        self.arr = arr
+        self.stop = stop
+        self.exit_stop = exit_stop
+        self.next = next
+
+    def path(self) -> List[int]:
+        """Stop ids of every ride segment (as edge data for ``Timetable.segment``)."""
+        stops: List[int] = []
+        entry: ProfileEntry | None = self
+        while entry is not None:
+            stops.extend(range(entry.stop, entry.exit_stop))
+            entry = entry.next
+        return stops
+
+
+def csa_profile(
+    trains: Timetable,
+    connections: ConnectionArray,
+    from_station: str,
+    to_station: str,
+    window_start: int,
+    window_end: int,
+    change_time_seconds: int,
+) -> List[ProfileEntry]:
+    """Pareto set of journeys leaving ``from_station`` within the window.
+
+    Profile CSA: connections are scanned once, backwards in time, keeping
+    per station the Pareto front of (departure, arrival at target) and per
+    train instance the earliest arrival reachable by staying on board. A
+    journey's departure is the departure of its first train, which must lie
+    in ``[window_start, window_end]``. Returns entries ordered by departure;
+    arrivals strictly increase with departure.
+    """
+    station_ids = trains.station_ids
+    origin = station_ids.get(from_station, -1)
+    target = station_ids.get(to_station, -1)
+    if origin < 0 or target < 0:
+        return []
+
+    # nothing departing later than the earliest arrival for the latest
+    # departure can be part of a Pareto-optimal journey
+    _, dist, goals = csa_arrivaltime(trains, connections, from_station, [to_station], window_end,
+                                     change_time_seconds)
+    if target not in goals:
+        return []
+    horizon = window_end + dist[goals[target]]
+
+    stop_station = trains.stop_station
+    stop_train = trains.stop_train
+    stop_arr = trains.stop_arr
+    c_stop = connections.stop
+    c_tod = connections.tod
+    c_base = connections.base_day
+
+    # per station: entries with decreasing dep (and arr), plus -dep for bisect
+    profiles: List[List[ProfileEntry]] = [[] for _ in range(trains.n_stations)]
+    neg_deps: List[List[int]] = [[] for _ in range(trains.n_stations)]
+    # train instance -> (arrival at target, exit stop, continuation)
+    on_board: Dict[Tuple[int, int], Tuple[int, int, ProfileEntry | None]] = {}
+
+    for day in range(horizon // DAY, -1, -1):
+        day_start = day * DAY
+        i = bisect_right(c_tod, horizon - day_start) - 1
+        while i >= 0:
+            dep = day_start + c_tod[i]
+            if dep < window_start:
+                break
+            k = day - c_base[i]
+            s = c_stop[i]
+            i -= 1
+            if k < 0:
+                continue
+
+            nxt = s + 1
+            arr = stop_arr[nxt] + k * DAY
+            station = stop_station[nxt]
+            instance = (stop_train[s], k)
+            if station == target:
+                best = (arr, nxt, None)
+            else:
+                best = on_board.get(instance, (math.inf, -1, None))
+                # transfer at the next stop
+                deps = neg_deps[station]
+                j = bisect_right(deps, -(arr + change_time_seconds)) - 1
+                if j >= 0 and profiles[station][j].arr < best[0]:
+                    best = (profiles[station][j].arr, nxt, profiles[station][j])
+            if best[0] == math.inf:
+                continue
+            if best[0] < on_board.get(instance, (math.inf,))[0]:
+                on_board[instance] = best
+
+            here = stop_station[s]
+            front = profiles[here]
+            if not front or best[0] < front[-1].arr:
+                entry = ProfileEntry(dep, best[0], s, best[1], best[2])
+                if front and front[-1].dep == dep:
+                    front[-1] = entry
+                else:
+                    front.append(entry)
+                    neg_deps[here].append(-dep)
+
+    return [e for e in reversed(profiles[origin]) if window_start <= e.dep <= window_end]
+
+
+def _exhausted(day: int, connections: ConnectionArray, latest_arrival: float,
+               active_until: int, change_time_seconds: int) -> bool:
+    """True if scanning from the start of ``day`` on cannot improve anything.
+
+    From day ``max_base_day + 1`` on, every connection instance has a copy
+    one day earlier. If all arrivals so far (plus change time) precede that
+    copy and no boarded train is still running, the earlier copy was
+    boardable too and already produced arrivals one day earlier.
+    """
+    t = day * DAY
+    return (
+        day > connections.max_base_day
+        and t >= latest_arrival + change_time_seconds + DAY
+        and t >= active_until
+    )
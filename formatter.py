@@ -24,3 +24,18 @@ def build_connection_string(segments: List[Dict[str, Any]]) -> str:
     for seg in merged:
         parts.append(f"{seg['train']} : {seg['from_islno']} -> {seg['to_islno']}")
     return " ; ".join(parts)
+
+
+def format_clock(sec: int) -> str:
+    """Format seconds since midnight as HH:MM:SS."""
+    hours, rem = divmod(int(sec), 3600)
+    minutes, seconds = divmod(rem, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def format_duration(total_sec: int) -> str:
+    """Format a duration in seconds as DD:HH:MM:SS (arrivaltime cost)."""
+    days, rem = divmod(int(total_sec), 24 * 3600)
+    hours, rem = divmod(rem, 3600)
+    minutes, seconds = divmod(rem, 60)
+    return f"{days:02d}:{hours:02d}:{minutes:02d}:{seconds:02d}"
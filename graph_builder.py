@@ -1,91 +1,299 @@
-from typing import Dict, Any, Tuple, List, Set
+import operator
+from array import array
+from bisect import bisect_right
+from itertools import chain, compress, repeat
+from typing import List, Set
 
+from schedule_utils import Timetable, StationIndex
 
-def build_graph_stops(
-    trains: Dict[str, List[Dict[str, Any]]],
-    station_index: Dict[str, List[Tuple[str, int]]],
-    from_station: str,
-    to_station: str,
-):
+# Edge data is the stop id a ride segment departs from (see
+# ``Timetable.segment``); transfer edges carry ``None``.
+
+# price states pack (stop, used_segments) into a single int
+PRICE_LEVELS = 11
+
+
+class ScheduleGraph:
+    """Query-independent graph data of one schedule.
+
+    Built once per schedule and shared by all queries against it:
+
+    * ``stops``: station-level CSR adjacency. The out-edges of station ``a``
+      are ``stops_to[stops_start[a]:stops_start[a + 1]]`` with the departing
+      stop ids in ``stops_edge`` at the same positions.
+    * ``timeintrain`` / ``price``: nodes are stop ids. The ride edge of stop
+      ``s`` goes to ``s + 1`` and takes ``ride_time[s]`` seconds (-1 at the
+      last stop of a train); transfers are the station index entries of the
+      stop's station, where ``index_pos[s]`` locates ``s`` itself.
+
+    Reverse adjacency for backward searches (``stops_reverse_edges``,
+    ``timeintrain_reverse_expander``) is built on first use.
+
+    Transfers are free in both metrics, so once the first stop of a station
+    has been settled and has relaxed all others there, the transfer fan-out
+    of any later stop at that station (settled at an equal or higher cost)
+    cannot improve anything. The per-search expanders below track this and
+    expand each station's fan-out only once, which keeps hubs with hundreds
+    of calling trains linear instead of quadratic. They rely on being called
+    once per settled node in non-decreasing cost order, as ``dijkstra`` does.
+    """
+
+    def __init__(self, trains: Timetable, station_index: StationIndex):
+        self.trains = trains
+        self.station_index = station_index
+
+        stop_station = trains.stop_station
+        stop_arr = trains.stop_arr
+        stop_dep = trains.stop_dep
+        train_start = trains.train_start
+
+        counts = [0] * (trains.n_stations + 1)
+        for t in range(trains.n_trains):
+            for s in range(train_start[t], train_start[t + 1] - 1):
+                counts[stop_station[s] + 1] += 1
+        for i in range(trains.n_stations):
+            counts[i + 1] += counts[i]
+        self.stops_start = array("i", counts)
+
+        n_edges = counts[-1]
+        fill = counts[:-1]
+        self.stops_to = array("i", bytes(4 * n_edges))
+        self.stops_edge = array("i", bytes(4 * n_edges))
+        ride_time = array("i", [-1]) * trains.n_stops
+        for t in trains.train_order:
+            for s in range(train_start[t], train_start[t + 1] - 1):
+                a = stop_station[s]
+                self.stops_to[fill[a]] = stop_station[s + 1]
+                self.stops_edge[fill[a]] = s
+                fill[a] += 1
+                ride_time[s] = stop_arr[s + 1] - stop_dep[s]
+        self.ride_time = ride_time
+        self._index_arrays()
+        self._reverse = None
+
+    def _index_arrays(self):
+        index_stops = self.station_index.stops
+        self.index_pos = array("i", bytes(4 * self.trains.n_stops))
+        for j, s in enumerate(index_stops):
+            self.index_pos[s] = j
+        self.index_price = array("i", [s * PRICE_LEVELS for s in index_stops])
+
+    def amended(self, update) -> "ScheduleGraph":
+        """The graph of an amended timetable (a ``timetable_delta.TimetableUpdate``).
+
+        Every station keeps its edges, renumbered, less those of removed
+        and replaced trains; the edges of the added and replaced trains are
+        merged in at their place in station index order.
+        """
+        trains = update.trains
+        graph = ScheduleGraph.__new__(ScheduleGraph)
+        graph.trains = trains
+        graph.station_index = update.station_index
+
+        stop_station = trains.stop_station
+        stop_train = trains.stop_train
+        train_start = trains.train_start
+        order = trains.index_order()
+        old_to = self.stops_to
+        if update.station_map is not None:
+            old_to = array("i", map(update.station_map.__getitem__, old_to))
+        old_edge = array("i", map(update.stop_map.__getitem__, self.stops_edge))
+        old_start = self.stops_start
+        start = graph.stops_start = array("i", [0])
+        to = graph.stops_to = array("i")
+        edge = graph.stops_edge = array("i")
+        run = None  # [first, end) of old stations copied as they are
+        for n, o in enumerate(update.old_station):
+            if n not in update.changed_stations:
+                if run is None or run[1] != o:
+                    if run is not None:
+                        to.extend(old_to[old_start[run[0]]:old_start[run[1]]])
+                        edge.extend(old_edge[old_start[run[0]]:old_start[run[1]]])
+                    run = [o, o]
+                run[1] = o + 1
+                start.append(len(to) + old_start[o + 1] - old_start[run[0]])
+                continue
+            if run is not None:
+                to.extend(old_to[old_start[run[0]]:old_start[run[1]]])
+                edge.extend(old_edge[old_start[run[0]]:old_start[run[1]]])
+                run = None
+            a = old_start[o] if o >= 0 else 0
+            b = old_start[o + 1] if o >= 0 else 0
+            kept = list(map((-1).__ne__, old_edge[a:b]))
+            station_to = list(compress(old_to[a:b], kept))
+            station_edge = list(compress(old_edge[a:b], kept))
+            for s in update.new_calls.get(n, ()):
+                if s + 1 < train_start[stop_train[s] + 1]:
+                    i = bisect_right(station_edge, order(s), key=order)
+                    station_edge.insert(i, s)
+                    station_to.insert(i, stop_station[s + 1])
+            to.extend(station_to)
+            edge.extend(station_edge)
+            start.append(len(to))
+        if run is not None:
+            to.extend(old_to[old_start[run[0]]:old_start[run[1]]])
+            edge.extend(old_edge[old_start[run[0]]:old_start[run[1]]])
+
+        ride_time = array("i", [-1]) * trains.n_stops
+        ride_time[:-1] = array("i", map(operator.sub, trains.stop_arr[1:], trains.stop_dep))
+        for t in range(trains.n_trains):
+            ride_time[train_start[t + 1] - 1] = -1
+        graph.ride_time = ride_time
+        graph._index_arrays()
+        graph._reverse = None
+        return graph
+
+    def stops_reverse(self):
+        """Station-level CSR of the edges *into* each station.
+
+        Returns ``(rev_start, rev_from, rev_edge)``: the in-edges of station
+        ``b`` come from ``rev_from[rev_start[b]:rev_start[b + 1]]`` with the
+        departing stop ids in ``rev_edge``.
+        """
+        if self._reverse is None:
+            n = self.trains.n_stations
+            counts = [0] * (n + 1)
+            for b in self.stops_to:
+                counts[b + 1] += 1
+            for i in range(n):
+                counts[i + 1] += counts[i]
+            fill = counts[:-1]
+            rev_from = array("i", bytes(4 * len(self.stops_to)))
+            rev_edge = array("i", bytes(4 * len(self.stops_to)))
+            for a in range(n):
+                for j in range(self.stops_start[a], self.stops_start[a + 1]):
+                    b = self.stops_to[j]
+                    rev_from[fill[b]] = a
+                    rev_edge[fill[b]] = self.stops_edge[j]
+                    fill[b] += 1
+            self._reverse = (array("i", counts), rev_from, rev_edge)
+        return self._reverse
+
+    def stops_edges(self, node: int):
+        if node < 0:
+            return ()
+        a = self.stops_start[node]
+        b = self.stops_start[node + 1]
+        return zip(self.stops_to[a:b], repeat(1), self.stops_edge[a:b])
+
+    def stops_reverse_edges(self, node: int):
+        if node < 0:
+            return ()
+        rev_start, rev_from, rev_edge = self.stops_reverse()
+        a = rev_start[node]
+        b = rev_start[node + 1]
+        return zip(rev_from[a:b], repeat(1), rev_edge[a:b])
+
+    def _transfers(self, stop: int, targets):
+        """Zero-cost edges from ``stop`` to every other stop at its station."""
+        station = self.trains.stop_station[stop]
+        a = self.station_index.start[station]
+        b = self.station_index.start[station + 1]
+        p = self.index_pos[stop]
+        return chain(
+            zip(targets[a:p], repeat(0), repeat(None)),
+            zip(targets[p + 1:b], repeat(0), repeat(None)),
+        )
+
+    def timeintrain_expander(self):
+        """Edge function for one timeintrain search."""
+        stop_station = self.trains.stop_station
+        ride_time = self.ride_time
+        index_stops = self.station_index.stops
+        expanded = bytearray(self.trains.n_stations)
+
+        def edges(node: int):
+            # continue on train
+            dt = ride_time[node]
+            ride = ((node + 1, dt, node),) if dt >= 0 else ()
+            station = stop_station[node]
+            if expanded[station]:
+                return ride
+            expanded[station] = 1
+            return chain(ride, self._transfers(node, index_stops))
+
+        return edges
+
+    def timeintrain_reverse_expander(self):
+        """Reverse edge function for the backward half of a timeintrain search."""
+        stop_station = self.trains.stop_station
+        ride_time = self.ride_time
+        index_stops = self.station_index.stops
+        expanded = bytearray(self.trains.n_stations)
+
+        def edges(node: int):
+            # the previous stop of the same train, if any
+            dt = ride_time[node - 1] if node > 0 else -1
+            ride = ((node - 1, dt, node - 1),) if dt >= 0 else ()
+            station = stop_station[node]
+            if expanded[station]:
+                return ride
+            expanded[station] = 1
+            return chain(ride, self._transfers(node, index_stops))
+
+        return edges
+
+    def price_expander(self):
+        """Edge function for one price search."""
+        stop_station = self.trains.stop_station
+        ride_time = self.ride_time
+        index_price = self.index_price
+        # stop whose transfer fan-out was expanded, per station
+        first = array("i", [-1]) * self.trains.n_stations
+
+        def edges(state: int):
+            stop, used = divmod(state, PRICE_LEVELS)
+            # continue on same train
+            ride = ()
+            if ride_time[stop] >= 0:
+                # each additional segment on the same train costs 1 until we reach
+                # 10 segments; beyond that it's free (already paid train ticket).
+                if used < 10:
+                    ride = (((stop + 1) * PRICE_LEVELS + used + 1, 1, stop),)
+                else:
+                    ride = (((stop + 1) * PRICE_LEVELS + 10, 0, stop),)
+
+            # transfer to another train at same station, price does not change yet,
+            # we will start counting segments on the new train from zero.
+            station = stop_station[stop]
+            f = first[station]
+            if f < 0:
+                first[station] = stop
+                return chain(ride, self._transfers(stop, index_price))
+            if f != stop:
+                # the one target the first fan-out skipped: that stop itself
+                return chain(ride, ((f * PRICE_LEVELS, 0, None),))
+            return ride
+
+        return edges
+
+
+def build_graph_stops(graph: ScheduleGraph, from_station: str, to_station: str):
     """Graph for `stops` cost function.
 
-    Nodes are *stations* (station codes). Each train segment between two
+    Nodes are *stations* (station ids). Each train segment between two
     consecutive stops adds an edge from station A to station B with cost 1
     (entering a new station). This directly matches the definition in the
     assignment: number of stations entered by train, excluding the origin.
-    """
 
-    # Build adjacency list: station -> list of (next_station, edge_cost, edge_data)
-    adj: Dict[str, List[Tuple[str, float, Dict[str, Any]]]] = {}
-
-    for train_no, stops in trains.items():
-        for i in range(len(stops) - 1):
-            cur = stops[i]
-            nxt = stops[i + 1]
-            a = cur["station"]
-            b = nxt["station"]
-            if a not in adj:
-                adj[a] = []
-            adj[a].append(
-                (
-                    b,
-                    1.0,
-                    {
-                        "train": train_no,
-                        "from_islno": cur["islno"],
-                        "to_islno": nxt["islno"],
-                    },
-                )
-            )
-
-    def graph(node: str):
-        return adj.get(node, [])
-
-    start_node = from_station
-    goal_node = to_station
-    return graph, start_node, goal_node
-
-
-def build_graph_timeintrain(trains: Dict[str, List[Dict[str, Any]]], station_index: Dict[str, List[Tuple[str, int]]],
-                            from_station: str, to_station: str):
-    """Graph where nodes are (train, idx) and cost is time in train in seconds."""
-
-    def graph(node):
-        train_no, idx = node
-        stops = trains[train_no]
-        cur = stops[idx]
-        res = []
-        # continue on train
-        if idx + 1 < len(stops):
-            nxt = stops[idx + 1]
-            dt = (nxt["arr"] - cur["dep"]).total_seconds()
-            res.append(((train_no, idx + 1), float(dt), {
-                "train": train_no,
-                "from_islno": cur["islno"],
-                "to_islno": nxt["islno"],
-            }))
-        # transfers at station without cost in this metric
-        station = cur["station"]
-        for t2, i2 in station_index[station]:
-            if t2 == train_no and i2 == idx:
-                continue
-            res.append(((t2, i2), 0.0, None))
-        return res
+    A station missing from the schedule is a node without edges, reached only
+    when it is the origin as well: ``-1`` as origin, ``-2`` as another goal.
+    """
+    station_ids = graph.trains.station_ids
+    start_node = station_ids.get(from_station, -1)
+    goal_node = station_ids.get(to_station, -1 if to_station == from_station else -2)
+    return graph.stops_edges, start_node, goal_node
 
-    start_nodes = [(t, i) for (t, i) in station_index[from_station]]
-    goal_nodes: Set[Tuple[str, int]] = set()
-    for t, i in station_index[to_station]:
-        goal_nodes.add((t, i))
 
-    return graph, start_nodes, goal_nodes
+def build_graph_timeintrain(graph: ScheduleGraph, from_station: str, to_station: str):
+    """Graph where nodes are stop ids and cost is time in train in seconds."""
+    station_ids = graph.trains.station_ids
+    start_nodes = list(graph.station_index[station_ids.get(from_station, -1)])
+    goal_nodes: Set[int] = set(graph.station_index[station_ids.get(to_station, -1)])
+    return graph.timeintrain_expander(), start_nodes, goal_nodes
 
 
-def build_graph_price(
-    trains: Dict[str, List[Dict[str, Any]]],
-    station_index: Dict[str, List[Tuple[str, int]]],
-    from_station: str,
-    to_station: str,
-):
+def build_graph_price(graph: ScheduleGraph, from_station: str, to_station: str):
     """Graph for `price` cost function.
 
     State keeps track of how many segments have been used on the *current* train,
@@ -93,62 +301,17 @@ def build_graph_price(
     an arbitrary number of segments on that train, while a stop ticket costs 1
     per segment.
 
-    State: (train_no, idx, used_segments) where used_segments in [0, 10].
-    Edge weights are price increments.
+    State: ``stop * PRICE_LEVELS + used_segments`` where used_segments in [0, 10].
+    Edge weights are price increments. Any used count is acceptable at the
+    destination, so the goal is returned as a set of stop ids.
     """
-
-    day = 24 * 3600
-
-    def graph(state):
-        train_no, idx, used = state
-        stops = trains[train_no]
-        cur = stops[idx]
-        res: List[Tuple[Tuple[str, int, int], float, Dict[str, Any] | None]] = []
-
-        # continue on same train
-        if idx + 1 < len(stops):
-            nxt = stops[idx + 1]
-            # each additional segment on the same train costs 1 until we reach
-            # 10 segments; beyond that it's free (already paid train ticket).
-            new_used = used + 1
-            if new_used > 10:
-                new_used = 10
-            # if we haven't reached 10 yet, this segment costs 1; otherwise 0
-            seg_cost = 1.0 if used < 10 else 0.0
-            res.append(
-                (
-                    (train_no, idx + 1, new_used),
-                    seg_cost,
-                    {
-                        "train": train_no,
-                        "from_islno": cur["islno"],
-                        "to_islno": nxt["islno"],
-                    },
-                )
-            )
-
-        # transfer to another train at same station, price does not change yet,
-        # we will start counting segments on the new train from zero.
-        station = cur["station"]
-        for t2, i2 in station_index[station]:
-            if t2 == train_no and i2 == idx:
-                continue
-            res.append(((t2, i2, 0), 0.0, None))
-
-        return res
-
+    station_ids = graph.trains.station_ids
     # starting states: from_station on any train, with 0 segments used so far
-    start_states: List[Tuple[str, int, int]] = []
-    for t, i in station_index[from_station]:
-        start_states.append((t, i, 0))
-
-    goal_states: Set[Tuple[str, int, int]] = set()
-    for t, i in station_index[to_station]:
-        # any used count is acceptable at destination
-        for used in range(0, 11):
-            goal_states.add((t, i, used))
-
-    return graph, start_states, goal_states
+    start_states: List[int] = [
+        s * PRICE_LEVELS for s in graph.station_index[station_ids.get(from_station, -1)]
+    ]
+    goal_stops: Set[int] = set(graph.station_index[station_ids.get(to_station, -1)])
+    return graph.price_expander(), start_states, goal_stops
 
 
 ## arrivaltime graph is now implemented via a specialised Dijkstra
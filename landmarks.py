@@ -0,0 +1,133 @@
+"""ALT lower bounds (A*, landmarks, triangle inequality) for station graphs.
+
+For a landmark ``L`` the triangle inequality gives, for every station ``v``
+and target ``t``::
+
+    d(v, t) >= d(L, t) - d(L, v)        d(v, t) >= d(v, L) - d(t, L)
+
+so distances from and to a handful of well-spread landmarks bound the
+remaining cost of a search from below. The bounds are consistent, which
+keeps A* settling every node at most once.
+
+Distances are computed on the station-level graph of ``ScheduleGraph``
+(``stops`` / ``stops_reverse``). For ``timeintrain`` an edge weighs the
+ride time of its segment; a stop-level search only adds free transfers
+between stops of one station, so the station bounds hold for its nodes too.
+"""
+
+import heapq
+import math
+from array import array
+from typing import Callable, Dict, List
+
+from graph_builder import ScheduleGraph
+
+# default number of landmarks per schedule and metric
+N_LANDMARKS = 8
+
+
+def _distances(start, to, edge, weight: Callable[[int], int], source: int, n: int) -> array:
+    """Shortest distances from ``source`` over one CSR direction (inf: unreachable)."""
+    dist = array("d", [math.inf]) * n
+    dist[source] = 0.0
+    pq = [(0.0, source)]
+    while pq:
+        cost, node = heapq.heappop(pq)
+        if cost != dist[node]:
+            continue
+        for j in range(start[node], start[node + 1]):
+            nxt = to[j]
+            new_cost = cost + weight(edge[j])
+            if new_cost < dist[nxt]:
+                dist[nxt] = new_cost
+                heapq.heappush(pq, (new_cost, nxt))
+    return dist
+
+
+class Landmarks:
+    """Landmark distances of one schedule under one metric.
+
+    ``metric`` is ``"stops"`` (every segment costs 1) or ``"timeintrain"``
+    (segments cost their ride time). Landmarks are picked farthest-first:
+    each new one is the station whose distance from the nearest landmark
+    chosen so far is largest, starting far from the busiest station.
+    """
+
+    __slots__ = ("stations", "dist_from", "dist_to")
+
+    def __init__(self, graph: ScheduleGraph, metric: str, count: int = N_LANDMARKS):
+        if metric == "stops":
+            def weight(_stop: int) -> int:
+                return 1
+        elif metric == "timeintrain":
+            weight = graph.ride_time.__getitem__
+        else:
+            raise ValueError(f"No landmark bounds for {metric}")
+
+        n = graph.trains.n_stations
+        rev_start, rev_from, rev_edge = graph.stops_reverse()
+        self.stations: List[int] = []
+        self.dist_from: List[array] = []
+        self.dist_to: List[array] = []
+        if n == 0:
+            return
+
+        degree = [graph.stops_start[v + 1] - graph.stops_start[v] for v in range(n)]
+        hub = max(range(n), key=degree.__getitem__)
+        # distance to the nearest landmark; -1 marks stations some landmark cannot reach
+        nearest = _distances(graph.stops_start, graph.stops_to, graph.stops_edge, weight, hub, n)
+        nearest = [d if d != math.inf else -1.0 for d in nearest]
+
+        for _ in range(min(count, n)):
+            landmark = max(range(n), key=nearest.__getitem__)
+            if nearest[landmark] <= 0 and self.stations:
+                break  # every reachable station is a landmark already
+            dist_from = _distances(graph.stops_start, graph.stops_to, graph.stops_edge, weight, landmark, n)
+            self.stations.append(landmark)
+            self.dist_from.append(dist_from)
+            self.dist_to.append(_distances(rev_start, rev_from, rev_edge, weight, landmark, n))
+            for v in range(n):
+                d = dist_from[v]
+                if d == math.inf:
+                    nearest[v] = -1.0
+                elif d < nearest[v]:
+                    nearest[v] = d
+
+    def bound(self, target: int) -> Callable[[int], float]:
+        """Lower bound on the distance from a station to ``target``.
+
+        Returns ``inf`` for stations that provably cannot reach the target.
+        Bounds are memoised per returned function, i.e. per search.
+        """
+        if target < 0:
+            return lambda _station: 0.0
+        terms = [
+            (dist_from, dist_from[target], dist_to, dist_to[target])
+            for dist_from, dist_to in zip(self.dist_from, self.dist_to)
+        ]
+        memo: Dict[int, float] = {}
+
+        def h(station: int) -> float:
+            b = memo.get(station)
+            if b is not None:
+                return b
+            b = 0.0
+            for dist_from, from_t, dist_to, to_t in terms:
+                from_v = dist_from[station]
+                if from_t != math.inf:
+                    # d(L, t) <= d(L, v) + d(v, t)
+                    if from_t - from_v > b:
+                        b = from_t - from_v
+                elif from_v != math.inf:
+                    b = math.inf  # L reaches v but not t, so v cannot reach t
+                    break
+                if to_t != math.inf:
+                    # d(v, L) <= d(v, t) + d(t, L)
+                    if dist_to[station] - to_t > b:
+                        b = dist_to[station] - to_t
+                        if b == math.inf:
+                            break
+            memo[station] = b
+            return b
+
+        return h
@@ -1,14 +1,131 @@
 import argparse
+import sys
 
-from solver import solve_problems
+from solver import ENGINES, load_schedule_data, solve_problems
+from result_cache import CACHE_SIZE, EVICTION_POLICIES, ResultCache
+from schedule_manager import PREFETCH, ScheduleManager
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mode", choices=["examples", "assignment"], required=True)
+    parser.add_argument("--mode", choices=["examples", "assignment", "compile", "serve", "delta", "coordinator", "worker"],
+                        required=True)
     parser.add_argument("--force-schedule", default=None)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="solve problems on this many processes (--mode serve: requests solved at once, "
+                             "the default 1 solves them one after another; --mode coordinator: local worker "
+                             "processes besides those connecting)")
+    parser.add_argument("--engine", action="append", default=[], metavar="COSTFUNCTION=ENGINE",
+                        help="search engine for a cost function, e.g. arrivaltime=csa (repeatable)")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the rows of an existing output file and solve only the missing problems")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE,
+                        help="results kept in memory for repeated problems (0: no cache)")
+    parser.add_argument("--cache-eviction", choices=EVICTION_POLICIES, default="lru")
+    parser.add_argument("--cache-file", default=None,
+                        help="also keep results in this SQLite file across runs")
+    parser.add_argument("--schedule-memory", type=float, default=None, metavar="MB",
+                        help="evict least recently used schedules beyond this much memory, reporting loads and "
+                             "evictions on stderr (default: keep all)")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH,
+                        help="schedules loaded ahead of use on a background thread (0: none)")
+    parser.add_argument("--stats", choices=["csv", "json"], default=None,
+                        help="write per-problem search counters and phase timings next to the output "
+                             "(solves problems one by one)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (--mode serve, coordinator) or of the coordinator (--mode worker)")
+    parser.add_argument("--port", type=int, default=None,
+                        help="port to listen on or connect to (default: 8000 for serve, 8100 for coordinator/worker)")
+    parser.add_argument("--socket", default=None, help="listen on this Unix socket instead (--mode serve)")
+    parser.add_argument("--problems", default="problems.csv", help="problem file (--mode coordinator)")
+    parser.add_argument("--output", default=None,
+                        help="solution file (--mode coordinator, default solutions.csv) or file to write the "
+                             "amended schedule to (--mode delta, default: none, only report the changes)")
+    parser.add_argument("--shard-size", type=int, default=None,
+                        help="problems per shard handed to a worker (--mode coordinator)")
+    parser.add_argument("--delta", default=None,
+                        help="trains to add, replace or remove (--mode delta, see timetable_delta.py)")
+    parser.add_argument("schedules", nargs="*",
+                        help="schedule csv files to precompile (--mode compile), preload (--mode serve) "
+                             "or amend with --delta (--mode delta)")
     args = parser.parse_args()
 
+    if args.mode == "compile":
+        from schedule_cache import compile_schedule, cache_path_for
+        from graph_builder import ScheduleGraph
+        from contraction import compile_hierarchy, ch_path_for
+
+        if not args.schedules:
+            parser.error("--mode compile needs at least one schedule file")
+        for schedule_file in args.schedules:
+            trains, station_index = compile_schedule(schedule_file)
+            print(f"{schedule_file}: {trains.n_trains} trains, {trains.n_stops} stops "
+                  f"-> {cache_path_for(schedule_file)}")
+            ch = compile_hierarchy(schedule_file, ScheduleGraph(trains, station_index))
+            print(f"{schedule_file}: {len(ch.edge_tail)} hierarchy edges -> {ch_path_for(schedule_file)}")
+        return
+
+    engines = {}
+    for spec in args.engine:
+        cost_function, _, engine = spec.partition("=")
+        if engine not in ENGINES.get(cost_function, ()):
+            parser.error(f"--engine {spec}: choose one of "
+                         + ", ".join(f"{cf}={e}" for cf, es in ENGINES.items() for e in es))
+        engines[cost_function] = engine
+
+    budget = None if args.schedule_memory is None else int(args.schedule_memory * 2 ** 20)
+    if args.mode in ("coordinator", "worker"):
+        import asyncio
+        import cluster
+
+        port = cluster.PORT if args.port is None else args.port
+        if args.mode == "worker":
+            solved = cluster.run_worker(args.host, port, budget)
+            print(f"{solved} shards solved", file=sys.stderr)
+            return
+        coordinator = asyncio.run(cluster.coordinate(
+            args.problems, args.output or "solutions.csv", args.host, port, local_workers=args.workers,
+            force_schedule=args.force_schedule, engines=engines,
+            shard_size=args.shard_size or cluster.SHARD_SIZE, schedule_memory=budget,
+            log=lambda line: print(f"coordinator: {line}", file=sys.stderr)))
+        print(coordinator.summary(), file=sys.stderr)
+        return
+
+    cache = None
+    if args.cache_size > 0 or args.cache_file:
+        cache = ResultCache(max(args.cache_size, 0), args.cache_eviction, args.cache_file)
+
+    if args.mode == "delta":
+        from solver import apply_schedule_delta
+
+        if not args.delta or len(args.schedules) != 1:
+            parser.error("--mode delta needs --delta and one schedule file")
+        if args.cache_file and not args.output:
+            parser.error("--mode delta with --cache-file needs --output")
+        try:
+            update, (kept, dropped) = apply_schedule_delta({}, args.schedules[0], args.delta,
+                                                           cache if args.cache_file else None, args.output)
+        finally:
+            if cache is not None:
+                cache.close()
+        print(f"{args.output or args.schedules[0]}: {update.summary()}; {update.trains.n_trains} trains, "
+              f"{update.trains.n_stops} stops")
+        if args.cache_file:
+            print(f"{args.cache_file}: {kept} cached results kept, {dropped} dropped")
+        return
+
+    if args.mode == "serve":
+        import asyncio
+        from server import serve
+
+        try:
+            asyncio.run(serve(
+                args.host, 8000 if args.port is None else args.port, args.socket, workers=args.workers,
+                engines=engines, schedules=args.schedules, force_schedule=args.force_schedule, cache=cache))
+        except KeyboardInterrupt:
+            pass
+        return
+
     if args.mode == "examples":
         problem_file = "example-problems.csv"
         output_file = "example-solutions.csv"
@@ -16,7 +133,22 @@ def main():
         problem_file = "problems.csv"
         output_file = "solutions.csv"
 
-    solve_problems(problem_file, output_file, force_schedule=args.force_schedule)
+    stats_file = None
+    if args.stats is not None:
+        stats_file = f"{output_file}.stats.{'csv' if args.stats == 'csv' else 'jsonl'}"
+
+    # loads and evictions are only worth reporting under a memory budget
+    schedules = ScheduleManager(load_schedule_data, budget, args.prefetch,
+                                log=None if budget is None else lambda line: print(f"schedules: {line}",
+                                                                                   file=sys.stderr))
+    try:
+        solve_problems(problem_file, output_file, force_schedule=args.force_schedule, workers=args.workers,
+                       engines=engines, resume=args.resume, cache=cache, stats_file=stats_file,
+                       schedules=schedules)
+    finally:
+        schedules.close()
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+"""RAPTOR (round-based public transit routing) for `arrivaltime` queries.
+
+Round ``r`` computes, for every station, the earliest arrival using at most
+``r`` trains (``r - 1`` changes). Each round scans every train passing a
+station that improved in the previous round, from the first such stop to
+the end of the train, hopping on the earliest instance of the train that
+can be caught there. Trains run daily, so the instances of one train never
+overtake each other and every train can serve as its own route.
+
+Times follow the same model as ``csa.py``: day ``k >= 0`` of a train runs
+all its stops ``k * DAY`` later, changing trains needs ``ChangeTime``
+(boarding at the origin only needs the start time), and arrival labels are
+per station.
+
+The labels of all rounds are kept, so one run yields the whole Pareto front
+of arrival time against number of changes at every station.
+"""
+
+import math
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+from schedule_utils import DAY, Timetable, StationIndex
+
+
+class RaptorResult:
+    """Labels of a RAPTOR run.
+
+    ``labels[r][st]`` is the earliest arrival at station ``st`` with at most
+    ``r`` trains; ``legs[r][st]`` is the ride that set it in round ``r``, as
+    ``(board_stop, alight_stop)``.
+    """
+
+    def __init__(self, trains: Timetable, origin: int, start_time: int, labels: List[List[float]],
+                 legs: List[Dict[int, Tuple[int, int]]]):
+        self.trains = trains
+        self.origin = origin
+        self.start_time = start_time
+        self.labels = labels
+        self.legs = legs
+
+    def _arrival_round(self, station: int, before: int) -> int:
+        """Latest round < ``before`` whose ride set the station's label then."""
+        r = before - 1
+        while r > 0 and station not in self.legs[r]:
+            r -= 1
+        return r
+
+    def journey(self, rnd: int, station: int) -> List[Tuple[int, int, int]]:
+        """Rides ``(round, board_stop, alight_stop)`` of the round-``rnd`` label."""
+        rides = []
+        r = self._arrival_round(station, rnd + 1)
+        while r > 0:
+            board, alight = self.legs[r][station]
+            rides.append((r, board, alight))
+            station = self.trains.stop_station[board]
+            # boarding at the origin always starts from the start time
+            r = 0 if station == self.origin else self._arrival_round(station, r)
+        rides.reverse()
+        return rides
+
+    def pareto(self, station: int) -> List[Tuple[int, int, List[Tuple[int, int, int]]]]:
+        """Pareto front ``(changes, arrival, rides)`` at ``station``, fewest changes first."""
+        front = []
+        best = math.inf
+        for r in range(1, len(self.labels)):
+            arr = self.labels[r][station]
+            if arr < best:
+                best = arr
+                front.append((r - 1, arr, self.journey(r, station)))
+        return front
+
+
+def raptor(
+    trains: Timetable,
+    station_index: StationIndex,
+    from_station: str,
+    start_time: int,
+    change_time_seconds: int,
+    target: int = -1,
+    max_rounds: int | None = None,
+) -> RaptorResult:
+    """Run RAPTOR rounds from ``from_station`` until nothing improves.
+
+    With a ``target`` station id, arrivals no earlier than the best arrival
+    at the target are pruned. ``max_rounds`` limits the number of trains.
+    """
+    n_stations = trains.n_stations
+    origin = trains.station_ids.get(from_station, -1)
+    # the origin gets no label of its own: like the other engines, a query
+    # to the origin itself asks for the earliest return there
+    labels: List[List[float]] = [[math.inf] * n_stations]
+    legs: List[Dict[int, Tuple[int, int]]] = [{}]
+    if origin < 0:
+        return RaptorResult(trains, origin, start_time, labels, legs)
+
+    stop_station = trains.stop_station
+    stop_train = trains.stop_train
+    stop_arr = trains.stop_arr
+    stop_dep = trains.stop_dep
+    train_start = trains.train_start
+    idx_start = station_index.start
+    idx_stops = station_index.stops
+
+    best = [math.inf] * n_stations
+    # earliest time a train can be boarded, set for marked stations only
+    ready = [math.inf] * n_stations
+    marked = [origin]
+
+    r = 0
+    while marked and (max_rounds is None or r < max_rounds):
+        r += 1
+        prev_labels = labels[-1]
+        cur = list(prev_labels)
+        cur_legs: Dict[int, Tuple[int, int]] = {}
+
+        for st in marked:
+            ready[st] = start_time if st == origin else prev_labels[st] + change_time_seconds
+
+        # first stop of each train at a marked station
+        first: Dict[int, int] = {}
+        for st in marked:
+            for j in range(idx_start[st], idx_start[st + 1]):
+                s = idx_stops[j]
+                t = stop_train[s]
+                if s < first.get(t, math.inf):
+                    first[t] = s
+
+        new_marked = set()
+        for t, s0 in first.items():
+            end = train_start[t + 1]
+            k = -1  # day of the train instance on board, -1: none yet
+            offset = 0
+            board = -1
+            for s in range(s0, end):
+                station = stop_station[s]
+                if k >= 0:
+                    arr = stop_arr[s] + offset
+                    if arr < best[station] and (target < 0 or arr < best[target]):
+                        cur[station] = arr
+                        best[station] = arr
+                        cur_legs[station] = (board, s)
+                        new_marked.add(station)
+
+                rdy = ready[station]
+                if rdy != math.inf and s + 1 < end:
+                    # earliest instance catchable here
+                    wait = rdy - stop_dep[s]
+                    k2 = 0 if wait <= 0 else -(-wait // DAY)
+                    if k < 0 or k2 < k:
+                        k = k2
+                        offset = k * DAY
+                        board = s
+
+        for st in marked:
+            ready[st] = math.inf
+        labels.append(cur)
+        legs.append(cur_legs)
+        marked = list(new_marked)
+
+    return RaptorResult(trains, origin, start_time, labels, legs)
+
+
+def _rides_prev(rides: List[Tuple[int, int, int]], prev: Dict[Hashable, Tuple[Hashable | None, Any]]):
+    """Add the nodes of ``rides`` to ``prev``; returns the final node.
+
+    Nodes are ``(round, stop)``: within one round each train is scanned
+    once, so the state at a stop is unique and nodes never conflict.
+    """
+    parent = None
+    for r, board, alight in rides:
+        for s in range(board, alight):
+            prev[(r, s + 1)] = (parent, s)
+            parent = (r, s + 1)
+    return parent
+
+
+def raptor_arrivaltime(
+    trains: Timetable,
+    station_index: StationIndex,
+    from_station: str,
+    to_stations: Iterable[str] | None,
+    start_time: int,
+    change_time_seconds: int,
+) -> Tuple[Dict[Hashable, Tuple[Hashable | None, Any]], Dict[Hashable, int], Dict[int, Hashable]]:
+    """Earliest arrival, with the interface of ``csa.csa_arrivaltime``.
+
+    Among equally early journeys the one with the fewest changes is taken.
+    """
+    station_ids = trains.station_ids
+    if to_stations is None:
+        targets = None
+    else:
+        targets = [station_ids[s] for s in to_stations if s in station_ids]
+    single = targets[0] if targets is not None and len(targets) == 1 else -1
+    result = raptor(trains, station_index, from_station, start_time, change_time_seconds, target=single)
+
+    prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
+    dist: Dict[Hashable, int] = {}
+    goals: Dict[int, Hashable] = {}
+    final = result.labels[-1]
+    for st in (range(trains.n_stations) if targets is None else targets):
+        if final[st] == math.inf:
+            continue
+        # the first round reaching the final label has the fewest changes
+        rnd = next(r for r in range(1, len(result.labels)) if result.labels[r][st] == final[st])
+        goal = _rides_prev(result.journey(rnd, st), prev)
+        if goal is not None:
+            goals[st] = goal
+            dist[goal] = int(final[st]) - start_time
+    return prev, dist, goals
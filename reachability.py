@@ -0,0 +1,105 @@
+"""Which stations can be reached from which, for answering "no connection" at once.
+
+Every train runs daily and waiting is unbounded, so under every cost
+function a station ``b`` is reachable from ``a`` exactly when the
+station-level graph of ``ScheduleGraph`` (an edge per ride segment) has a
+path from ``a`` to ``b``. Searches only find out that it has none after
+exhausting everything reachable, which for ``price`` is up to eleven
+states per stop.
+
+The strongly connected components of that graph (Tarjan's algorithm) are
+numbered in the order they complete, successors first, so the condensation
+DAG is topologically sorted backwards. Each component keeps, as one int
+used as a bit set, the components reachable from it by at least one
+segment; its own bit is set only if it contains a cycle. A query is then
+two array lookups and a bit test.
+"""
+
+from array import array
+from typing import List
+
+from graph_builder import ScheduleGraph
+
+
+class Reachability:
+    """Station reachability of one schedule, see the module docstring.
+
+    ``component[v]`` is the component of station ``v`` and ``reach[c]``
+    the bit set of components reachable from component ``c``.
+    """
+
+    __slots__ = ("component", "reach")
+
+    def __init__(self, graph: ScheduleGraph):
+        start = graph.stops_start
+        to = graph.stops_to
+        n = graph.trains.n_stations
+        component = array("i", [-1]) * n
+        reach: List[int] = []
+
+        # iterative Tarjan: ``index`` is the visiting order, ``low`` the
+        # lowest index reachable through the DFS subtree and back edges
+        index = array("i", [-1]) * n
+        low = array("i", [0]) * n
+        on_stack = bytearray(n)
+        stack: List[int] = []
+        counter = 0
+        for root in range(n):
+            if index[root] >= 0:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # (station, position of its next out-edge)
+            dfs = [(root, start[root])]
+            while dfs:
+                v, j = dfs[-1]
+                if j < start[v + 1]:
+                    dfs[-1] = (v, j + 1)
+                    w = to[j]
+                    if index[w] < 0:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = 1
+                        dfs.append((w, start[w]))
+                    elif on_stack[w] and index[w] < low[v]:
+                        low[v] = index[w]
+                    continue
+                dfs.pop()
+                if dfs and low[v] < low[dfs[-1][0]]:
+                    low[dfs[-1][0]] = low[v]
+                if low[v] != index[v]:
+                    continue
+
+                # v roots a component: pop it, all its successors are done
+                c = len(reach)
+                members = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = 0
+                    component[w] = c
+                    members.append(w)
+                    if w == v:
+                        break
+                bits = 0
+                for w in members:
+                    for k in range(start[w], start[w + 1]):
+                        d = component[to[k]]
+                        bits |= (1 << d) | (reach[d] if d != c else 0)
+                reach.append(bits)
+
+        self.component = component
+        self.reach = reach
+
+    @property
+    def n_components(self) -> int:
+        return len(self.reach)
+
+    def reaches(self, a: int, b: int) -> bool:
+        """Whether some train journey leads from station ``a`` to station ``b``.
+
+        For ``a == b`` that is a round trip, through at least one other station.
+        """
+        return bool(self.reach[self.component[a]] >> self.component[b] & 1)
@@ -0,0 +1,238 @@
+"""Bounded cache of solved problems.
+
+Problems are keyed on their normalised tuple::
+
+    (schedule path, schedule size, schedule mtime, cost function, engine,
+     from station, to station, change time)
+
+The change time only counts for the ``arrival*`` cost functions, the only
+ones it affects. Size and mtime of the schedule CSV are part of the key, so
+editing a schedule invalidates everything cached for it. Engines of one
+cost function may disagree (``csa`` vs ``dijkstra`` for ``arrivaltime``),
+so each caches its own results.
+
+The memory tier holds ``maxsize`` results and evicts either the least
+recently used (``"lru"``) or the oldest inserted (``"fifo"``) one. An
+optional on-disk tier (an SQLite file) keeps results across runs; memory
+misses fall back to it, and it is cut back to ``disk_maxsize`` rows, oldest
+first, when the cache is closed.
+"""
+
+import json
+import os
+import sqlite3
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+# default number of results kept in memory
+CACHE_SIZE = 4096
+# default number of results kept on disk
+DISK_CACHE_SIZE = 1_000_000
+
+EVICTION_POLICIES = ("lru", "fifo")
+
+# SQLite ``user_version`` of the disk tier; files of another version are emptied
+SCHEMA_VERSION = 3
+
+Result = Tuple[str, Any]
+
+
+def problem_key(problem: Dict[str, Any], engines: Dict[str, str]) -> Tuple[Hashable, ...] | None:
+    """Cache key of ``problem``; None if its schedule cannot be read or its change time is no integer.
+
+    ``engines`` maps every cost function to the engine that solves it.
+    Problems without a key are solved (and fail) as usual, uncached.
+    """
+    schedule_file = problem["Schedule"].strip()
+    try:
+        st = os.stat(schedule_file)
+    except OSError:
+        return None
+    cost_function = " ".join(problem["CostFunction"].split())
+    try:
+        change_time = int(problem["ChangeTime"]) if cost_function.startswith("arrival") else 0
+    except ValueError:
+        return None
+    engine = engines.get(cost_function.partition(" ")[0], "")
+    return (os.path.abspath(schedule_file), st.st_size, st.st_mtime_ns, cost_function, engine,
+            problem["FromStation"].strip(), problem["ToStation"].strip(), change_time)
+
+
+class CacheLookup:
+    """Outcome of :meth:`ResultCache.lookup` for a list of problems.
+
+    ``todo`` are the problems still to solve; pass their results, in that
+    order, to :meth:`complete`, or one by one to :meth:`answer`. ``results``
+    holds the results known so far, in problem order, None for the others.
+    """
+
+    def __init__(self, cache: "ResultCache", problems: List[Dict[str, Any]], engines: Dict[str, str]):
+        self.cache = cache
+        self.keys = [problem_key(p, engines) for p in problems]
+        self.results: List[Result | None] = [None] * len(problems)
+        self._todo: List[int] = []
+        # key -> index of the problem answering all problems with that key
+        self._first: Dict[Tuple[Hashable, ...], int] = {}
+        # that problem's index -> later problems with the same key
+        self._same: Dict[int, List[int]] = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            if key is not None:
+                if key in self._first:
+                    # same question as an earlier problem, answered without solving: a hit
+                    self._same[self._first[key]].append(i)
+                    cache.hits += 1
+                    continue
+                hit = cache.get(key)
+                if hit is not None:
+                    self.results[i] = hit
+                    continue
+                self._first[key] = i
+            self._todo.append(i)
+        self.todo = [problems[i] for i in self._todo]
+
+    def complete(self, solved: List[Result], keep: Callable[[Result], bool] = lambda _result: True
+                 ) -> List[Result]:
+        """All results, in problem order; ``keep`` decides which solved ones are cached."""
+        for n, result in enumerate(solved):
+            self.answer(n, result, keep)
+        return self.results
+
+    def answer(self, n: int, result: Result, keep: Callable[[Result], bool] = lambda _result: True):
+        """Record the result of ``todo[n]``, and of the problems asking the same."""
+        i = self._todo[n]
+        self.results[i] = result
+        for j in self._same.get(i, ()):
+            self.results[j] = result
+        if self.keys[i] is not None and keep(result):
+            self.cache.put(self.keys[i], result)
+
+
+class ResultCache:
+    """Memory tier of ``maxsize`` results plus an optional SQLite tier at ``path``.
+
+    ``hits``, ``disk_hits`` (part of ``hits``) and ``misses`` count lookups;
+    a problem repeating an earlier one of the same lookup counts as a hit.
+    A ``maxsize`` of 0 disables the memory tier.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, eviction: str = "lru", path: str | None = None,
+                 disk_maxsize: int = DISK_CACHE_SIZE):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {eviction}, choose one of {', '.join(EVICTION_POLICIES)}")
+        self.maxsize = maxsize
+        self.eviction = eviction
+        self.disk_maxsize = disk_maxsize
+        self._memory: OrderedDict[Tuple[Hashable, ...], Result] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # keys before version 2 lack the engine, so their results cannot be told apart;
+                # version 2 kept the engine in a column of its own as well
+                self._db.execute("DROP TABLE IF EXISTS results")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, connection TEXT NOT NULL, "
+                             "cost TEXT NOT NULL)")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def lookup(self, problems: List[Dict[str, Any]], engines: Dict[str, str]) -> CacheLookup:
+        """Look ``problems`` up as solved by ``engines`` (every cost function to its engine)."""
+        return CacheLookup(self, problems, engines)
+
+    def get(self, key: Tuple[Hashable, ...]) -> Result | None:
+        result = self._memory.get(key)
+        if result is not None:
+            if self.eviction == "lru":
+                self._memory.move_to_end(key)
+            self.hits += 1
+            return result
+        if self._db is not None:
+            row = self._db.execute("SELECT connection, cost FROM results WHERE key = ?",
+                                   (json.dumps(key),)).fetchone()
+            if row is not None:
+                result = (row[0], json.loads(row[1]))
+                self._remember(key, result)
+                self.hits += 1
+                self.disk_hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, key: Tuple[Hashable, ...], result: Result):
+        self._remember(key, result)
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                             (json.dumps(key), result[0], json.dumps(result[1])))
+
+    def carry_over(self, schedule_file: str, old: os.stat_result, amended_file: str, new: os.stat_result,
+                   keep: Callable[[Tuple[Hashable, ...], Result], bool]) -> Tuple[int, int]:
+        """File the results of ``schedule_file`` (as of ``old``) under ``amended_file`` (as of ``new``).
+
+        For an amended copy of a schedule: results ``keep`` accepts are
+        copied, the others are not. If the copy replaced the schedule
+        (same path), the results of its old version are dropped as well.
+        Returns the number of results kept and dropped.
+        """
+        old_prefix = (os.path.abspath(schedule_file), old.st_size, old.st_mtime_ns)
+        new_prefix = (os.path.abspath(amended_file), new.st_size, new.st_mtime_ns)
+        in_place = old_prefix[0] == new_prefix[0]
+        kept: set = set()
+        dropped: set = set()
+
+        memory: OrderedDict[Tuple[Hashable, ...], Result] = OrderedDict()
+        for key, result in self._memory.items():
+            if key[:3] == old_prefix:
+                if keep(key, result):
+                    kept.add(key)
+                    memory[new_prefix + key[3:]] = result
+                else:
+                    dropped.add(key)
+                if in_place:
+                    continue
+            memory.setdefault(key, result)
+        self._memory = memory
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+        if self._db is not None:
+            # keys are JSON lists, so all keys of one schedule version share a prefix
+            prefix = json.dumps(old_prefix)[:-1] + ", "
+            rows = self._db.execute("SELECT key, connection, cost FROM results WHERE substr(key, 1, ?) = ?",
+                                    (len(prefix), prefix)).fetchall()
+            for raw, connection, cost in rows:
+                key = tuple(json.loads(raw))
+                if keep(key, (connection, json.loads(cost))):
+                    kept.add(key)
+                    self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                                     (json.dumps(new_prefix + key[3:]), connection, cost))
+                else:
+                    dropped.add(key)
+                if in_place:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (raw,))
+            self._db.commit()
+        return len(kept), len(dropped)
+
+    def _remember(self, key: Tuple[Hashable, ...], result: Result):
+        if self.maxsize <= 0:
+            return
+        self._memory[key] = result
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def flush(self):
+        """Commit results written to the disk tier."""
+        if self._db is not None:
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.execute("DELETE FROM results WHERE rowid <= "
+                             "(SELECT MAX(rowid) FROM results) - ?", (self.disk_maxsize,))
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def summary(self) -> str:
+        return f"{self.hits} hits ({self.disk_hits} from disk), {self.misses} misses"
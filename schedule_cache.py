@@ -0,0 +1,253 @@
+"""On-disk compiled timetables.
+
+A compiled timetable (``<schedule>.ttc``) holds the interned strings and all
+integer columns of a :class:`Timetable` plus its :class:`StationIndex`, so a
+run can skip CSV parsing and index building entirely. The integer columns are
+used straight from a read-only memory map.
+
+The file is keyed by the source CSV's size, modification time and SHA-256.
+When size and mtime match, the cache is trusted without reading the CSV; when
+only the mtime differs the hash decides; otherwise the CSV is parsed again and
+the cache rewritten.
+
+The other files derived from a schedule (``.ch``, ``.tb``) are keyed the
+same way, with the helpers below: their headers start with
+``SOURCE_HEADER`` (``pack_header`` / ``unpack_header``), ``is_current``
+decides whether they still match the CSV, and ``write_atomic`` writes them.
+
+Layout (native byte order, all sections 4-byte aligned)::
+
+    header    _HEADER
+    strings   station codes, then train numbers, "\\n"-joined UTF-8
+    columns   _COLUMNS in order, as 32-bit ints
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from typing import Iterable, Tuple
+
+from schedule_utils import Timetable, StationIndex, load_schedule, build_station_index
+
+CACHE_SUFFIX = ".ttc"
+
+# Start of the header of every file derived from a schedule: magic, version,
+# byte order, source size, source mtime_ns, source sha256; counts follow.
+SOURCE_HEADER = "=4sIBxxxQq32s"
+_MTIME_OFFSET = struct.calcsize("=4sIBxxxQ")
+
+BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+
+# (source size, source mtime_ns, source sha256)
+SourceKey = Tuple[int, int, bytes]
+
+_MAGIC = b"TTC1"
+_FORMAT_VERSION = 1
+
+# n_stations, n_trains, n_stops, station blob length, train blob length
+_HEADER = struct.Struct(SOURCE_HEADER + "IIIII")
+
+# (attribute, length) where length is a function of (n_stations, n_trains, n_stops)
+_COLUMNS = (
+    ("train_order", lambda ns, nt, nst: nt),
+    ("train_start", lambda ns, nt, nst: nt + 1),
+    ("stop_train", lambda ns, nt, nst: nst),
+    ("stop_station", lambda ns, nt, nst: nst),
+    ("stop_islno", lambda ns, nt, nst: nst),
+    ("stop_arr", lambda ns, nt, nst: nst),
+    ("stop_dep", lambda ns, nt, nst: nst),
+    ("index_start", lambda ns, nt, nst: ns + 1),
+    ("index_stops", lambda ns, nt, nst: nst),
+)
+
+_TIMETABLE_COLUMNS = [name for name, _ in _COLUMNS if not name.startswith("index_")]
+
+
+def cache_path_for(schedule_file: str) -> str:
+    return schedule_file + CACHE_SUFFIX
+
+
+def file_hash(path: str) -> bytes:
+    """SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def source_key(schedule_file: str) -> SourceKey:
+    """The key files derived from ``schedule_file`` are stored with."""
+    st = os.stat(schedule_file)
+    return st.st_size, st.st_mtime_ns, file_hash(schedule_file)
+
+
+def pack_header(header: struct.Struct, magic: bytes, version: int, key: SourceKey, *counts: int) -> bytes:
+    """Header of a derived file; ``header`` is ``SOURCE_HEADER`` plus the formats of ``counts``."""
+    return header.pack(magic, version, BYTE_ORDER, *key, *counts)
+
+
+def unpack_header(header: struct.Struct, data, magic: bytes, version: int) -> Tuple[SourceKey, tuple] | None:
+    """(source key, counts) of a derived file's ``data``; None unless it has this magic, version and byte order."""
+    if len(data) < header.size:
+        return None
+    file_magic, file_version, byte_order, size, mtime_ns, digest, *counts = header.unpack_from(data, 0)
+    if file_magic != magic or file_version != version or byte_order != BYTE_ORDER:
+        return None
+    return (size, mtime_ns, digest), tuple(counts)
+
+
+def is_current(derived_file: str, schedule_file: str, st: os.stat_result, key: SourceKey) -> bool:
+    """Whether ``derived_file``, stored with ``key``, matches ``schedule_file`` (as of ``st``).
+
+    Size and mtime must match, or else size and SHA-256. In the latter case
+    the schedule was only touched, and the new mtime is written to the file.
+    """
+    size, mtime_ns, digest = key
+    if size != st.st_size:
+        return False
+    if mtime_ns == st.st_mtime_ns:
+        return True
+    if digest != file_hash(schedule_file):
+        return False
+    try:
+        with open(derived_file, "r+b") as f:
+            f.seek(_MTIME_OFFSET)
+            f.write(struct.pack("=q", st.st_mtime_ns))
+    except OSError:
+        pass
+    return True
+
+
+def write_atomic(path: str, chunks: Iterable[bytes]):
+    """Write ``chunks`` to ``path`` through a temporary file and a rename.
+
+    Readers holding a map of the previous version are unaffected and never
+    see a half-written file.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.writelines(chunks)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _pad(n: int) -> int:
+    return (-n) % 4
+
+
+def _parse(schedule_file: str):
+    key = source_key(schedule_file)
+    trains = load_schedule(schedule_file)
+    return key, trains, build_station_index(trains)
+
+
+def compile_schedule(schedule_file: str, cache_file: str | None = None) -> Tuple[Timetable, StationIndex]:
+    """Parse ``schedule_file`` and write its compiled timetable.
+
+    Returns the freshly built (in-memory) timetable and station index.
+    """
+    key, trains, station_index = _parse(schedule_file)
+    _write(cache_file or cache_path_for(schedule_file), trains, station_index, key)
+    return trains, station_index
+
+
+def write_compiled(schedule_file: str, trains: Timetable, station_index: StationIndex,
+                   cache_file: str | None = None):
+    """Write the compiled timetable of ``schedule_file`` from an in-memory one.
+
+    For timetables kept in step with the csv without parsing it, such as an
+    amended one (see ``timetable_delta``).
+    """
+    _write(cache_file or cache_path_for(schedule_file), trains, station_index, source_key(schedule_file))
+
+
+def _write(cache_file: str, trains: Timetable, station_index: StationIndex, key: SourceKey):
+    stations_blob = "\n".join(trains.station_codes).encode("utf-8")
+    trains_blob = "\n".join(trains.train_nos).encode("utf-8")
+    columns = {name: getattr(trains, name) for name in _TIMETABLE_COLUMNS}
+    columns["index_start"] = station_index.start
+    columns["index_stops"] = station_index.stops
+
+    header = pack_header(
+        _HEADER, _MAGIC, _FORMAT_VERSION, key,
+        trains.n_stations, trains.n_trains, trains.n_stops,
+        len(stations_blob), len(trains_blob),
+    )
+    write_atomic(cache_file, [
+        header,
+        stations_blob, b"\0" * _pad(len(stations_blob)),
+        trains_blob, b"\0" * _pad(len(trains_blob)),
+        *(columns[name].tobytes() for name, _ in _COLUMNS),
+    ])
+
+
+def _read(cache_file: str) -> Tuple[tuple, Timetable, StationIndex] | None:
+    """Map ``cache_file``; return (source key, timetable, station index) or None."""
+    try:
+        with open(cache_file, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    unpacked = unpack_header(_HEADER, mm, _MAGIC, _FORMAT_VERSION)
+    if unpacked is None:
+        return None
+    key, (n_stations, n_trains, n_stops, stations_len, trains_len) = unpacked
+
+    pos = _HEADER.size
+    station_codes = mm[pos:pos + stations_len].decode("utf-8")
+    pos += stations_len + _pad(stations_len)
+    train_nos = mm[pos:pos + trains_len].decode("utf-8")
+    pos += trains_len + _pad(trains_len)
+
+    expected = pos + 4 * sum(length(n_stations, n_trains, n_stops) for _, length in _COLUMNS)
+    if len(mm) != expected:
+        return None
+
+    view = memoryview(mm)
+    columns = {}
+    for name, length in _COLUMNS:
+        n = 4 * length(n_stations, n_trains, n_stops)
+        columns[name] = view[pos:pos + n].cast("i")
+        pos += n
+
+    trains = Timetable()
+    trains.station_codes = station_codes.split("\n") if n_stations else []
+    trains.train_nos = train_nos.split("\n") if n_trains else []
+    trains.station_ids = {code: i for i, code in enumerate(trains.station_codes)}
+    trains.train_ids = {no: i for i, no in enumerate(trains.train_nos)}
+    for name in _TIMETABLE_COLUMNS:
+        setattr(trains, name, columns[name])
+    station_index = StationIndex(columns["index_start"], columns["index_stops"])
+    return key, trains, station_index
+
+
+def load_compiled(schedule_file: str, cache_file: str | None = None) -> Tuple[Timetable, StationIndex]:
+    """Return (timetable, station index) for ``schedule_file``.
+
+    Uses the compiled cache when it is up to date and rebuilds it otherwise.
+    If the cache cannot be written (e.g. read-only directory) the freshly
+    parsed timetable is returned anyway.
+    """
+    cache_file = cache_file or cache_path_for(schedule_file)
+    st = os.stat(schedule_file)
+
+    cached = _read(cache_file)
+    if cached is not None:
+        key, trains, station_index = cached
+        if is_current(cache_file, schedule_file, st, key):
+            return trains, station_index
+
+    key, trains, station_index = _parse(schedule_file)
+    try:
+        _write(cache_file, trains, station_index, key)
+    except OSError:
+        pass
+    return trains, station_index
@@ -0,0 +1,235 @@
+"""Memory-bounded set of loaded schedules with background prefetch.
+
+A :class:`ScheduleManager` takes the place of the plain ``trains_cache``
+dict of :mod:`solver` (``solver._get_schedule`` hands it the loading). It
+keeps the loaded schedules, each with all indexes derived from it since,
+in least recently used order, and evicts whole schedules once their total
+size exceeds ``memory_budget`` bytes. Sizes are estimates
+(:func:`schedule_nbytes`), taken when a schedule is loaded and, with a
+budget, again when the solver moves on from it, since its derived indexes
+are built while it is in use. Only that one schedule is measured, outside
+the lock. The schedule in use and the one just loaded are never evicted, so a budget
+smaller than a single schedule holds one or two.
+
+Schedules announced with :meth:`ScheduleManager.expect` are loaded ahead
+on a background thread, ``prefetch`` of them at a time, while the solver
+works on earlier ones. A request for a schedule still being prefetched
+waits for it; one whose prefetch failed is loaded again in the foreground,
+so the error surfaces where it is used.
+"""
+
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterable
+
+# default number of schedules loaded ahead
+PREFETCH = 1
+
+ScheduleData = Dict[str, Any]
+
+
+def schedule_nbytes(schedule_data: ScheduleData) -> int:
+    """Approximate memory held by a loaded schedule and its derived indexes.
+
+    Buffers (arrays, memory views, NumPy arrays) count with their size,
+    anything else with ``sys.getsizeof`` and everything it references.
+    Objects reachable along several paths count once.
+    """
+    seen = set()
+    total = 0
+    todo = [schedule_data]
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or obj is None or callable(obj):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, (array, bytes, bytearray, str, int, float)):
+            total += sys.getsizeof(obj)
+        elif hasattr(obj, "nbytes"):  # memoryview, numpy array
+            total += sys.getsizeof(obj) + obj.nbytes
+        elif isinstance(obj, dict):
+            total += sys.getsizeof(obj)
+            todo.extend(obj.keys())
+            todo.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            total += sys.getsizeof(obj)
+            todo.extend(obj)
+        else:
+            total += sys.getsizeof(obj)
+            todo.extend(getattr(obj, "__dict__", {}).values())
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    todo.append(getattr(obj, name, None))
+    return total
+
+
+class ScheduleManager:
+    """Loaded schedules under a memory budget, see the module docstring.
+
+    ``loader`` builds the ``schedule_data`` of a schedule file; ``log``,
+    if given, receives a line per load and eviction.
+    """
+
+    def __init__(self, loader: Callable[[str], ScheduleData], memory_budget: int | None = None,
+                 prefetch: int = PREFETCH, log: Callable[[str], None] | None = None):
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.prefetch = prefetch
+        self.log = log
+        # schedule file -> schedule_data, least recently used first
+        self._schedules: "OrderedDict[str, ScheduleData]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # schedules expected next, in order of use
+        self._upcoming: deque = deque()
+        self._loading: str | None = None
+        self._current: str | None = None
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+        self.loads = 0
+        self.prefetched = 0
+        self.evictions = 0
+        self.wait_s = 0.0
+
+    def nbytes(self) -> int:
+        """Estimated size of the loaded schedules, as of their last measurement."""
+        with self._cond:
+            return sum(self._sizes.values())
+
+    def expect(self, schedule_files: Iterable[str]):
+        """Announce schedules about to be used, in order; they are loaded ahead."""
+        with self._cond:
+            for schedule_file in schedule_files:
+                if not self._upcoming or self._upcoming[-1] != schedule_file:
+                    self._upcoming.append(schedule_file)
+            if self.prefetch > 0 and self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._prefetch_loop, name="schedule-prefetch",
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def get(self, schedule_file: str) -> ScheduleData:
+        """The ``schedule_data`` of ``schedule_file``, loaded now if need be."""
+        left = None
+        with self._cond:
+            if self._loading == schedule_file:
+                t0 = time.perf_counter()
+                while self._loading == schedule_file:
+                    self._cond.wait()
+                self.wait_s += time.perf_counter() - t0
+            if schedule_file != self._current:
+                left, self._current = self._current, schedule_file
+                if schedule_file in self._upcoming:
+                    while self._upcoming.popleft() != schedule_file:
+                        pass
+                self._cond.notify_all()
+            schedule_data = self._schedules.get(schedule_file)
+            if schedule_data is not None:
+                self._schedules.move_to_end(schedule_file)
+        if left is not None and self.memory_budget is not None:
+            self._remeasure(left)
+        if schedule_data is not None:
+            return schedule_data
+
+        t0 = time.perf_counter()
+        schedule_data = self.loader(schedule_file)
+        load_s = time.perf_counter() - t0
+        size = schedule_nbytes(schedule_data)
+        with self._cond:
+            self._add(schedule_file, schedule_data, size, load_s, prefetched=False)
+            return schedule_data
+
+    def close(self):
+        """Stop prefetching; loaded schedules stay available."""
+        with self._cond:
+            self._closed = True
+            self._upcoming.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def summary(self) -> str:
+        return (f"{self.loads} loaded ({self.prefetched} ahead of use, {self.wait_s:.2f}s waited), "
+                f"{self.evictions} evicted, {len(self._schedules)} kept ({self.nbytes() / 2 ** 20:.1f} MiB)")
+
+    def _remeasure(self, schedule_file: str):
+        """Measure a schedule again, with the indexes derived while it was in use (lock not held)."""
+        with self._cond:
+            schedule_data = self._schedules.get(schedule_file)
+        if schedule_data is None:
+            return
+        size = schedule_nbytes(schedule_data)
+        with self._cond:
+            if schedule_file in self._sizes:
+                self._sizes[schedule_file] = size
+
+    def _add(self, schedule_file: str, schedule_data: ScheduleData, size: int, load_s: float, prefetched: bool):
+        """Keep a freshly loaded schedule of ``size`` bytes and evict down to the budget (lock held)."""
+        self._schedules[schedule_file] = schedule_data
+        self._schedules.move_to_end(schedule_file)
+        self._sizes[schedule_file] = size
+        self.loads += 1
+        self.prefetched += prefetched
+        if self.log is not None:
+            self.log(f"{'prefetched' if prefetched else 'loaded'} {schedule_file} in {load_s:.2f}s "
+                     f"({self._sizes[schedule_file] / 2 ** 20:.1f} MiB)")
+
+        if self.memory_budget is None:
+            return
+        total = sum(self._sizes.values())
+        for name in list(self._schedules):
+            if total <= self.memory_budget:
+                break
+            if name in (schedule_file, self._current):
+                continue
+            del self._schedules[name]
+            size = self._sizes.pop(name)
+            total -= size
+            self.evictions += 1
+            if self.log is not None:
+                self.log(f"evicted {name} ({size / 2 ** 20:.1f} MiB)")
+
+    def _next_prefetch(self) -> str | None:
+        for i, schedule_file in enumerate(self._upcoming):
+            if i >= self.prefetch:
+                break
+            if schedule_file not in self._schedules and schedule_file != self._current:
+                return schedule_file
+        return None
+
+    def _prefetch_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._next_prefetch() is None:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                schedule_file = self._loading = self._next_prefetch()
+            try:
+                t0 = time.perf_counter()
+                schedule_data = self.loader(schedule_file)
+                load_s = time.perf_counter() - t0
+                size = schedule_nbytes(schedule_data)
+            except Exception as e:
+                schedule_data = None
+                if self.log is not None:
+                    self.log(f"prefetch of {schedule_file} failed: {type(e).__name__}: {e}")
+            with self._cond:
+                try:
+                    if schedule_data is not None and not self._closed:
+                        self._add(schedule_file, schedule_data, size, load_s, prefetched=True)
+                    else:
+                        # not loaded ahead again; a request loads it in the foreground
+                        try:
+                            self._upcoming.remove(schedule_file)
+                        except ValueError:
+                            pass
+                finally:
+                    # even if _add failed, so that get() does not wait for this load forever
+                    self._loading = None
+                    self._cond.notify_all()
@@ -1,34 +1,121 @@
 import csv
-from datetime import datetime, timedelta
+from array import array
 from collections import defaultdict
-from typing import Dict, List, Tuple, Any
+from typing import Callable, Dict, List, Tuple, Any
 
-TimePoint = datetime
+try:
+    import numpy as np
+except ImportError:  # optional: schedules are then loaded row by row
+    np = None
+
+# Times are integer seconds since midnight of the (base) day a train starts.
+TimePoint = int
 
 TIME_FMT = "%H:%M:%S"
 
+DAY = 24 * 3600
+
 
-def _parse_time(t: str) -> datetime:
+def _parse_time(t: str) -> int:
     t = t.strip().strip("'")
-    return datetime(2000, 1, 1, *map(int, t.split(":")))
+    h, m, s = map(int, t.split(":"))
+    return h * 3600 + m * 60 + s
 
 
-def parse_hhmmss(t: str) -> datetime:
-    """Parse HH:MM:SS (no quotes) as a datetime on base date.
+def parse_hhmmss(t: str) -> int:
+    """Parse HH:MM:SS (no quotes) as seconds since midnight.
 
     Used for arrivaltime start times.
     """
     t = t.strip()
-    return datetime(2000, 1, 1, *map(int, t.split(":")))
+    h, m, s = map(int, t.split(":"))
+    return h * 3600 + m * 60 + s
+
+
+class Timetable:
+    """Interned, columnar timetable.
+
+    Stations and trains are interned to dense integer ids. Station ids follow
+    the sorted station codes and train ids the sorted train numbers, so ids
+    order exactly like the strings they replace.
+
+    The stops of all trains are stored back to back in flat arrays: the stops
+    of train ``t`` occupy ``train_start[t]`` up to ``train_start[t + 1]``. A
+    *stop id* is a position in these arrays. ``stop_arr`` / ``stop_dep`` are
+    seconds since midnight of the train's first day, already normalised so
+    that they are non-decreasing along a train.
+    """
+
+    __slots__ = (
+        "station_codes", "station_ids", "train_nos", "train_ids", "train_order",
+        "train_start", "stop_train", "stop_station", "stop_islno", "stop_arr", "stop_dep",
+    )
 
+    def __init__(self):
+        self.station_codes: List[str] = []
+        self.station_ids: Dict[str, int] = {}
+        self.train_nos: List[str] = []
+        self.train_ids: Dict[str, int] = {}
+        # train ids in order of first appearance in the source file
+        self.train_order = array("i")
+        self.train_start = array("i", [0])
+        self.stop_train = array("i")
+        self.stop_station = array("i")
+        self.stop_islno = array("i")
+        self.stop_arr = array("i")
+        self.stop_dep = array("i")
 
-def load_schedule(path: str) -> Dict[str, List[Dict[str, Any]]]:
-    """Load schedule csv into dict[train_no] -> ordered list of stops.
+    @property
+    def n_stations(self) -> int:
+        return len(self.station_codes)
+
+    @property
+    def n_trains(self) -> int:
+        return len(self.train_nos)
+
+    @property
+    def n_stops(self) -> int:
+        return len(self.stop_train)
+
+    def train_end(self, stop: int) -> int:
+        """One past the last stop id of the train ``stop`` belongs to."""
+        return self.train_start[self.stop_train[stop] + 1]
+
+    def index_order(self) -> Callable[[int], Tuple[int, int]]:
+        """Sort key putting stop ids in :class:`StationIndex` order."""
+        rank = array("i", bytes(4 * self.n_trains))
+        for r, t in enumerate(self.train_order):
+            rank[t] = r
+        stop_train = self.stop_train
+        return lambda stop: (rank[stop_train[stop]], stop)
+
+    def segment(self, stop: int) -> Dict[str, Any]:
+        """Edge data for riding from ``stop`` to the next stop of its train."""
+        return {
+            "train": self.train_nos[self.stop_train[stop]],
+            "from_islno": self.stop_islno[stop],
+            "to_islno": self.stop_islno[stop + 1],
+        }
+
+
+def load_schedule(path: str, vectorised: bool | None = None) -> Timetable:
+    """Load schedule csv into a columnar :class:`Timetable`.
 
     Handles overnight roll-over so that arrival/dep times are non-decreasing
     within a train.
+
+    With NumPy installed the columns are parsed and normalised in bulk
+    (``_load_schedule_vectorised``); otherwise, or with ``vectorised=False``,
+    row by row. Both give identical timetables.
     """
-    trains: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    if vectorised is None:
+        vectorised = np is not None
+    if vectorised:
+        if np is None:
+            raise ImportError("the vectorised schedule loader needs numpy")
+        return _load_schedule_vectorised(path)
+
+    raw: Dict[str, List[Tuple[int, str, int, int]]] = defaultdict(list)
 
     with open(path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -36,51 +123,245 @@ def load_schedule(path: str) -> Dict[str, List[Dict[str, Any]]]:
             train_no = row["Train No."].strip().strip("'")
             islno = int(row["islno"])
             station = row["station Code"].strip()
-            arr_raw = row["Arrival time"]
-            dep_raw = row["Departure time"]
-
-            arr = _parse_time(arr_raw)
-            dep = _parse_time(dep_raw)
-
-            trains[train_no].append({
-                "islno": islno,
-                "station": station,
-                "arr": arr,
-                "dep": dep,
-            })
-
-    # fix overnight within each train
-    for train_no, stops in trains.items():
-        stops.sort(key=lambda s: s["islno"])
-        last_time: datetime | None = None
-        day_offset = timedelta(0)
-        for s in stops:
-            # arrival
+            arr = _parse_time(row["Arrival time"])
+            dep = _parse_time(row["Departure time"])
+            raw[train_no].append((islno, station, arr, dep))
+
+    return _build_timetable(raw)
+
+
+def _parse_times_vectorised(column: "np.ndarray") -> "np.ndarray":
+    """Seconds since midnight of a bytes column of ``'HH:MM:SS'`` values."""
+    times = np.char.strip(column, b" '")
+    if (np.char.str_len(times) == 8).all():
+        # the digits of HH:MM:SS
+        digits = times.astype("S8").view(np.uint8).reshape(-1, 8).astype(np.int64) - ord("0")
+        return ((digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60
+                + digits[:, 6] * 10 + digits[:, 7])
+    return np.fromiter((_parse_time(t.decode()) for t in times), dtype=np.int64, count=len(times))
+
+
+def _read_columns_vectorised(path: str, names: Tuple[str, ...]) -> List["np.ndarray"]:
+    """The ``names`` columns of a csv file as bytes arrays.
+
+    Files without ``"`` quoting and with the same number of fields on every
+    line are split on the raw bytes: the positions of all separators form a
+    (rows, fields) matrix, from which each column is gathered at once.
+    Anything else is left to the csv module, which skips blank lines like
+    the ``DictReader`` of the row-by-row path.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    header_end = data.find(b"\n")
+    if header_end < 0:
+        return [np.zeros(0, dtype="S1") for _ in names]  # no rows
+    header = next(csv.reader([data[:header_end].decode("utf-8")]))
+    fields = [header.index(name) for name in names]
+    body = np.frombuffer(data, dtype=np.uint8)[header_end + 1:]
+    if len(body) and body[-1] != ord("\n"):
+        body = np.append(body, np.uint8(ord("\n")))
+
+    seps = np.flatnonzero((body == ord(",")) | (body == ord("\n")))
+    n_rows = int(np.count_nonzero(body == ord("\n")))
+    if n_rows and b'"' not in data and len(seps) == n_rows * len(header):
+        ends = seps.reshape(n_rows, len(header))
+        starts = np.empty_like(ends)
+        starts[:, 1:] = ends[:, :-1] + 1
+        starts[0, 0] = 0
+        starts[1:, 0] = ends[:-1, -1] + 1
+        columns = []
+        for i in fields:
+            lengths = ends[:, i] - starts[:, i]
+            width = max(int(lengths.max(initial=0)), 1)
+            offsets = np.arange(width)
+            chars = body[np.minimum(starts[:, i, None] + offsets, len(body) - 1)]
+            chars[offsets >= lengths[:, None]] = 0  # trailing NULs end a bytes value
+            columns.append(chars.view(f"S{width}").ravel())
+        return columns
+
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.reader(f) if row][1:]
+    return [np.char.encode(np.asarray([row[i] for row in rows], dtype=str), "utf-8") for i in fields]
+
+
+def _load_schedule_vectorised(path: str) -> Timetable:
+    """:func:`load_schedule` on whole columns at a time (needs NumPy).
+
+    Stops are grouped by a stable sort on (train, islno), so equal islnos
+    keep file order as in the row-by-row path. The roll-over of the row
+    path has a closed form: a stop after the first starts a new day when
+    its arrival is before the previous departure, counting that departure
+    a day later if it was before its own arrival (first stops excepted).
+    The day offsets are then a cumulative sum per train.
+    """
+    train_col, islno_col, station_col, arr_col, dep_col = _read_columns_vectorised(
+        path, ("Train No.", "islno", "station Code", "Arrival time", "Departure time"))
+    tt = Timetable()
+    if not len(train_col):
+        return tt
+
+    islno = islno_col.astype(np.int64)
+    arr = _parse_times_vectorised(arr_col)
+    dep = _parse_times_vectorised(dep_col)
+
+    # interning: ids follow the sorted strings (UTF-8 bytes sort like the
+    # strings), as in the row path
+    codes, station = np.unique(np.char.strip(station_col), return_inverse=True)
+    numbers, first_row, train = np.unique(np.char.strip(np.char.strip(train_col), b"'"), return_index=True,
+                                          return_inverse=True)
+    tt.station_codes = [code.decode() for code in codes.tolist()]
+    tt.station_ids = {code: i for i, code in enumerate(tt.station_codes)}
+    tt.train_nos = [no.decode() for no in numbers.tolist()]
+    tt.train_ids = {no: i for i, no in enumerate(tt.train_nos)}
+    tt.train_order = array("i", np.argsort(first_row, kind="stable").astype(np.int32).tobytes())
+
+    order = np.lexsort((islno, train))
+    train, station, islno, arr, dep = train[order], station[order], islno[order], arr[order], dep[order]
+
+    first = np.ones(len(train), dtype=bool)
+    first[1:] = train[1:] != train[:-1]
+    # departure before arrival: a day later (never at the first stop)
+    late = (dep < arr) & ~first
+    prev_dep = np.empty_like(dep)
+    prev_dep[1:] = dep[:-1] + DAY * late[:-1]
+    new_day = ~first
+    new_day[1:] &= arr[1:] < prev_dep[1:]
+    days = np.cumsum(new_day)
+    days -= np.maximum.accumulate(np.where(first, days, 0))
+    arr = arr + DAY * days
+    dep = dep + DAY * (days + late)
+
+    def int_array(values) -> array:
+        return array("i", np.ascontiguousarray(values, dtype=np.int32).tobytes())
+
+    tt.stop_train = int_array(train)
+    tt.stop_station = int_array(station)
+    tt.stop_islno = int_array(islno)
+    tt.stop_arr = int_array(arr)
+    tt.stop_dep = int_array(dep)
+    tt.train_start = int_array(np.concatenate(([0], np.cumsum(np.bincount(train, minlength=len(numbers))))))
+    return tt
+
+
+def _build_timetable(raw: Dict[str, List[Tuple[int, str, int, int]]]) -> Timetable:
+    """Intern and normalise per-train ``(islno, station, arr, dep)`` rows.
+
+    ``raw`` must iterate in order of first appearance in the source file.
+    """
+    tt = Timetable()
+    tt.station_codes = sorted({stop[1] for stops in raw.values() for stop in stops})
+    tt.station_ids = {code: i for i, code in enumerate(tt.station_codes)}
+    tt.train_nos = sorted(raw)
+    tt.train_ids = {no: i for i, no in enumerate(tt.train_nos)}
+    tt.train_order = array("i", [tt.train_ids[no] for no in raw])
+
+    station_ids = tt.station_ids
+    for t, train_no in enumerate(tt.train_nos):
+        stops = raw[train_no]
+        stops.sort(key=lambda s: s[0])
+
+        # fix overnight within each train
+        last_time: int | None = None
+        day_offset = 0
+        for islno, station, arr, dep in stops:
             if last_time is None:
-                s["arr"] += day_offset
-                s["dep"] += day_offset
-                last_time = s["dep"]
-                continue
-
-            arr = s["arr"] + day_offset
-            if arr < last_time:
-                day_offset += timedelta(days=1)
-                arr = s["arr"] + day_offset
-            dep = s["dep"] + day_offset
-            if dep < arr:
-                dep += timedelta(days=1)
-
-            s["arr"] = arr
-            s["dep"] = dep
+                arr += day_offset
+                dep += day_offset
+            else:
+                if arr + day_offset < last_time:
+                    day_offset += DAY
+                arr += day_offset
+                dep += day_offset
+                if dep < arr:
+                    dep += DAY
             last_time = dep
 
-    return trains
+            tt.stop_train.append(t)
+            tt.stop_station.append(station_ids[station])
+            tt.stop_islno.append(islno)
+            tt.stop_arr.append(arr)
+            tt.stop_dep.append(dep)
+        tt.train_start.append(len(tt.stop_train))
+
+    return tt
+
+
+class StationIndex:
+    """Station id -> stop ids calling there, in CSR form.
+
+    The stop ids of station ``st`` are ``stops[start[st]:start[st + 1]]``,
+    ordered by train (in source-file order) and then by position in the train.
+    """
+
+    __slots__ = ("start", "stops")
+
+    def __init__(self, start: array, stops: array):
+        self.start = start
+        self.stops = stops
+
+    def __getitem__(self, station: int) -> array:
+        if station < 0:
+            return array("i")
+        return self.stops[self.start[station]:self.start[station + 1]]
+
+
+def build_station_index(trains: Timetable) -> StationIndex:
+    """Return the :class:`StationIndex` of a timetable."""
+    counts = [0] * (trains.n_stations + 1)
+    stop_station = trains.stop_station
+    for st in stop_station:
+        counts[st + 1] += 1
+    for i in range(trains.n_stations):
+        counts[i + 1] += counts[i]
+    start = array("i", counts)
+
+    fill = counts[:-1]
+    stops = array("i", bytes(4 * trains.n_stops))
+    train_start = trains.train_start
+    for t in trains.train_order:
+        for s in range(train_start[t], train_start[t + 1]):
+            st = stop_station[s]
+            stops[fill[st]] = s
+            fill[st] += 1
+    return StationIndex(start, stops)
+
+
+class DepartureIndex:
+    """Station id -> departures there, sorted by time of day, in CSR form.
+
+    The departures of station ``st`` are ``stops[start[st]:start[st + 1]]``
+    (stop ids with a next stop in their train), ordered by ``tod``, the
+    departure time modulo one day. ``min_dep[st]`` is the earliest absolute
+    departure among them.
+    """
+
+    __slots__ = ("start", "stops", "tod", "min_dep")
+
+    def __init__(self, start: array, stops: array, tod: array, min_dep: array):
+        self.start = start
+        self.stops = stops
+        self.tod = tod
+        self.min_dep = min_dep
+
 
+def build_departure_index(trains: Timetable) -> DepartureIndex:
+    """Return the :class:`DepartureIndex` of a timetable."""
+    stop_station = trains.stop_station
+    stop_dep = trains.stop_dep
+    train_start = trains.train_start
+    stops = array("i")
+    for t in range(trains.n_trains):
+        stops.extend(range(train_start[t], train_start[t + 1] - 1))
+    stops = array("i", sorted(stops, key=lambda s: (stop_station[s], stop_dep[s] % DAY, s)))
 
-def build_station_index(trains: Dict[str, List[Dict[str, Any]]]):
-    """Return mapping station -> list of (train_no, index) where index into trains[train_no]."""
-    index: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
-    for train_no, stops in trains.items():
-        for i, stop in enumerate(stops):
-            index[stop["station"]].append((train_no, i))
-    return index
+    counts = [0] * (trains.n_stations + 1)
+    min_dep = array("i", [2 ** 31 - 1]) * trains.n_stations
+    for s in stops:
+        st = stop_station[s]
+        counts[st + 1] += 1
+        if stop_dep[s] < min_dep[st]:
+            min_dep[st] = stop_dep[s]
+    for i in range(trains.n_stations):
+        counts[i + 1] += counts[i]
+    tod = array("i", [stop_dep[s] % DAY for s in stops])
+    return DepartureIndex(array("i", counts), stops, tod, min_dep)
@@ -1,23 +1,105 @@
-from typing import Dict, Hashable, Any, Tuple, List
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import chain
+from typing import Callable, Dict, Hashable, Any, Iterable, Tuple, List
 import heapq
 
+from schedule_utils import DAY, Timetable, StationIndex, DepartureIndex, build_departure_index
+from graph_builder import ScheduleGraph, PRICE_LEVELS
 
-def dijkstra(graph, start, is_goal):
+
+class SearchStats:
+    """Counters of one search, for the searches taking a ``stats`` argument.
+
+    ``edges_relaxed`` counts edges examined (whether or not they improved a
+    label), ``pushed`` includes the start entries, and ``stale`` pops are
+    outdated heap entries that were skipped. The counting is done by
+    wrappers around the heap and edge functions, installed only when stats
+    are requested, so a search without ``stats`` runs exactly as before.
+    """
+
+    __slots__ = ("pushed", "popped", "settled", "edges_relaxed", "peak_heap")
+
+    def __init__(self):
+        self.pushed = 0
+        self.popped = 0
+        self.settled = 0
+        self.edges_relaxed = 0
+        self.peak_heap = 0
+
+    @property
+    def stale(self) -> int:
+        return self.popped - self.settled
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"pushed": self.pushed, "popped": self.popped, "stale": self.stale, "settled": self.settled,
+                "edges_relaxed": self.edges_relaxed, "peak_heap": self.peak_heap}
+
+    def instrument(self, pq: List[Any], on_settle: Callable[[Hashable], bool] | None):
+        """Counting ``(push, pop, on_settle)`` for a search starting from heap ``pq``."""
+        self.pushed += len(pq)
+        self.peak_heap = max(self.peak_heap, len(pq))
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        def push(heap, item):
+            heappush(heap, item)
+            self.pushed += 1
+            if len(heap) > self.peak_heap:
+                self.peak_heap = len(heap)
+
+        def pop(heap):
+            self.popped += 1
+            return heappop(heap)
+
+        def settle(node) -> bool:
+            self.settled += 1
+            return on_settle is not None and on_settle(node)
+
+        return push, pop, settle
+
+    def count_edges(self, graph):
+        """``graph`` counting the edges it yields."""
+        def counted(node):
+            for edge in graph(node):
+                self.edges_relaxed += 1
+                yield edge
+        return counted
+
+    def count_calls(self, fn):
+        """``fn`` counting its calls as edges."""
+        def counted(*args):
+            self.edges_relaxed += 1
+            return fn(*args)
+        return counted
+
+
+def dijkstra(graph, start, is_goal, on_settle: Callable[[Hashable], bool] | None = None,
+             stats: SearchStats | None = None):
     """Generic Dijkstra.
 
     graph(node) -> iterable of (next_node, edge_cost, edge_data)
     is_goal(node) -> bool
 
     Returns (prev, dist, goal_node) where prev is mapping child->(parent, edge_data).
+    If ``on_settle`` is given it is called with every settled node, in settle
+    order; returning True stops the search (with no goal node). ``stats``
+    collects the search's counters.
     """
     dist: Dict[Hashable, float] = {start: 0.0}
     prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {start: (None, None)}
     pq: List[Tuple[float, Hashable]] = [(0.0, start)]
+    push, pop = heapq.heappush, heapq.heappop
+    if stats is not None:
+        push, pop, on_settle = stats.instrument(pq, on_settle)
+        graph = stats.count_edges(graph)
 
     while pq:
-        cost, node = heapq.heappop(pq)
+        cost, node = pop(pq)
         if cost != dist.get(node, float("inf")):
             continue
+        if on_settle is not None and on_settle(node):
+            break
         if is_goal(node):
             return prev, dist, node
 
@@ -26,11 +108,489 @@ def dijkstra(graph, start, is_goal):
             if new_cost < dist.get(nxt, float("inf")):
                 dist[nxt] = new_cost
                 prev[nxt] = (node, e_data)
-                heapq.heappush(pq, (new_cost, nxt))
+                push(pq, (new_cost, nxt))
+
+    return prev, dist, None
+
+
+def astar(graph, start, is_goal, heuristic: Callable[[Hashable], float],
+          on_settle: Callable[[Hashable], bool] | None = None):
+    """A*: Dijkstra ordered by cost plus ``heuristic(node)``.
+
+    ``heuristic`` must be a consistent lower bound on the remaining cost
+    (e.g. ALT landmark bounds); nodes with an infinite bound cannot reach a
+    goal and are never queued. Arguments and result as in :func:`dijkstra`.
+    """
+    inf = float("inf")
+    dist: Dict[Hashable, float] = {start: 0.0}
+    prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {start: (None, None)}
+    pq: List[Tuple[float, float, Hashable]] = [(heuristic(start), 0.0, start)]
+
+    while pq:
+        _, cost, node = heapq.heappop(pq)
+        if cost != dist.get(node, inf):
+            continue
+        if on_settle is not None and on_settle(node):
+            break
+        if is_goal(node):
+            return prev, dist, node
+
+        for nxt, w, e_data in graph(node):
+            new_cost = cost + w
+            if new_cost < dist.get(nxt, inf):
+                h = heuristic(nxt)
+                if h == inf:
+                    continue
+                dist[nxt] = new_cost
+                prev[nxt] = (node, e_data)
+                heapq.heappush(pq, (new_cost + h, new_cost, nxt))
 
     return prev, dist, None
 
 
+def bidirectional_dijkstra(graph, reverse_graph, start, goals: Iterable[Hashable],
+                           on_settle: Callable[[Hashable], bool] | None = None):
+    """Dijkstra from ``start`` and, backwards, from ``goals`` at the same time.
+
+    reverse_graph(node) -> iterable of (prev_node, edge_cost, edge_data) for
+    the edges *into* node, with the data of the forward edge.
+
+    The side with the smaller queue head is advanced; the search stops once
+    the two heads add up to at least the best path seen so far. Returns
+    (prev, dist, goal_node) like :func:`dijkstra`, but ``prev`` and ``dist``
+    only describe the path found. ``on_settle`` sees the settled nodes of
+    both sides.
+    """
+    inf = float("inf")
+    dist_f: Dict[Hashable, float] = {start: 0.0}
+    prev_f: Dict[Hashable, Tuple[Hashable | None, Any]] = {start: (None, None)}
+    dist_b: Dict[Hashable, float] = {}
+    # backward labels point towards the goal: node -> (next_node, edge_data)
+    next_b: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
+    for g in goals:
+        dist_b[g] = 0.0
+        next_b[g] = (None, None)
+    pq_f: List[Tuple[float, Hashable]] = [(0.0, start)]
+    pq_b: List[Tuple[float, Hashable]] = [(0.0, g) for g in dist_b]
+
+    best = 0.0 if start in dist_b else inf
+    meet = start if start in dist_b else None
+
+    while pq_f or pq_b:
+        top_f = pq_f[0][0] if pq_f else inf
+        top_b = pq_b[0][0] if pq_b else inf
+        if top_f + top_b >= best:
+            break
+        forward = top_f <= top_b
+        pq, dist, other, links = (pq_f, dist_f, dist_b, prev_f) if forward else (pq_b, dist_b, dist_f, next_b)
+
+        cost, node = heapq.heappop(pq)
+        if cost != dist.get(node, inf):
+            continue
+        if on_settle is not None and on_settle(node):
+            meet = None
+            break
+
+        for nxt, w, e_data in (graph if forward else reverse_graph)(node):
+            new_cost = cost + w
+            if new_cost < dist.get(nxt, inf):
+                dist[nxt] = new_cost
+                links[nxt] = (node, e_data)
+                heapq.heappush(pq, (new_cost, nxt))
+                if new_cost + other.get(nxt, inf) < best:
+                    best = new_cost + other[nxt]
+                    meet = nxt
+
+    if meet is None:
+        return {}, {}, None
+
+    # start .. meet from the forward labels, meet .. goal from the backward ones
+    nodes: List[Hashable] = []
+    edges: List[Any] = []
+    node = meet
+    while node is not None:
+        parent, e_data = prev_f[node]
+        nodes.append(node)
+        edges.append(e_data)
+        node = parent
+    nodes.reverse()
+    edges.reverse()
+    node = meet
+    while True:
+        nxt, e_data = next_b[node]
+        if nxt is None:
+            break
+        nodes.append(nxt)
+        edges.append(e_data)
+        node = nxt
+
+    # both halves can pass the same node through a zero-cost cycle
+    # (e.g. transfers back and forth at one station); cut such cycles
+    prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
+    position: Dict[Hashable, int] = {}
+    path: List[Tuple[Hashable, Any]] = []
+    for node, e_data in zip(nodes, edges):
+        if node in position:
+            for dropped, _ in path[position[node] + 1:]:
+                del position[dropped]
+            del path[position[node] + 1:]
+            continue
+        position[node] = len(path)
+        path.append((node, e_data))
+    parent = None
+    for node, e_data in path:
+        prev[node] = (parent, e_data)
+        parent = node
+    return prev, {parent: best}, parent
+
+
+class DenseLabels:
+    """Read-only ``dist`` or ``prev`` mapping over the buffers of a :class:`DenseDijkstra` query.
+
+    Valid until the next query on the same instance.
+    """
+
+    __slots__ = ("_search", "_generation", "_prev")
+
+    def __init__(self, search: "DenseDijkstra", prev: bool):
+        self._search = search
+        self._generation = search.generation
+        self._prev = prev
+
+    def __contains__(self, node) -> bool:
+        search = self._search
+        if search.generation != self._generation:
+            raise RuntimeError("labels of an earlier query on a reused DenseDijkstra")
+        return isinstance(node, int) and 0 <= node < len(search.stamp) and search.stamp[node] == self._generation
+
+    def __getitem__(self, node):
+        if node not in self:
+            raise KeyError(node)
+        search = self._search
+        if not self._prev:
+            return search.dist[node]
+        parent = search.pred[node]
+        via = search.via[node]
+        return (None if parent < 0 else parent), (None if via < 0 else via)
+
+    def get(self, node, default=None):
+        return self[node] if node in self else default
+
+
+class DenseDijkstra:
+    """Dijkstra over the integer nodes of one metric of a :class:`ScheduleGraph`.
+
+    Nodes are dense ids: station ids for ``stops``, stop ids for
+    ``timeintrain``, price states (``stop * PRICE_LEVELS + used``) for
+    ``price``. Labels live in arrays preallocated once per schedule and
+    metric: ``dist``, ``pred`` (predecessor, -1 at start nodes) and ``via``
+    (departing stop of the edge, -1 for transfers), the only edge metadata,
+    read back when a path is reconstructed. A label is valid while
+    ``stamp[node]`` equals the current ``generation``; a query bumps the
+    generation instead of clearing the arrays, and reuses one heap list.
+    The arrays are stdlib ``array``s rather than NumPy ones: the search
+    reads and writes one label at a time, where ``array`` indexing is
+    faster and yields plain Python numbers, and NumPy stays optional.
+
+    Edges are read inline from the graph's arrays, without edge tuples or
+    generators, in the same order as the ``ScheduleGraph`` edge functions,
+    so results are identical to :func:`dijkstra` on those. Transfers are
+    expanded once per station, like there.
+    """
+
+    def __init__(self, graph: ScheduleGraph, metric: str):
+        if metric == "stops":
+            n = graph.trains.n_stations
+        elif metric == "timeintrain":
+            n = graph.trains.n_stops
+        elif metric == "price":
+            n = graph.trains.n_stops * PRICE_LEVELS
+        else:
+            raise ValueError(f"No dense search for {metric}")
+        self.graph = graph
+        self.metric = metric
+        self.dist = array("d", bytes(8 * n))
+        self.pred = array("i", bytes(4 * n))
+        self.via = array("i", bytes(4 * n))
+        self.stamp = array("I", bytes(4 * n))
+        # per station: transfers expanded (timeintrain) or stop that expanded them (price)
+        self.station_stamp = array("I", bytes(4 * graph.trains.n_stations))
+        self.station_first = array("i", bytes(4 * graph.trains.n_stations))
+        self.generation = 0
+        self.heap: List[Tuple[float, int]] = []
+
+    def _start(self, starts: Iterable[int]) -> int:
+        if self.generation == 0xFFFFFFFF:
+            # wrapped: forget every stamp once
+            self.stamp = array("I", bytes(4 * len(self.stamp)))
+            self.station_stamp = array("I", bytes(4 * len(self.station_stamp)))
+            self.generation = 0
+        self.generation += 1
+        gen = self.generation
+        stamp, dist, pred, via, heap = self.stamp, self.dist, self.pred, self.via, self.heap
+        heap.clear()
+        for s in starts:
+            if stamp[s] != gen:
+                stamp[s] = gen
+                dist[s] = 0.0
+                pred[s] = -1
+                via[s] = -1
+                heap.append((0.0, s))
+        return gen
+
+    def run(self, from_station: str, to_station: str | None,
+            on_settle: Callable[[Hashable], bool] | None = None):
+        """Search like :func:`dijkstra`; returns ``(prev, dist, goal)`` as :class:`DenseLabels`."""
+        graph = self.graph
+        trains = graph.trains
+        origin = trains.station_ids.get(from_station, -1)
+        goal_station = trains.station_ids.get(to_station, -1) if to_station is not None else -1
+        if self.metric == "stops":
+            goal = self._stops(origin, goal_station, on_settle)
+        else:
+            starts = graph.station_index[origin]
+            if self.metric == "price":
+                starts = [s * PRICE_LEVELS for s in starts]
+            goal = (self._timeintrain if self.metric == "timeintrain" else self._price)(
+                starts, goal_station, on_settle)
+        return DenseLabels(self, True), DenseLabels(self, False), goal
+
+    def _stops(self, origin: int, goal: int, on_settle) -> int | None:
+        gen = self._start([origin] if origin >= 0 else [])
+        stamp, dist, pred, via, heap = self.stamp, self.dist, self.pred, self.via, self.heap
+        edge_start, edge_to, edge_stop = self.graph.stops_start, self.graph.stops_to, self.graph.stops_edge
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        while heap:
+            cost, node = heappop(heap)
+            if cost != dist[node]:
+                continue
+            if on_settle is not None and on_settle(node):
+                break
+            if node == goal:
+                return node
+            new_cost = cost + 1
+            for j in range(edge_start[node], edge_start[node + 1]):
+                nxt = edge_to[j]
+                if stamp[nxt] != gen:
+                    stamp[nxt] = gen
+                elif new_cost >= dist[nxt]:
+                    continue
+                dist[nxt] = new_cost
+                pred[nxt] = node
+                via[nxt] = edge_stop[j]
+                heappush(heap, (new_cost, nxt))
+        return None
+
+    def _timeintrain(self, starts: Iterable[int], goal_station: int, on_settle) -> int | None:
+        gen = self._start(starts)
+        stamp, dist, pred, via, heap = self.stamp, self.dist, self.pred, self.via, self.heap
+        station_stamp = self.station_stamp
+        graph = self.graph
+        stop_station, ride_time = graph.trains.stop_station, graph.ride_time
+        idx_start, idx_stops, index_pos = graph.station_index.start, graph.station_index.stops, graph.index_pos
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        while heap:
+            cost, node = heappop(heap)
+            if cost != dist[node]:
+                continue
+            if on_settle is not None and on_settle(node):
+                break
+            station = stop_station[node]
+            if station == goal_station:
+                return node
+
+            dt = ride_time[node]
+            if dt >= 0:
+                nxt = node + 1
+                new_cost = cost + dt
+                if stamp[nxt] != gen or new_cost < dist[nxt]:
+                    stamp[nxt] = gen
+                    dist[nxt] = new_cost
+                    pred[nxt] = node
+                    via[nxt] = node
+                    heappush(heap, (new_cost, nxt))
+            if station_stamp[station] == gen:
+                continue
+            station_stamp[station] = gen
+            p = index_pos[node]
+            for j in range(idx_start[station], idx_start[station + 1]):
+                if j == p:
+                    continue
+                nxt = idx_stops[j]
+                if stamp[nxt] != gen:
+                    stamp[nxt] = gen
+                elif cost >= dist[nxt]:
+                    continue
+                dist[nxt] = cost
+                pred[nxt] = node
+                via[nxt] = -1
+                heappush(heap, (cost, nxt))
+        return None
+
+    def _price(self, starts: Iterable[int], goal_station: int, on_settle) -> int | None:
+        gen = self._start(starts)
+        stamp, dist, pred, via, heap = self.stamp, self.dist, self.pred, self.via, self.heap
+        station_stamp, station_first = self.station_stamp, self.station_first
+        graph = self.graph
+        stop_station, ride_time = graph.trains.stop_station, graph.ride_time
+        idx_start, index_price, index_pos = graph.station_index.start, graph.index_price, graph.index_pos
+        heappush, heappop = heapq.heappush, heapq.heappop
+        levels = PRICE_LEVELS
+
+        while heap:
+            cost, state = heappop(heap)
+            if cost != dist[state]:
+                continue
+            if on_settle is not None and on_settle(state):
+                break
+            stop, used = divmod(state, levels)
+            station = stop_station[stop]
+            if station == goal_station:
+                return state
+
+            if ride_time[stop] >= 0:
+                # a segment costs 1 until the train ticket (10) is paid off
+                if used < 10:
+                    nxt, new_cost = (stop + 1) * levels + used + 1, cost + 1
+                else:
+                    nxt, new_cost = (stop + 1) * levels + 10, cost
+                if stamp[nxt] != gen or new_cost < dist[nxt]:
+                    stamp[nxt] = gen
+                    dist[nxt] = new_cost
+                    pred[nxt] = state
+                    via[nxt] = stop
+                    heappush(heap, (new_cost, nxt))
+
+            if station_stamp[station] != gen:
+                station_stamp[station] = gen
+                station_first[station] = stop
+                p = index_pos[stop]
+                targets = range(idx_start[station], idx_start[station + 1])
+            elif station_first[station] != stop:
+                # the one target the first fan-out skipped: that stop itself
+                p = -1
+                targets = (index_pos[station_first[station]],)
+            else:
+                continue
+            for j in targets:
+                if j == p:
+                    continue
+                nxt = index_price[j]
+                if stamp[nxt] != gen:
+                    stamp[nxt] = gen
+                elif cost >= dist[nxt]:
+                    continue
+                dist[nxt] = cost
+                pred[nxt] = state
+                via[nxt] = -1
+                heappush(heap, (cost, nxt))
+        return None
+
+
+def price_zero_one(graph: ScheduleGraph, from_station: str, to_station: str | None,
+                   on_settle: Callable[[Hashable], bool] | None = None):
+    """0-1 BFS specialised for `price`.
+
+    Same states (``stop * PRICE_LEVELS + used``) and result as the generic
+    price search, but price increments are only ever 0 or 1, so a deque
+    replaces the heap: 0-cost edges go to the front, 1-cost edges to the
+    back, and states still leave it in non-decreasing price order.
+
+    States are pruned by dominance. From ``(stop, used)`` at price ``c``,
+    riding ``k`` more segments costs ``min(k, 10 - used)`` and a transfer
+    starts afresh at ``c``; so ``(stop, u2)`` at ``c2`` dominates it if
+    ``c2 <= c`` and ``c2 - u2 <= c - used`` (a higher ``used`` is closer
+    to the train ticket cap). As states settle in price order, keeping the
+    smallest ``c - used`` settled per stop is enough to test this.
+
+    The goal is tested by station id when a state is queued: a goal state
+    queued at the current price is optimal at once, one queued at a price
+    one higher as soon as the current price level is used up. This saves
+    draining the final level, usually the largest. ``to_station=None`` and
+    ``on_settle`` work as in :func:`dijkstra_arrivaltime`.
+    """
+    trains = graph.trains
+    station_ids = trains.station_ids
+    stop_station = trains.stop_station
+    ride_time = graph.ride_time
+    idx_start = graph.station_index.start
+    idx_stops = graph.station_index.stops
+    goal_station = station_ids.get(to_station, -1) if to_station is not None else -1
+    big = trains.n_stops + PRICE_LEVELS
+
+    dist: Dict[Hashable, int] = {}
+    prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
+    # smallest (price - used) settled per stop, see above
+    floor = [big] * trains.n_stops
+    expanded = bytearray(trains.n_stations)
+    queue: deque = deque()
+    for s in graph.station_index[station_ids.get(from_station, -1)]:
+        state = s * PRICE_LEVELS
+        dist[state] = 0
+        prev[state] = (None, None)
+        queue.append((0, state))
+        if stop_station[s] == goal_station:
+            return prev, dist, state
+    # goal state queued one price level above the current one
+    found = None
+
+    while queue:
+        cost, state = queue.popleft()
+        if found is not None and cost >= dist[found]:
+            return prev, dist, found
+        if cost != dist[state]:
+            continue
+        stop, used = divmod(state, PRICE_LEVELS)
+        if cost - used >= floor[stop]:
+            continue
+        floor[stop] = cost - used
+        if on_settle is not None and on_settle(state):
+            break
+        station = stop_station[stop]
+
+        # continue on the same train: 1 per segment until the 10-segment cap
+        if ride_time[stop] >= 0:
+            nxt = stop + 1
+            if used < 10:
+                new_used, new_cost = used + 1, cost + 1
+            else:
+                new_used, new_cost = 10, cost
+            new_state = nxt * PRICE_LEVELS + new_used
+            if new_cost - new_used < floor[nxt] and new_cost < dist.get(new_state, big):
+                dist[new_state] = new_cost
+                prev[new_state] = (state, stop)
+                if stop_station[nxt] == goal_station:
+                    if new_cost == cost:
+                        return prev, dist, new_state
+                    if found is None:
+                        found = new_state
+                if new_cost == cost:
+                    queue.appendleft((new_cost, new_state))
+                else:
+                    queue.append((new_cost, new_state))
+
+        # free transfers; only the cheapest arrival at a station can improve them
+        if expanded[station]:
+            continue
+        expanded[station] = 1
+        for j in range(idx_start[station], idx_start[station + 1]):
+            s2 = idx_stops[j]
+            new_state = s2 * PRICE_LEVELS
+            if s2 != stop and cost < floor[s2] and cost < dist.get(new_state, big):
+                dist[new_state] = cost
+                prev[new_state] = (state, None)
+                queue.appendleft((cost, new_state))
+
+    return prev, dist, found
+
+
+def path_segments(trains: Timetable, prev: Dict[Hashable, Tuple[Hashable | None, Any]], goal) -> List[Dict[str, Any]]:
+    """Segment dicts (see ``Timetable.segment``) along the path to ``goal``."""
+    return [trains.segment(s) for s in reconstruct_path(prev, goal)]
+
+
 def reconstruct_path(prev: Dict[Hashable, Tuple[Hashable | None, Any]], goal) -> List[Any]:
     path: List[Any] = []
     node = goal
@@ -44,153 +604,176 @@ def reconstruct_path(prev: Dict[Hashable, Tuple[Hashable | None, Any]], goal) ->
 
 
 def dijkstra_arrivaltime(
-    trains,
-    station_index,
+    trains: Timetable,
+    station_index: StationIndex,
     from_station: str,
-    to_station: str,
-    start_time,
+    to_station: str | None,
+    start_time: int,
     change_time_seconds: int,
+    on_settle: Callable[[Hashable], bool] | None = None,
+    stats: SearchStats | None = None,
+    departures: DepartureIndex | None = None,
 ):
     """Dijkstra specialised for `arrivaltime`.
 
     dist[state] stores the *elapsed travel time in seconds* since the
-    given ``start_time`` (not an absolute timestamp). To decide whether
+    given ``start_time`` (not an absolute time). To decide whether
     we can still catch a train, we additionally maintain the current
-    absolute timestamp for each state.
-
-    A state is represented as ``(train_no, idx)``, meaning we are on
-    train ``train_no`` at stop index ``idx`` in ``trains[train_no]``.
+    absolute time for each state.
+
+    A state is a stop id, meaning we have arrived at that stop of its
+    train. ``prev`` edge data are the stop ids segments depart from.
+
+    ``to_station`` may be None to search without a goal; ``on_settle``
+    and ``stats`` work as in :func:`dijkstra`. Every train a state can
+    continue on or change to counts as an edge.
+
+    Changes use the ``departures`` of the schedule (built here if not
+    given). Changing trains later never arrives earlier, so a state only
+    changes trains if it is ready to before every state that already did
+    at its station. The departures are scanned from the next one after
+    the change time (``bisect``) and, once a goal label is known, only
+    until they leave after it; labels beyond the goal's are not pushed,
+    as the goal is settled before any of them.
     """
 
     import math
 
-    day = 24 * 3600
+    day = DAY
 
-    def roll_forward(base_ts: float, target_ts: float) -> float:
+    def roll_forward(base_ts: int, target_ts: int) -> int:
         """Roll ``target_ts`` forward in 24h steps until it is >= ``base_ts``.
 
-        Both arguments are absolute timestamps (seconds since epoch).
+        Both arguments are absolute times in seconds.
         """
-
-    start_ts = start_time.timestamp()
-
-    # dist: minimal elapsed time; cur_abs_time: absolute arrival timestamp
+        if target_ts < base_ts:
+            target_ts += (base_ts - target_ts + day - 1) // day * day
+        return target_ts
+
+    start_ts = start_time
+
+    if departures is None:
+        departures = build_departure_index(trains)
+
+    stop_station = trains.stop_station
+    stop_arr = trains.stop_arr
+    stop_dep = trains.stop_dep
+    dep_start = departures.start
+    dep_stops = departures.stops
+    dep_tod = departures.tod
+    dep_min = departures.min_dep
+    # earliest change time trains were changed at, per station
+    changed_at = array("q", [2 ** 62]) * trains.n_stations
+    goal_station = trains.station_ids.get(to_station, -1) if to_station is not None else -1
+    # elapsed time of the best label at the goal station so far
+    goal_cost = math.inf
+
+    # dist: minimal elapsed time; cur_abs_time: absolute arrival time
     dist: Dict[Hashable, float] = {}
     prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
-    cur_abs_time: Dict[Hashable, float] = {}
+    cur_abs_time: Dict[Hashable, int] = {}
     pq: List[Tuple[float, Hashable]] = []
 
     # Initialization: we are at from_station, waiting from start_ts
-    for t, i in station_index[from_station]:
-        stops = trains[t]
-        cur = stops[i]
-
+    for s in station_index[trains.station_ids.get(from_station, -1)]:
         # 需要至少一个后续区间
-        if i + 1 >= len(stops):
+        if s + 1 >= trains.train_end(s):
             continue
 
-        seg_from = cur
-        seg_to = stops[i + 1]
-
-        dep_raw = seg_from["dep"].timestamp()
         # earliest departure we can catch on this train
-        dep = roll_forward(start_ts, dep_raw)
-        arr_raw = seg_to["arr"].timestamp()
-        if arr_raw < dep:
-            arr_raw += day
-        arrival_abs = arr_raw
+        dep = roll_forward(start_ts, stop_dep[s])
+        arrival_abs = stop_arr[s + 1]
+        if arrival_abs < dep:
+            arrival_abs += day
 
-        state = (t, i + 1)
+        state = s + 1
         travel_time = arrival_abs - start_ts  # 从 start_ts 到这里的总耗时
-        if travel_time < dist.get(state, math.inf):
+        if travel_time < dist.get(state, math.inf) and travel_time <= goal_cost:
+            if stop_station[state] == goal_station:
+                goal_cost = travel_time
             dist[state] = travel_time
             cur_abs_time[state] = arrival_abs
-            prev[state] = (None, {
-                "train": t,
-                "from_islno": seg_from["islno"],
-                "to_islno": seg_to["islno"],
-            })
+            prev[state] = (None, s)
             pq.append((travel_time, state))
 
     if not pq:
         return prev, dist, None
 
     heapq.heapify(pq)
-
-    def is_goal(state):
-        t, idx = state
-        return trains[t][idx]["station"] == to_station
+    push, pop = heapq.heappush, heapq.heappop
+    if stats is not None:
+        push, pop, on_settle = stats.instrument(pq, on_settle)
+        roll_forward = stats.count_calls(roll_forward)
 
     best_goal_state = None
 
     while pq:
-        cur_cost, state = heapq.heappop(pq)
+        cur_cost, state = pop(pq)
         if cur_cost != dist.get(state, math.inf):
             continue
+        if on_settle is not None and on_settle(state):
+            break
 
-        if is_goal(state):
+        station = stop_station[state]
+        if station == goal_station:
             best_goal_state = state
             break
 
-        t, idx = state
-        stops = trains[t]
-        cur = stops[idx]
         current_time = cur_abs_time[state]
 
         # 1) 继续坐同一辆车
-        if idx + 1 < len(stops):
-            seg_from = cur
-            seg_to = stops[idx + 1]
-
-            dep_raw = seg_from["dep"].timestamp()
-            dep = roll_forward(current_time, dep_raw)
-            arr_raw = seg_to["arr"].timestamp()
-            if arr_raw < dep:
-                arr_raw += day
-            arrival_abs = arr_raw
-
-            new_state = (t, idx + 1)
+        if state + 1 < trains.train_end(state):
+            dep = roll_forward(current_time, stop_dep[state])
+            arrival_abs = stop_arr[state + 1]
+            if arrival_abs < dep:
+                arrival_abs += day
+
+            new_state = state + 1
             new_cost = arrival_abs - start_ts
-            if new_cost < dist.get(new_state, math.inf):
+            if new_cost < dist.get(new_state, math.inf) and new_cost <= goal_cost:
+                if stop_station[new_state] == goal_station:
+                    goal_cost = new_cost
                 dist[new_state] = new_cost
                 cur_abs_time[new_state] = arrival_abs
-                prev[new_state] = (state, {
-                    "train": t,
-                    "from_islno": seg_from["islno"],
-                    "to_islno": seg_to["islno"],
-                })
-                heapq.heappush(pq, (new_cost, new_state))
+                prev[new_state] = (state, state)
+                push(pq, (new_cost, new_state))
 
         # 2) 在当前站换乘到别的车
-        station = cur["station"]
-        for t2, i2 in station_index[station]:
-            if t2 == t and i2 == idx:
-                continue
-            stops2 = trains[t2]
-            if i2 + 1 >= len(stops2):
+        earliest = current_time + change_time_seconds
+        if earliest >= changed_at[station]:
+            continue
+        changed_at[station] = earliest
+        a = dep_start[station]
+        b = dep_start[station + 1]
+        earliest_tod = earliest % day
+        i = bisect_left(dep_tod, earliest_tod, a, b)
+        # departures leave at earliest + wait, in order of wait; a train
+        # boarded two or more days late may arrive a day after its first
+        # departure instead, so that bounds how early anything can arrive
+        horizon = start_ts + goal_cost
+        if dep_min[station] + day <= horizon:
+            horizon = math.inf
+        for j in chain(range(i, b), range(a, i)):
+            wait = dep_tod[j] - earliest_tod
+            if earliest + (wait if wait >= 0 else wait + day) > horizon:
+                break
+            s2 = dep_stops[j]
+            if s2 == state:
                 continue
 
-            seg_from2 = stops2[i2]
-            seg_to2 = stops2[i2 + 1]
-
-            earliest = current_time + change_time_seconds
-            dep_raw = seg_from2["dep"].timestamp()
-            dep = roll_forward(earliest, dep_raw)
-            arr_raw = seg_to2["arr"].timestamp()
-            if arr_raw < dep:
-                arr_raw += day
-            arrival_abs = arr_raw
+            dep = roll_forward(earliest, stop_dep[s2])
+            arrival_abs = stop_arr[s2 + 1]
+            if arrival_abs < dep:
+                arrival_abs += day
 
-            new_state = (t2, i2 + 1)
+            new_state = s2 + 1
             new_cost = arrival_abs - start_ts
-            if new_cost < dist.get(new_state, math.inf):
+            if new_cost < dist.get(new_state, math.inf) and new_cost <= goal_cost:
+                if stop_station[new_state] == goal_station:
+                    goal_cost = new_cost
                 dist[new_state] = new_cost
                 cur_abs_time[new_state] = arrival_abs
-                prev[new_state] = (state, {
-                    "train": t2,
-                    "from_islno": seg_from2["islno"],
-                    "to_islno": seg_to2["islno"],
-                })
-                heapq.heappush(pq, (new_cost, new_state))
+                prev[new_state] = (state, s2)
+                push(pq, (new_cost, new_state))
 
     return prev, dist, best_goal_state
@@ -0,0 +1,283 @@
+"""Resident query server.
+
+Keeps compiled timetables loaded between requests, so a query costs its
+search only: no interpreter start, imports or schedule loading.
+
+The protocol is plain HTTP/1.1 over TCP or a Unix socket (stdlib
+``asyncio`` only)::
+
+    POST /solve     problems in the problem file format, returns solutions
+    GET  /health    "ok"
+
+A ``/solve`` body is either CSV with the problem file header
+(``ProblemNo,FromStation,ToStation,Schedule,ChangeTime,CostFunction``) or,
+with ``Content-Type: application/json``, one problem object or a list of
+them with the same keys. The answer uses the same format: CSV rows
+``ProblemNo,Connection,Cost`` or JSON objects with those keys. The problems
+of one request are solved like a batch from a problem file, in groups
+sharing an origin search; with a result cache, only the problems it cannot
+answer are solved.
+
+Requests are solved on a worker pool: a single thread (so one set of warm
+schedules is shared by every request) or, with ``workers > 1``, that many
+processes, each keeping its own schedules warm.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import sys
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+
+import solver
+from result_cache import ResultCache
+
+PROBLEM_COLUMNS = ("ProblemNo", "FromStation", "ToStation", "Schedule", "ChangeTime", "CostFunction")
+SOLUTION_COLUMNS = ("ProblemNo", "Connection", "Cost")
+
+# largest accepted request body
+MAX_BODY = 64 << 20
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """A malformed request; answered with ``status`` and the message."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_problems(body: bytes, json_body: bool) -> Tuple[List[Dict[str, Any]], bool]:
+    """Problems of a ``/solve`` body, and whether it held a single JSON object.
+
+    Besides the columns, the cost function and an integer change time are
+    checked, so that a bad problem is answered 400 rather than failing the
+    whole batch.
+    """
+    try:
+        text = body.decode("utf-8")
+        if json_body:
+            data = json.loads(text)
+            single = isinstance(data, dict)
+            problems = [data] if single else data
+            if not isinstance(problems, list) or not all(isinstance(p, dict) for p in problems):
+                raise RequestError(400, "expected a problem object or a list of them")
+            problems = [{k: str(v) for k, v in p.items()} for p in problems]
+        else:
+            single = False
+            problems = list(csv.DictReader(io.StringIO(text)))
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        raise RequestError(400, f"unreadable problems: {e}")
+
+    for p in problems:
+        missing = [c for c in PROBLEM_COLUMNS if not p.get(c)]
+        if missing:
+            raise RequestError(400, f"problem {p.get('ProblemNo', '?')}: missing {', '.join(missing)}")
+        try:
+            solver._parse_cost_function(" ".join(p["CostFunction"].split()))
+            int(p["ChangeTime"])
+        except ValueError as e:
+            raise RequestError(400, f"problem {p['ProblemNo']}: {e}")
+    return problems, single
+
+
+def format_solutions(problems: List[Dict[str, Any]], results: Iterable[Tuple[str, Any]], json_body: bool,
+                     single: bool = False) -> bytes:
+    rows = [(p["ProblemNo"], conn, solver.cost_cell(cost)) for p, (conn, cost) in zip(problems, results)]
+    if json_body:
+        objects = [dict(zip(SOLUTION_COLUMNS, row)) for row in rows]
+        return json.dumps(objects[0] if single else objects).encode("utf-8")
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(SOLUTION_COLUMNS)
+    writer.writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+class QueryServer:
+    """Answers problems from warm schedules on a worker pool.
+
+    ``schedules`` are loaded up front (and inherited by forked workers);
+    any other schedule is loaded on its first request and then kept.
+    """
+
+    def __init__(self, workers: int = 1, engines: Dict[str, str] | None = None, schedules: Iterable[str] = (),
+                 force_schedule: str | None = None, cache: ResultCache | None = None):
+        self.engines = engines
+        self.cache = cache
+        self.force_schedule = force_schedule
+        schedules = sorted(set(schedules) | ({force_schedule} if force_schedule else set()))
+        self.executor: Executor
+        if workers > 1:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+            if ctx.get_start_method() == "fork":
+                solver._preload(schedules)
+            self.executor = ProcessPoolExecutor(workers, mp_context=ctx, initializer=solver._preload,
+                                                initargs=(schedules,))
+        else:
+            # one thread: the schedules in solver._worker_cache are never loaded concurrently
+            solver._preload(schedules)
+            self.executor = ThreadPoolExecutor(1)
+        self.server: asyncio.AbstractServer | None = None
+
+    async def solve(self, problems: List[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+        """Solve ``problems``, one pool task per batch group; in input order."""
+        if self.force_schedule is not None:
+            problems = [{**p, "Schedule": self.force_schedule} for p in problems]
+        if self.cache is not None:
+            lookup = self.cache.lookup(problems, solver._resolved_engines(self.engines))
+            results = lookup.complete(await self._solve(lookup.todo),
+                                      keep=lambda result: result[1] != solver.ERROR_COST)
+            self.cache.flush()
+            return results
+        return await self._solve(problems)
+
+    async def _solve(self, problems: List[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+        groups: Dict[Tuple[str, str, str, int], List[int]] = defaultdict(list)
+        for i, p in enumerate(problems):
+            groups[solver._group_key(p)].append(i)
+
+        loop = asyncio.get_running_loop()
+        members_list = list(groups.values())
+        futures = [loop.run_in_executor(self.executor, solver._solve_task, [problems[i] for i in members],
+                                        self.engines)
+                   for members in members_list]
+        results: List[Tuple[str, Any]] = [("", solver.ERROR_COST)] * len(problems)
+        for members, group_results in zip(members_list, await asyncio.gather(*futures, return_exceptions=True)):
+            if isinstance(group_results, BaseException):
+                continue  # the worker process died; its problems stay failed
+            for i, res in zip(members, group_results):
+                results[i] = res
+        return results
+
+    async def _respond(self, method: str, path: str, headers: Dict[str, str], body: bytes
+                       ) -> Tuple[int, str, bytes]:
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            return 200, "text/plain", b"ok"
+        if path != "/solve":
+            raise RequestError(404, f"no such endpoint: {path}")
+        if method != "POST":
+            raise RequestError(405, "use POST")
+        json_body = headers.get("content-type", "").split(";")[0].strip() == "application/json"
+        problems, single = parse_problems(body, json_body)
+        results = await self.solve(problems)
+        return 200, "application/json" if json_body else "text/csv", format_solutions(
+            problems, results, json_body, single)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve the requests of one connection (keep-alive unless the client closes)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+
+                try:
+                    parts = request_line.decode("latin-1").split()
+                    if len(parts) != 3:
+                        raise RequestError(400, "malformed request line")
+                    if length < 0 or length > MAX_BODY:
+                        # the body cannot be skipped reliably, so the connection ends here
+                        keep_alive = False
+                        raise RequestError(400 if length < 0 else 413, "bad request body length")
+                    body = await reader.readexactly(length)
+                    status, content_type, payload = await self._respond(parts[0], parts[1], headers, body)
+                except RequestError as e:
+                    status, content_type, payload = e.status, "text/plain", str(e).encode("utf-8")
+                except Exception as e:
+                    # still an answer, and the connection stays usable
+                    print(f"request {parts[1]}: {type(e).__name__}: {e}", file=sys.stderr)
+                    status, content_type, payload = 500, "text/plain", f"{type(e).__name__}: {e}".encode("utf-8")
+
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000, unix_socket: str | None = None
+                    ) -> asyncio.AbstractServer:
+        """Start listening on ``host:port``, or on ``unix_socket`` if given."""
+        if unix_socket is not None:
+            self.server = await asyncio.start_unix_server(self.handle, unix_socket)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+
+async def request(problems: List[Dict[str, Any]], host: str = "127.0.0.1", port: int = 8000,
+                  unix_socket: str | None = None) -> List[Dict[str, str]]:
+    """Client: solve ``problems`` on a running server; returns the solution rows."""
+    if unix_socket is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_socket)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        body = json.dumps(problems).encode("utf-8")
+        writer.write(f"POST /solve HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        payload = await reader.readexactly(length)
+    finally:
+        writer.close()
+    status = int(status_line.split()[1])
+    if status != 200:
+        raise RequestError(status, payload.decode("utf-8", "replace"))
+    return json.loads(payload)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8000, unix_socket: str | None = None, **kwargs):
+    """Run a :class:`QueryServer` until cancelled."""
+    query_server = QueryServer(**kwargs)
+    server = await query_server.start(host, port, unix_socket)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await query_server.close()
@@ -1,169 +1,970 @@
+import contextlib
 import csv
-from typing import Dict, Any, List, Tuple
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Set, Tuple
+
+from schedule_utils import parse_hhmmss, build_departure_index
+from schedule_cache import load_compiled
+from search import (dijkstra, astar, bidirectional_dijkstra, path_segments, dijkstra_arrivaltime, price_zero_one,
+                    DenseDijkstra, SearchStats)
+from formatter import build_connection_string, format_clock, format_duration
+from graph_builder import ScheduleGraph, PRICE_LEVELS, build_graph_stops, build_graph_timeintrain, build_graph_price
+from result_cache import ResultCache
+from schedule_manager import ScheduleManager
+
+# Search engines selectable per cost function; the first one is the default.
+ENGINES: Dict[str, Tuple[str, ...]] = {
+    "stops": ("dijkstra", "dense", "bidirectional", "alt", "ch"),
+    "timeintrain": ("dijkstra", "dense", "bidirectional", "alt"),
+    "price": ("dijkstra", "dense", "zero_one"),
+    "arrivaltime": ("dijkstra", "csa", "raptor", "trip"),
+    "arrivalprofile": ("csa",),
+}
+
+
+# Problems read, solved and written at a time; bounds memory on huge problem files.
+CHUNK_SIZE = 10000
+
+
+def _iter_problems(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _solved_problem_nos(output_file: str) -> Set[str]:
+    """``ProblemNo``s already written to ``output_file`` (empty if it does not exist).
+
+    A row torn by a crash mid-write is cut off, so appending continues on a
+    line of its own.
+    """
+    try:
+        f = open(output_file, "r+b")
+    except FileNotFoundError:
+        return set()
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            block = min(pos, 1 << 16)
+            f.seek(pos - block)
+            nl = f.read(block).rfind(b"\n")
+            if nl >= 0:
+                pos = pos - block + nl + 1
+                break
+            pos -= block
+        if pos < end:
+            f.truncate(pos)
+
+    with open(output_file, newline="", encoding="utf-8") as f:
+        return {row["ProblemNo"] for row in csv.DictReader(f)}
+
+
+def load_schedule_data(schedule_file: str) -> Dict[str, Any]:
+    """Load a schedule for solving; derived indexes are added to it on first use."""
+    # compiled timetable next to the csv, rebuilt when the csv changes
+    trains, station_index = load_compiled(schedule_file)
+    return {
+        "schedule_file": schedule_file,
+        "trains": trains,
+        "station_index": station_index,
+        # query-independent graphs, shared by every problem on this schedule
+        "graph": ScheduleGraph(trains, station_index),
+    }
+
+
+def _get_schedule(trains_cache: Dict[str, Dict[str, Any]] | ScheduleManager, schedule_file: str):
+    if isinstance(trains_cache, ScheduleManager):
+        return trains_cache.get(schedule_file)
+    if schedule_file not in trains_cache:
+        trains_cache[schedule_file] = load_schedule_data(schedule_file)
+    return trains_cache[schedule_file]
 
-from schedule_utils import load_schedule, build_station_index, parse_hhmmss
-from search import dijkstra, reconstruct_path, dijkstra_arrivaltime
-from formatter import build_connection_string
 
+def _get_connections(schedule_data: Dict[str, Any]):
+    """Departure-sorted connection array for CSA, built on first use."""
+    if "connections" not in schedule_data:
+        from csa import ConnectionArray
 
-def _load_problems(path: str) -> List[Dict[str, Any]]:
-    with open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return [row for row in reader]
+        schedule_data["connections"] = ConnectionArray(schedule_data["trains"])
+    return schedule_data["connections"]
 
 
-def _get_schedule(trains_cache: Dict[str, Dict[str, Any]], schedule_file: str):
-    if schedule_file not in trains_cache:
-        trains_cache[schedule_file] = {
-            "trains": load_schedule(schedule_file),
-        }
-        trains_cache[schedule_file]["station_index"] = build_station_index(trains_cache[schedule_file]["trains"])
-    return trains_cache[schedule_file]
+def _get_departures(schedule_data: Dict[str, Any]):
+    """Per-station departures sorted by time of day, built on first use."""
+    if "departures" not in schedule_data:
+        schedule_data["departures"] = build_departure_index(schedule_data["trains"])
+    return schedule_data["departures"]
 
 
-def _solve_single(problem: Dict[str, Any], trains_cache: Dict[str, Dict[str, Any]]) -> Tuple[str, Any]:
-    from_station = problem["FromStation"].strip()
-    to_station = problem["ToStation"].strip()
-    schedule_name = problem["Schedule"].strip()
-    change_time = int(problem["ChangeTime"]) * 60  # minutes -> seconds
-
+def _get_transfers(schedule_data: Dict[str, Any], change_time: int):
+    """Trip-based transfer set for ``change_time``, loaded (or built) on first use."""
+    transfers = schedule_data.setdefault("transfers", {})
+    if change_time not in transfers:
+        from trip_based import TransferSet, load_transfers
+
+        if schedule_data["schedule_file"] is None:  # amended in memory only
+            transfers[change_time] = TransferSet.build(schedule_data["trains"], _get_departures(schedule_data),
+                                                       change_time)
+        else:
+            transfers[change_time] = load_transfers(schedule_data["schedule_file"], schedule_data["trains"],
+                                                    _get_departures(schedule_data), change_time)
+    return transfers[change_time]
+
+
+def _get_landmarks(schedule_data: Dict[str, Any], metric: str):
+    """ALT landmark distances for ``metric``, computed on first use."""
+    landmarks = schedule_data.setdefault("landmarks", {})
+    if metric not in landmarks:
+        from landmarks import Landmarks
+
+        landmarks[metric] = Landmarks(schedule_data["graph"], metric)
+    return landmarks[metric]
+
+
+def _get_dense(schedule_data: Dict[str, Any], metric: str) -> DenseDijkstra:
+    """Reusable array-backed search for ``metric``, allocated on first use."""
+    dense = schedule_data.setdefault("dense", {})
+    if metric not in dense:
+        dense[metric] = DenseDijkstra(schedule_data["graph"], metric)
+    return dense[metric]
+
+
+def _get_reachability(schedule_data: Dict[str, Any]):
+    """Station reachability index, built on first use."""
+    if "reachability" not in schedule_data:
+        from reachability import Reachability
+
+        schedule_data["reachability"] = Reachability(schedule_data["graph"])
+    return schedule_data["reachability"]
+
+
+def _unreachable(schedule_data: Dict[str, Any], from_station: str, to_station: str) -> bool:
+    """Whether no train journey leads from ``from_station`` to a different ``to_station``.
+
+    Stations missing from the schedule are unreachable; a round trip
+    (``from_station == to_station``) is left to the search.
+    """
+    if from_station == to_station:
+        return False
+    station_ids = schedule_data["trains"].station_ids
+    a = station_ids.get(from_station, -1)
+    b = station_ids.get(to_station, -1)
+    return a < 0 or b < 0 or not _get_reachability(schedule_data).reaches(a, b)
+
+
+def _get_hierarchy(schedule_data: Dict[str, Any]):
+    """Contraction hierarchy of the stops graph, loaded (or built) on first use."""
+    if "hierarchy" not in schedule_data:
+        from contraction import ContractionHierarchy, load_hierarchy
+
+        if schedule_data["schedule_file"] is None:  # amended in memory only
+            schedule_data["hierarchy"] = ContractionHierarchy.build(schedule_data["graph"])
+        else:
+            schedule_data["hierarchy"] = load_hierarchy(schedule_data["schedule_file"], schedule_data["graph"])
+    return schedule_data["hierarchy"]
+
+
+def apply_schedule_delta(trains_cache: Dict[str, Dict[str, Any]], schedule_file: str, delta_file: str,
+                         cache: ResultCache | None = None, output_file: str | None = None):
+    """Amend the loaded ``schedule_file`` with the trains of ``delta_file``.
+
+    Its entry in ``trains_cache`` is patched rather than reloaded:
+    timetable, station index, graphs and CSA connections (see
+    ``timetable_delta``). Landmarks, dense search buffers, the
+    contraction hierarchy, trip-based transfer sets and the reachability
+    index are dropped and rebuilt on first use. ``schedule_file`` itself is
+    left alone.
+
+    With ``output_file``, the amended csv and its compiled timetable are
+    written there (without parsing the schedule), the amended schedule is
+    kept under that name in ``trains_cache`` as well, and results in
+    ``cache`` the delta cannot have changed are filed under it. Without,
+    the amended schedule matches no file, so its indexes are never read
+    from or written to disk, and no ``cache`` may be given.
+
+    Returns the ``TimetableUpdate`` and the number of cached results kept
+    and dropped.
+    """
+    if cache is not None and output_file is None:
+        raise ValueError("cached results can only be carried over to an output file")
+    from schedule_cache import write_compiled
+    from timetable_delta import apply_delta, read_delta, write_amended_schedule
+
+    schedule_data = _get_schedule(trains_cache, schedule_file)
+    delta = read_delta(delta_file)
+    update = apply_delta(schedule_data["trains"], schedule_data["station_index"], delta,
+                         schedule_data["graph"], schedule_data.get("connections"))
+
+    old = os.stat(schedule_file)
+    if output_file is not None:
+        write_amended_schedule(schedule_file, delta, output_file)
+        try:
+            write_compiled(output_file, update.trains, update.station_index)
+        except OSError:
+            pass
+        trains_cache[output_file] = schedule_data
+    # the csv that .ch / .tb files are checked against and stored next to
+    schedule_data["schedule_file"] = output_file
+
+    for key in ("connections", "departures", "landmarks", "dense", "hierarchy", "transfers", "reachability"):
+        schedule_data.pop(key, None)
+    schedule_data["trains"] = update.trains
+    schedule_data["station_index"] = update.station_index
+    schedule_data["graph"] = update.graph
+    if update.connections is not None:
+        schedule_data["connections"] = update.connections
+
+    carried = (0, 0)
+    if cache is not None:
+        carried = cache.carry_over(schedule_file, old, output_file, os.stat(output_file),
+                                   lambda key, result: update.still_valid(key[3], result[0]))
+    return update, carried
+
+
+def _engine(engines: Dict[str, str] | None, cost_function: str) -> str:
+    engine = (engines or {}).get(cost_function, ENGINES[cost_function][0])
+    if engine not in ENGINES[cost_function]:
+        raise ValueError(f"Unknown engine {engine} for {cost_function}")
+    return engine
+
+
+def _resolved_engines(engines: Dict[str, str] | None) -> Dict[str, str]:
+    """The engine of every cost function, defaults filled in (result cache keys)."""
+    return {cost_function: _engine(engines, cost_function) for cost_function in ENGINES}
+
+
+def _parse_cost_function(raw_cf: str) -> Tuple[str, Any]:
     # CostFunction can be e.g. "stops", "timeintrain", "price",
-    # or "arrivaltime 19:00:00" (with target arrival time).
-    raw_cf = problem["CostFunction"].strip()
+    # "arrivaltime 19:00:00" (with target arrival time), or
+    # "arrivalprofile 06:00:00-12:00:00" (with a departure window).
     parts = raw_cf.split()
     cost_function = parts[0]
     target_time_str = parts[1] if len(parts) > 1 else None
 
-    schedule_data = _get_schedule(trains_cache, schedule_name)
+    if cost_function not in ENGINES:
+        # include raw value for easier debugging
+        raise ValueError(f"Unknown cost function {raw_cf}")
+    if cost_function == "arrivaltime":
+        if target_time_str is None:
+            raise ValueError("arrivaltime requires a start time, e.g. 'arrivaltime 11:30:00'")
+        return cost_function, parse_hhmmss(target_time_str)
+    if cost_function == "arrivalprofile":
+        window = (target_time_str or "").split("-")
+        if len(window) != 2:
+            raise ValueError("arrivalprofile requires a departure window, e.g. 'arrivalprofile 06:00:00-12:00:00'")
+        window_start, window_end = parse_hhmmss(window[0]), parse_hhmmss(window[1])
+        if window_start > window_end:
+            raise ValueError(f"Empty departure window in {raw_cf}")
+        return cost_function, (window_start, window_end)
+    return cost_function, None
+
+
+def _search(schedule_data: Dict[str, Any], cost_function: str, from_station: str, to_station: str | None,
+            start_time: int | None, change_time: int, on_settle: Callable[[Any], bool] | None = None,
+            engine: str = "dijkstra", stats: SearchStats | None = None):
+    """Run the search for one cost function, returning (prev, dist, goal_node).
+
+    With ``to_station=None`` the search has no goal; it runs until every
+    reachable node is settled or ``on_settle`` (see ``search.dijkstra``)
+    stops it. ``on_settle`` is supported by the dijkstra engines and by the
+    price ``zero_one`` engine.
+
+    The goal-directed engines of stops / timeintrain (``bidirectional``,
+    ``alt``, ``ch``) need a ``to_station``; without one the plain dijkstra runs.
+    Like ``zero_one`` they find a path of the same cost, which can differ
+    from the dijkstra one when several paths are optimal.
+
+    ``stats`` collects the counters of the dijkstra engines (see
+    ``search.SearchStats``); other engines leave it untouched.
+
+    The ``dense`` engine returns views of buffers reused by the next
+    ``dense`` search on the same schedule, so its labels must be read first.
+    """
     trains = schedule_data["trains"]
     station_index = schedule_data["station_index"]
+    schedule_graph = schedule_data["graph"]
+    exhaustive = to_station is None
 
     # Dispatch to the specific strategy for each cost function
+    if exhaustive and engine in ("bidirectional", "alt", "ch"):
+        engine = "dijkstra"
+    if engine == "dense":
+        return _get_dense(schedule_data, cost_function).run(from_station, to_station, on_settle)
+
     if cost_function == "stops":
-        from graph_builder import build_graph_stops
+        graph, start_node, goal_station = build_graph_stops(schedule_graph, from_station, to_station)
 
-        graph, start_node, goal_station = build_graph_stops(trains, station_index, from_station, to_station)
+        def is_goal(node):
+            return not exhaustive and node == goal_station
+
+        if engine == "bidirectional":
+            goals = [goal_station] if goal_station >= 0 else []
+            return bidirectional_dijkstra(graph, schedule_graph.stops_reverse_edges, start_node, goals, on_settle)
+        if engine == "alt":
+            return astar(graph, start_node, is_goal, _get_landmarks(schedule_data, "stops").bound(goal_station),
+                         on_settle)
+        if engine == "ch":
+            found = _get_hierarchy(schedule_data).query(start_node, goal_station, on_settle)
+            if found is None:
+                return {}, {}, None
+            cost, stops = found
+            # the unpacked path as dijkstra-style labels over station ids
+            prev = {start_node: (None, None)}
+            node = start_node
+            for s in stops:
+                nxt = trains.stop_station[s + 1]
+                prev[nxt] = (node, s)
+                node = nxt
+            return prev, {node: cost}, node
+        return dijkstra(graph, start_node, is_goal, on_settle, stats)
+
+    elif cost_function == "timeintrain":
+        graph, start_nodes, goal_nodes = build_graph_timeintrain(schedule_graph, from_station, to_station)
+
+        super_source = -1
+        source_edges = [(n, 0, None) for n in start_nodes]
 
         def graph_wrap(node):
-            for nxt, w, e in graph(node):
-                yield nxt, w, e
+            if node == super_source:
+                return source_edges
+            return graph(node)
 
         def is_goal(node):
-            return node == goal_station
+            return node in goal_nodes
 
-        prev, dist, goal_node = dijkstra(graph_wrap, start_node, is_goal)
-        if goal_node is None:
-            return "", float("inf")
+        if engine == "bidirectional":
+            return bidirectional_dijkstra(graph_wrap, schedule_graph.timeintrain_reverse_expander(), super_source,
+                                          goal_nodes, on_settle)
+        if engine == "alt":
+            station_bound = _get_landmarks(schedule_data, "timeintrain").bound(
+                trains.station_ids.get(to_station, -1))
+            stop_station = trains.stop_station
 
-        segments = reconstruct_path(prev, goal_node)
-        conn_str = build_connection_string(segments)
-        return conn_str, dist[goal_node]
+            def heuristic(node):
+                return 0.0 if node == super_source else station_bound(stop_station[node])
 
-    elif cost_function == "timeintrain":
-        from graph_builder import build_graph_timeintrain
+            return astar(graph_wrap, super_source, is_goal, heuristic, on_settle)
+        return dijkstra(graph_wrap, super_source, is_goal, on_settle, stats)
 
-        graph, start_nodes, goal_nodes = build_graph_timeintrain(trains, station_index, from_station, to_station)
+    elif cost_function == "arrivaltime" and engine == "csa":
+        from csa import csa_arrivaltime
 
-        super_source = ("SOURCE",)
+        prev, dist, goals = csa_arrivaltime(
+            trains, _get_connections(schedule_data), from_station,
+            None if exhaustive else [to_station], start_time, change_time,
+        )
+        return prev, dist, goals.get(trains.station_ids.get(to_station, -1))
 
-        def graph_wrap(node):
-            if node == super_source:
-                for n in start_nodes:
-                    yield n, 0.0, None
-                return
-            for nxt, w, e in graph(node):
-                yield nxt, w, e
+    elif cost_function == "arrivaltime" and engine == "raptor":
+        from raptor import raptor_arrivaltime
 
-        def is_goal(node):
-            return node in goal_nodes
+        prev, dist, goals = raptor_arrivaltime(
+            trains, station_index, from_station, None if exhaustive else [to_station], start_time, change_time
+        )
+        return prev, dist, goals.get(trains.station_ids.get(to_station, -1))
 
-        prev, dist, goal_node = dijkstra(graph_wrap, super_source, is_goal)
-        if goal_node is None:
-            return "", float("inf")
-        segments = reconstruct_path(prev, goal_node)
-        conn_str = build_connection_string(segments)
-        return conn_str, dist[goal_node]
+    elif cost_function == "arrivaltime" and engine == "trip":
+        from trip_based import trip_arrivaltime
 
-    elif cost_function == "arrivaltime":
-        if target_time_str is None:
-            raise ValueError("arrivaltime requires a start time, e.g. 'arrivaltime 11:30:00'")
-        start_time = parse_hhmmss(target_time_str)
+        prev, dist, goals = trip_arrivaltime(
+            trains, station_index, _get_transfers(schedule_data, change_time), from_station,
+            None if exhaustive else [to_station], start_time,
+        )
+        return prev, dist, goals.get(trains.station_ids.get(to_station, -1))
 
+    elif cost_function == "arrivaltime":
         # 使用 specialised arrivaltime dijkstra，它直接以 start_time 为 0
         # 返回每个状态的最小总耗时（秒）
-        prev, dist, goal_state = dijkstra_arrivaltime(
+        return dijkstra_arrivaltime(
             trains,
             station_index,
             from_station,
             to_station,
             start_time,
             change_time,
+            on_settle,
+            stats,
+            _get_departures(schedule_data),
         )
-        if goal_state is None:
-            return "", float("inf")
-
-        segments = reconstruct_path(prev, goal_state)
-        conn_str = build_connection_string(segments)
-
-        # dijkstra_arrivaltime already measures time from start_time,
-        # so dist[goal_state] is the total travel time in seconds
-        total_sec = int(dist[goal_state])
-        days, rem = divmod(total_sec, 24 * 3600)
-        hours, rem = divmod(rem, 3600)
-        minutes, seconds = divmod(rem, 60)
-        cost_str = f"{days:02d}:{hours:02d}:{minutes:02d}:{seconds:02d}"
-        return conn_str, cost_str
 
-    elif cost_function == "price":
-        from graph_builder import build_graph_price
+    elif engine == "zero_one":
+        return price_zero_one(schedule_graph, from_station, to_station, on_settle)
 
-        graph, start_states, goal_states = build_graph_price(trains, station_index, from_station, to_station)
-        super_source = ("SOURCE",)
+    else:
+        graph, start_states, goal_stops = build_graph_price(schedule_graph, from_station, to_station)
+        super_source = -1
+        source_edges = [(n, 0, None) for n in start_states]
 
         def graph_wrap(node):
             if node == super_source:
-                for n in start_states:
-                    yield n, 0.0, None
-                return
-            for nxt, w, e in graph(node):
-                yield nxt, w, e
+                return source_edges
+            return graph(node)
 
         def is_goal(node):
-            return node in goal_states
+            return node >= 0 and node // PRICE_LEVELS in goal_stops
 
-        prev, dist, goal_node = dijkstra(graph_wrap, super_source, is_goal)
-        if goal_node is None:
-            return "", float("inf")
+        return dijkstra(graph_wrap, super_source, is_goal, on_settle, stats)
 
-        segments = reconstruct_path(prev, goal_node)
-        conn_str = build_connection_string(segments)
-        # dist[goal_node] already represents the minimal ticket price
-        return conn_str, dist[goal_node]
 
-    else:
-        # include raw value for easier debugging
-        raise ValueError(f"Unknown cost function {raw_cf}")
+def _node_station(trains, cost_function: str, node) -> int:
+    """Station id a search node of ``cost_function`` is at (-1 for sources)."""
+    if node < 0 or cost_function == "stops":
+        return node
+    if cost_function == "price":
+        node //= PRICE_LEVELS
+    return trains.stop_station[node]
 
 
-def solve_problems(problem_file: str, output_file: str, force_schedule: str | None = None):
-    problems = _load_problems(problem_file)
-    trains_cache: Dict[str, Dict[str, Any]] = {}
+def _result(trains, cost_function: str, prev, dist, goal_node) -> Tuple[str, Any]:
+    if goal_node is None:
+        return "", float("inf")
 
-    with open(output_file, "w", newline="", encoding="utf-8") as f_out:
-        writer = csv.writer(f_out)
-        writer.writerow(["ProblemNo", "Connection", "Cost"])
+    conn_str = build_connection_string(path_segments(trains, prev, goal_node))
+    if cost_function == "arrivaltime":
+        # dijkstra_arrivaltime already measures time from start_time,
+        # so dist[goal_node] is the total travel time in seconds
+        return conn_str, format_duration(dist[goal_node])
+    # for price, dist[goal_node] already represents the minimal ticket price
+    return conn_str, dist[goal_node]
+
+
+def _profile(schedule_data: Dict[str, Any], from_station: str, to_station: str,
+             window: Tuple[int, int], change_time: int) -> List[Tuple[int, int, str]]:
+    from csa import csa_profile
+
+    trains = schedule_data["trains"]
+    entries = csa_profile(trains, _get_connections(schedule_data), from_station, to_station,
+                          window[0], window[1], change_time)
+    return [
+        (e.dep, e.arr, build_connection_string([trains.segment(s) for s in e.path()]))
+        for e in entries
+    ]
+
+
+def arrival_profile(trains_cache: Dict[str, Dict[str, Any]], schedule_file: str, from_station: str,
+                    to_station: str, window_start: str, window_end: str,
+                    change_time_minutes: int = 0) -> List[Tuple[int, int, str]]:
+    """Pareto-optimal journeys departing within ``[window_start, window_end]``.
+
+    Returns ``(departure, arrival, connection)`` tuples ordered by departure,
+    with times in seconds since midnight of the query day (arrivals may lie
+    on later days). Every departure time in the window is best served by the
+    first journey departing at or after it.
+    """
+    schedule_data = _get_schedule(trains_cache, schedule_file)
+    window = (parse_hhmmss(window_start), parse_hhmmss(window_end))
+    return _profile(schedule_data, from_station.strip(), to_station.strip(), window, change_time_minutes * 60)
+
+
+def arrival_transfer_front(trains_cache: Dict[str, Dict[str, Any]], schedule_file: str, from_station: str,
+                           to_station: str, start_time: str, change_time_minutes: int = 0,
+                           max_changes: int | None = None) -> List[Tuple[int, int, str]]:
+    """Pareto front of arrival time against number of changes.
+
+    Returns ``(changes, arrival, connection)`` tuples with strictly
+    decreasing arrival as the number of changes grows; ``arrival`` is in
+    seconds since midnight of the query day. The first tuple is the journey
+    with the fewest changes, the last one the earliest arrival. With
+    ``max_changes`` only journeys with at most that many changes are searched.
+    """
+    from raptor import raptor
+
+    schedule_data = _get_schedule(trains_cache, schedule_file)
+    trains = schedule_data["trains"]
+    target = trains.station_ids.get(to_station.strip(), -1)
+    if target < 0:
+        return []
+    result = raptor(trains, schedule_data["station_index"], from_station.strip(), parse_hhmmss(start_time),
+                    change_time_minutes * 60, target,
+                    None if max_changes is None else max_changes + 1)
+    return [
+        (changes, arr, build_connection_string([trains.segment(s) for _, b, a in rides for s in range(b, a)]))
+        for changes, arr, rides in result.pareto(target)
+        if rides
+    ]
+
+
+def _solve_single(problem: Dict[str, Any], trains_cache: Dict[str, Dict[str, Any]],
+                  engines: Dict[str, str] | None = None, stats: Dict[str, Any] | None = None) -> Tuple[str, Any]:
+    """Solve one problem.
+
+    ``stats``, if given, receives the engine, the seconds spent per phase
+    (``schedule_s``, ``search_s``, ``result_s``) and the ``SearchStats``
+    of the search under ``"search"``.
+    """
+    from_station = problem["FromStation"].strip()
+    to_station = problem["ToStation"].strip()
+    schedule_name = problem["Schedule"].strip()
+    change_time = int(problem["ChangeTime"]) * 60  # minutes -> seconds
+    cost_function, start_time = _parse_cost_function(problem["CostFunction"].strip())
+    engine = _engine(engines, cost_function)
+    if stats is not None:
+        stats["engine"] = engine
+        stats["search"] = SearchStats()
+        t0 = time.perf_counter()
 
-        for p in problems:
-            if force_schedule is not None:
-                p["Schedule"] = force_schedule
+    schedule_data = _get_schedule(trains_cache, schedule_name)
+    if stats is not None:
+        t1 = time.perf_counter()
+        stats["schedule_s"] = t1 - t0
+    if _unreachable(schedule_data, from_station, to_station):
+        # no connection under any cost function, no need to search
+        if stats is not None:
+            stats["search_s"] = time.perf_counter() - t1
+        return "", float("inf")
+    if cost_function == "arrivalprofile":
+        journeys = _profile(schedule_data, from_station, to_station, start_time, change_time)
+        if stats is not None:
+            stats["search_s"] = time.perf_counter() - t1
+        if not journeys:
+            return "", float("inf")
+        # one journey per Pareto point: connection | connection ..., DEP+DURATION | ...
+        return (" | ".join(conn for _, _, conn in journeys),
+                " | ".join(f"{format_clock(dep)}+{format_duration(arr - dep)}" for dep, arr, _ in journeys))
+
+    prev, dist, goal_node = _search(schedule_data, cost_function, from_station, to_station, start_time, change_time,
+                                    engine=engine, stats=None if stats is None else stats["search"])
+    if stats is None:
+        return _result(schedule_data["trains"], cost_function, prev, dist, goal_node)
+    t2 = time.perf_counter()
+    stats["search_s"] = t2 - t1
+    result = _result(schedule_data["trains"], cost_function, prev, dist, goal_node)
+    stats["result_s"] = time.perf_counter() - t2
+    return result
+
+
+class OriginSearch:
+    """Single-source search that answers many destinations at once.
+
+    An early-exit search stops at the first settled node at the destination;
+    everything before that point is identical in a longer search, so
+    answering from the first settled node per station gives exactly the
+    connection (and cost) the single-problem search would have returned.
+
+    With ``targets`` the search stops once all of them are settled (or found
+    unreachable); without, it settles every reachable node. The csa engine
+    answers all targets from a single scan in the same way, the raptor and
+    trip engines from a single run of rounds.
+    """
+
+    def __init__(self, schedule_data: Dict[str, Any], cost_function: str, from_station: str,
+                 start_time: int | None = None, change_time: int = 0, targets: Iterable[str] | None = None,
+                 engine: str = "dijkstra"):
+        trains = self.trains = schedule_data["trains"]
+        self.cost_function = cost_function
+        # first settled node per station id
+        self.first_settled: Dict[int, Any] = {}
+        first_settled = self.first_settled
+
+        if cost_function == "arrivaltime" and engine == "csa":
+            from csa import csa_arrivaltime
+
+            self.prev, self.dist, self.first_settled = csa_arrivaltime(
+                trains, _get_connections(schedule_data), from_station, targets, start_time, change_time
+            )
+            return
+
+        if cost_function == "arrivaltime" and engine == "raptor":
+            from raptor import raptor_arrivaltime
+
+            self.prev, self.dist, self.first_settled = raptor_arrivaltime(
+                trains, schedule_data["station_index"], from_station, targets, start_time, change_time
+            )
+            return
+
+        if cost_function == "arrivaltime" and engine == "trip":
+            from trip_based import trip_arrivaltime
+
+            self.prev, self.dist, self.first_settled = trip_arrivaltime(
+                trains, schedule_data["station_index"], _get_transfers(schedule_data, change_time), from_station,
+                targets, start_time,
+            )
+            return
+
+        remaining = None
+        if targets is not None:
+            remaining = {trains.station_ids[t] for t in targets if t in trains.station_ids}
+            if not remaining:
+                self.prev, self.dist = {}, {}
+                return
 
-            conn, cost = _solve_single(p, trains_cache)
+        def on_settle(node) -> bool:
+            station = _node_station(trains, cost_function, node)
+            if station < 0 or station in first_settled:
+                return False
+            first_settled[station] = node
+            if remaining is not None:
+                remaining.discard(station)
+                return not remaining
+            return False
+
+        self.prev, self.dist, _ = _search(
+            schedule_data, cost_function, from_station, None, start_time, change_time, on_settle, engine
+        )
 
-            # arrivaltime returns a formatted string, other cost
-            # functions return numeric values
-            if isinstance(cost, (int, float)):
-                out_cost = int(cost) if cost != float("inf") else "inf"
-            else:
-                out_cost = cost
+    def solve(self, to_station: str) -> Tuple[str, Any]:
+        goal_node = self.first_settled.get(self.trains.station_ids.get(to_station, -1))
+        return _result(self.trains, self.cost_function, self.prev, self.dist, goal_node)
+
+    def cost_table(self) -> Dict[str, Any]:
+        """Station code -> optimal cost for every reachable station.
+
+        Costs are numeric in the units of the cost function (arrivaltime:
+        elapsed seconds since the start time).
+        """
+        codes = self.trains.station_codes
+        return {codes[st]: self.dist[node] for st, node in self.first_settled.items()}
+
+
+def origin_cost_table(trains_cache: Dict[str, Dict[str, Any]], schedule_file: str, from_station: str,
+                      cost_function: str, change_time_minutes: int = 0,
+                      engines: Dict[str, str] | None = None) -> Dict[str, Any]:
+    """Optimal cost from ``from_station`` to every reachable station.
+
+    ``cost_function`` uses the problem file syntax, e.g. ``"price"`` or
+    ``"arrivaltime 08:00:00"``.
+    """
+    cf, start_time = _parse_cost_function(cost_function.strip())
+    schedule_data = _get_schedule(trains_cache, schedule_file)
+    search = OriginSearch(schedule_data, cf, from_station.strip(), start_time, change_time_minutes * 60,
+                          engine=_engine(engines, cf))
+    return search.cost_table()
+
+
+def _group_key(problem: Dict[str, Any]) -> Tuple[str, str, str, int]:
+    """Problems with equal keys can be answered from one origin search."""
+    raw_cf = " ".join(problem["CostFunction"].split())
+    # only arrivaltime / arrivalprofile depend on the change time
+    change_time = int(problem["ChangeTime"]) if raw_cf.startswith("arrival") else 0
+    return problem["Schedule"].strip(), raw_cf, problem["FromStation"].strip(), change_time
+
+
+def _solve_batch(problems: List[Dict[str, Any]], trains_cache: Dict[str, Dict[str, Any]],
+                 engines: Dict[str, str] | None = None) -> List[Tuple[str, Any]]:
+    """Solve ``problems``, sharing one exhaustive search per group of problems
+    with the same schedule, cost function, origin and (arrivaltime) change time.
+
+    Groups of a single problem use the cheaper early-exit search. Problems
+    without any connection are answered from the reachability index, so
+    they neither need a search nor keep one running to exhaustion.
+    """
+    results: List[Tuple[str, Any]] = [("", float("inf"))] * len(problems)
+    for members, group_results in _iter_batch(problems, trains_cache, engines):
+        for i, res in zip(members, group_results):
+            results[i] = res
+    return results
+
+
+def _iter_batch(problems: List[Dict[str, Any]], trains_cache: Dict[str, Dict[str, Any]],
+                engines: Dict[str, str] | None = None) -> Iterator[Tuple[List[int], List[Tuple[str, Any]]]]:
+    """``_solve_batch`` group by group: the indices of each group's problems and their results."""
+    groups: Dict[Tuple[str, str, str, int], List[int]] = defaultdict(list)
+    for i, p in enumerate(problems):
+        groups[_group_key(p)].append(i)
+
+    # all groups of a schedule in a row, so each is needed once per batch
+    schedule_rank: Dict[str, int] = {}
+    for key in groups:
+        schedule_rank.setdefault(key[0], len(schedule_rank))
+    for (schedule_name, raw_cf, from_station, change_time), members in sorted(
+            groups.items(), key=lambda group: schedule_rank[group[0][0]]):
+        if len(members) > 1:
+            schedule_data = _get_schedule(trains_cache, schedule_name)
+            unreachable = [i for i in members
+                           if _unreachable(schedule_data, from_station, problems[i]["ToStation"].strip())]
+            if unreachable:
+                yield unreachable, [("", float("inf"))] * len(unreachable)
+                answered = set(unreachable)
+                members = [i for i in members if i not in answered]
+            if not members:
+                continue
+        if len(members) == 1 or raw_cf.startswith("arrivalprofile"):
+            # profiles are computed backwards from the target, nothing to share
+            for i in members:
+                yield [i], [_solve_single(problems[i], trains_cache, engines)]
+            continue
+        cost_function, start_time = _parse_cost_function(raw_cf)
+        targets = [problems[i]["ToStation"].strip() for i in members]
+        search = OriginSearch(schedule_data, cost_function, from_station, start_time, change_time * 60, targets,
+                              _engine(engines, cost_function))
+        yield members, [search.solve(problems[i]["ToStation"].strip()) for i in members]
+
+
+# Schedules loaded by the parent before starting worker processes. Forked
+# workers inherit them copy-on-write (the timetable columns are arrays or a
+# shared read-only memory map, so their pages are never copied); spawned
+# workers load them in _preload from the compiled cache instead.
+_worker_cache: Dict[str, Dict[str, Any]] = {}
+
+# Cost written for a problem whose solving raised.
+ERROR_COST = "error"
+
+
+def _preload(schedule_files: List[str]):
+    for schedule_file in schedule_files:
+        try:
+            _get_schedule(_worker_cache, schedule_file)
+        except OSError:
+            pass  # reported per problem when it is solved
+
+
+def _solve_isolated(problem: Dict[str, Any], trains_cache: Dict[str, Dict[str, Any]],
+                    engines: Dict[str, str] | None = None) -> Tuple[str, Any]:
+    try:
+        return _solve_single(problem, trains_cache, engines)
+    except Exception as e:
+        print(f"problem {problem['ProblemNo']}: {type(e).__name__}: {e}", file=sys.stderr)
+        return "", ERROR_COST
+
+
+def _solve_task(group: List[Dict[str, Any]], engines: Dict[str, str] | None = None,
+                trains_cache: Dict[str, Dict[str, Any]] | ScheduleManager | None = None) -> List[Tuple[str, Any]]:
+    """Worker entry point: solve one group of problems sharing an origin search.
+
+    Schedules come from ``trains_cache``, by default the worker's ``_worker_cache``.
+    """
+    if trains_cache is None:
+        trains_cache = _worker_cache
+    try:
+        return _solve_batch(group, trains_cache, engines)
+    except Exception:
+        # fall back to one problem at a time so only the failing ones are lost
+        return [_solve_isolated(p, trains_cache, engines) for p in group]
+
+
+def _iter_chunk(pool: ProcessPoolExecutor, problems: List[Dict[str, Any]], engines: Dict[str, str] | None = None
+                ) -> Iterator[Tuple[List[int], List[Tuple[str, Any]]]]:
+    """Solve ``problems`` on ``pool``, one task per batch group, yielding groups as they finish."""
+    groups: Dict[Tuple[str, str, str, int], List[int]] = defaultdict(list)
+    for i, p in enumerate(problems):
+        groups[_group_key(p)].append(i)
+    # biggest groups first, so a large group does not end up last on one core
+    tasks = sorted(groups.values(), key=len, reverse=True)
+
+    futures = {pool.submit(_solve_task, [problems[i] for i in members], engines): members
+               for members in tasks}
+    for future in as_completed(futures):
+        members = futures[future]
+        try:
+            group_results = future.result()
+        except Exception as e:
+            # the worker process itself died; its problems stay failed
+            print(f"problems {[problems[i]['ProblemNo'] for i in members]}: {type(e).__name__}: {e}",
+                  file=sys.stderr)
+            group_results = [("", ERROR_COST)] * len(members)
+        yield members, group_results
+
+
+def _solve_parallel(chunks: Iterable[List[Dict[str, Any]]], workers: int, engines: Dict[str, str] | None = None
+                    ) -> Iterator[Tuple[List[Dict[str, Any]], Iterator[Tuple[List[int], List[Tuple[str, Any]]]]]]:
+    """Solve each chunk of problems on one pool of ``workers`` processes.
+
+    Yields every chunk with its groups as ``_iter_chunk`` yields them; a
+    chunk's groups must be taken before the next chunk.
+
+    Schedules of the first chunk are preloaded; workers load any other
+    schedule on first use.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return
+    schedule_files = sorted({p["Schedule"].strip() for p in first})
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    if ctx.get_start_method() == "fork":
+        _preload(schedule_files)
+
+    try:
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_preload,
+                                 initargs=(schedule_files,)) as pool:
+            for problems in itertools.chain([first], chunks):
+                yield problems, _iter_chunk(pool, problems, engines)
+    finally:
+        _worker_cache.clear()
+
+
+def cost_cell(cost: Any) -> Any:
+    """Cost as written to the solution file."""
+    # arrivaltime returns a formatted string, other cost
+    # functions return numeric values
+    if isinstance(cost, (int, float)):
+        return int(cost) if cost != float("inf") else "inf"
+    return cost
+
+
+# Columns of a --stats sidecar; counters are empty for engines that do not collect them.
+STATS_COLUMNS = ("ProblemNo", "engine", "cached", "schedule_s", "search_s", "result_s",
+                 "pushed", "popped", "stale", "settled", "edges_relaxed", "peak_heap")
+
+
+def _stats_row(problem_no: str, record: Dict[str, Any] | None) -> Dict[str, Any]:
+    """Sidecar row of a problem; ``record`` is None for one answered from the cache."""
+    row: Dict[str, Any] = dict.fromkeys(STATS_COLUMNS)
+    row["ProblemNo"] = problem_no
+    row["cached"] = record is None
+    if record is not None:
+        for key in ("engine", "schedule_s", "search_s", "result_s"):
+            row[key] = record.get(key)
+        if record["search"].pushed:
+            row.update(record["search"].as_dict())
+    return row
+
+
+def solve_problems(problem_file: str, output_file: str, force_schedule: str | None = None, batch: bool = True,
+                   workers: int = 1, engines: Dict[str, str] | None = None, resume: bool = False,
+                   chunk_size: int = CHUNK_SIZE, cache: ResultCache | None = None, stats_file: str | None = None,
+                   schedules: ScheduleManager | None = None):
+    """Solve every problem in ``problem_file`` and write ``output_file``.
+
+    ``engines`` maps a cost function to one of its ``ENGINES`` (e.g.
+    ``{"arrivaltime": "csa"}``); unlisted cost functions use the default.
+
+    Problems are streamed: read and solved ``chunk_size`` at a time, and
+    batch groups are formed within a chunk. Rows are written in input
+    order, as soon as every problem up to them is answered, and flushed
+    after every batch group, so a crash loses at most the groups in
+    progress. With ``resume``, problems whose
+    ``ProblemNo`` is already in ``output_file`` are skipped and the new rows
+    are appended to it.
+
+    With a ``cache``, problems answered before (in this chunk, this run or,
+    with its disk tier, an earlier one) are not solved again; its hit and
+    miss counts are reported on stderr at the end.
+
+    ``stats_file`` gets a row of search counters and phase timings per
+    problem (``STATS_COLUMNS``), as JSON lines if it ends in ``.json`` or
+    ``.jsonl`` and as CSV otherwise. To give every problem a search of its
+    own, problems are then solved one by one in this process, regardless of
+    ``batch`` and ``workers``.
+
+    Problems solved in this process take their schedules from
+    ``schedules`` if given (instead of keeping every schedule loaded), which
+    is told the schedules of each chunk up front so it can load them ahead;
+    if it has a memory budget, its summary is reported on stderr at the end.
+    """
+    done = _solved_problem_nos(output_file) if resume else set()
+    problems: Iterable[Dict[str, Any]] = _iter_problems(problem_file)
+    if done:
+        problems = (p for p in problems if p["ProblemNo"] not in done)
+    if force_schedule is not None:
+        problems = ({**p, "Schedule": force_schedule} for p in problems)
+    chunks = _chunks(problems, chunk_size)
+    trains_cache: Dict[str, Dict[str, Any]] | ScheduleManager = {} if schedules is None else schedules
+
+    lookups = deque()
+    if cache is not None:
+        resolved = _resolved_engines(engines)
+
+        def cache_misses(chunks: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+            for chunk in chunks:
+                lookup = cache.lookup(chunk, resolved)
+                lookups.append((chunk, lookup))
+                yield lookup.todo
+
+        # the solvers below take one chunk and yield its results before
+        # taking the next, so lookups are completed in the same order
+        chunks = cache_misses(chunks)
+
+    # worker processes keep schedules of their own
+    in_process = stats_file is not None or workers <= 1
+    if schedules is not None and in_process:
+        def announced(chunks: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+            for chunk in chunks:
+                if stats_file is None and batch:
+                    # _solve_batch takes the schedules in order of first appearance
+                    schedules.expect(dict.fromkeys(p["Schedule"].strip() for p in chunk))
+                else:
+                    schedules.expect(p["Schedule"].strip() for p in chunk)
+                yield chunk
+
+        chunks = announced(chunks)
+
+    # every chunk with an iterator over its groups: the indices of their
+    # problems in the chunk and their results, in order of completion
+    records: Dict[str, Dict[str, Any]] = {}
+    if stats_file is not None:
+        def solve_measured(chunk: List[Dict[str, Any]]) -> Iterator[Tuple[List[int], List[Tuple[str, Any]]]]:
+            for i, p in enumerate(chunk):
+                records[p["ProblemNo"]] = record = {}
+                yield [i], [_solve_single(p, trains_cache, engines, record)]
+
+        solved = ((chunk, solve_measured(chunk)) for chunk in chunks)
+    elif workers > 1:
+        solved = _solve_parallel(chunks, workers, engines)
+    elif batch:
+        solved = ((chunk, _iter_batch(chunk, trains_cache, engines)) for chunk in chunks)
+    else:
+        solved = ((chunk, (([i], [_solve_single(p, trains_cache, engines)]) for i, p in enumerate(chunk)))
+                  for chunk in chunks)
 
-            writer.writerow([p["ProblemNo"], conn, out_cost])
+    with contextlib.ExitStack() as stack:
+        f_out = stack.enter_context(open(output_file, "a" if resume else "w", newline="", encoding="utf-8"))
+        writer = csv.writer(f_out)
+        if f_out.tell() == 0:
+            writer.writerow(["ProblemNo", "Connection", "Cost"])
+
+        f_stats = stats_writer = None
+        if stats_file is not None:
+            f_stats = stack.enter_context(open(stats_file, "a" if resume else "w", newline="", encoding="utf-8"))
+            if not stats_file.endswith((".json", ".jsonl")):
+                stats_writer = csv.DictWriter(f_stats, STATS_COLUMNS)
+                if f_stats.tell() == 0:
+                    stats_writer.writeheader()
+
+        for chunk, groups in solved:
+            lookup = None
+            results: List[Tuple[str, Any] | None] = [None] * len(chunk)
+            if cache is not None:
+                # the groups index the cache misses; hits are answered already
+                chunk, lookup = lookups.popleft()
+                results = lookup.results
+            written = 0
+            # a last, empty group writes the cache hits after the last solved problem
+            for members, group_results in itertools.chain(groups, [([], [])]):
+                for i, result in zip(members, group_results):
+                    if lookup is not None:
+                        lookup.answer(i, result, keep=lambda result: result[1] != ERROR_COST)
+                    else:
+                        results[i] = result
+                start = written
+                while written < len(chunk) and results[written] is not None:
+                    conn, cost = results[written]
+                    writer.writerow([chunk[written]["ProblemNo"], conn, cost_cell(cost)])
+                    written += 1
+                if written == start:
+                    continue
+                f_out.flush()
+
+                if f_stats is not None:
+                    for p in chunk[start:written]:
+                        row = _stats_row(p["ProblemNo"], records.pop(p["ProblemNo"], None))
+                        if stats_writer is not None:
+                            stats_writer.writerow(row)
+                        else:
+                            f_stats.write(json.dumps(row) + "\n")
+                    f_stats.flush()
+            if cache is not None:
+                cache.flush()
+
+    if cache is not None:
+        print(f"result cache: {cache.summary()}", file=sys.stderr)
+    if schedules is not None and schedules.memory_budget is not None and in_process:
+        print(f"schedules: {schedules.summary()}", file=sys.stderr)
@@ -0,0 +1,45 @@
+import csv
+import os
+import shutil
+import sys
+
+import pytest
+
+# the modules live at the repository root, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROBLEM_COLUMNS = ("ProblemNo", "FromStation", "ToStation", "Schedule", "ChangeTime", "CostFunction")
+
+
+def write_problems(path, problems):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, PROBLEM_COLUMNS)
+        writer.writeheader()
+        writer.writerows(problems)
+    return str(path)
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+@pytest.fixture
+def mini_schedule(tmp_path):
+    """A copy of mini-schedule.csv, so that derived files stay out of the tree."""
+    path = tmp_path / "mini-schedule.csv"
+    shutil.copyfile(os.path.join(ROOT, "mini-schedule.csv"), path)
+    return str(path)
+
+
+@pytest.fixture
+def mini_problems(mini_schedule):
+    """The example problems on mini-schedule.csv, on the copy."""
+    with open(os.path.join(ROOT, "example-problems.csv"), newline="", encoding="utf-8") as f:
+        return [{**p, "Schedule": mini_schedule} for p in csv.DictReader(f) if p["Schedule"] == "mini-schedule.csv"]
+
+
+@pytest.fixture
+def problem_file(tmp_path, mini_problems):
+    return write_problems(tmp_path / "problems.csv", mini_problems)
@@ -0,0 +1,73 @@
+"""The csa, raptor and trip arrivaltime engines against each other, and the .tb file."""
+
+import os
+
+import pytest
+
+import benchmark
+from csa import ConnectionArray, csa_arrivaltime
+from raptor import raptor_arrivaltime
+from schedule_cache import load_compiled
+from schedule_utils import build_departure_index
+from trip_based import TransferSet, load_transfers, tb_path_for, trip_arrivaltime
+
+START_TIMES = (0, 6 * 3600 + 30 * 60, 23 * 3600)
+CHANGE_TIMES = (0, 600)
+
+
+@pytest.fixture(params=["mini", "generated"])
+def schedule_file(request, tmp_path, mini_schedule):
+    if request.param == "mini":
+        return mini_schedule
+    path = str(tmp_path / "generated.csv")
+    benchmark.generate_schedule(path, 60, seed=7)
+    return path
+
+
+def _arrivals(trains, found):
+    """Earliest arrival (seconds after the start) at every station reached."""
+    _, dist, goals = found
+    return {trains.station_codes[station]: dist[goal] for station, goal in goals.items()}
+
+
+def test_engines_agree(schedule_file):
+    trains, station_index = load_compiled(schedule_file)
+    connections = ConnectionArray(trains)
+    departures = build_departure_index(trains)
+    reached = 0
+    for change_time in CHANGE_TIMES:
+        transfers = TransferSet.build(trains, departures, change_time)
+        for origin in trains.station_codes:
+            for start_time in START_TIMES:
+                csa = _arrivals(trains, csa_arrivaltime(trains, connections, origin, None, start_time, change_time))
+                raptor = _arrivals(trains, raptor_arrivaltime(trains, station_index, origin, None, start_time,
+                                                              change_time))
+                trip = _arrivals(trains, trip_arrivaltime(trains, station_index, transfers, origin, None,
+                                                          start_time))
+                assert raptor == csa, (origin, start_time, change_time)
+                assert trip == csa, (origin, start_time, change_time)
+                reached += len(csa)
+    assert reached > len(trains.station_codes) * len(START_TIMES) * len(CHANGE_TIMES)
+
+
+def test_transfer_file(mini_schedule, monkeypatch):
+    trains, station_index = load_compiled(mini_schedule)
+    departures = build_departure_index(trains)
+    built = load_transfers(mini_schedule, trains, departures, 600)
+    assert os.path.exists(tb_path_for(mini_schedule, 600))
+
+    def no_build(*args):
+        raise AssertionError("transfers built again")
+
+    monkeypatch.setattr(TransferSet, "build", no_build)
+    loaded = load_transfers(mini_schedule, trains, departures, 600)
+    for slot in TransferSet.__slots__:
+        assert getattr(loaded, slot) == getattr(built, slot), slot
+    for origin in trains.station_codes[:20]:
+        assert (trip_arrivaltime(trains, station_index, loaded, origin, None, 8 * 3600)
+                == trip_arrivaltime(trains, station_index, built, origin, None, 8 * 3600))
+
+    # another change time has a file of its own
+    monkeypatch.undo()
+    other = load_transfers(mini_schedule, trains, departures, 0)
+    assert other.change_time == 0 and os.path.exists(tb_path_for(mini_schedule, 0))
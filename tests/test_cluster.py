@@ -0,0 +1,51 @@
+"""The coordinator with local worker processes, against a file run."""
+
+import asyncio
+import socket
+
+import cluster
+from solver import solve_problems
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _dying_worker(port, received):
+    """Take a shard and disconnect without answering it."""
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=cluster.MAX_MESSAGE)
+            break
+        except OSError:
+            await asyncio.sleep(0.01)
+    await cluster._send(writer, {"type": "hello", "worker": "dying"})
+    received.append((await cluster._receive(reader))["type"])
+    writer.close()
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_local_workers(tmp_path, problem_file):
+    solve_problems(problem_file, str(tmp_path / "expected.csv"))
+    output = str(tmp_path / "solutions.csv")
+
+    async def run():
+        port = _free_port()
+        received = []
+        dying = asyncio.create_task(_dying_worker(port, received))
+        coordinator = await cluster.coordinate(problem_file, output, port=port, local_workers=2, shard_size=5)
+        await dying
+        return coordinator, received
+
+    coordinator, received = asyncio.run(run())
+    assert received == ["shard"]
+    assert coordinator.workers == 3
+    assert coordinator.retries == 1 and coordinator.given_up == 0
+    assert len(coordinator.shards) > 2
+    assert _read(output) == _read(tmp_path / "expected.csv")
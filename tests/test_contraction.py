@@ -0,0 +1,95 @@
+"""Contraction hierarchy queries against dijkstra, and the .ch file."""
+
+import os
+
+import pytest
+
+import benchmark
+import contraction
+from contraction import ContractionHierarchy, ch_path_for, load_hierarchy
+from search import dijkstra
+from solver import load_schedule_data
+
+
+@pytest.fixture(params=["mini", "generated"])
+def schedule_file(request, tmp_path, mini_schedule):
+    if request.param == "mini":
+        return mini_schedule
+    path = str(tmp_path / "generated.csv")
+    benchmark.generate_schedule(path, 60, seed=5)
+    return path
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Number of hierarchies contracted so far."""
+    count = [0]
+    build = ContractionHierarchy.build.__func__
+
+    def counted(cls, graph):
+        count[0] += 1
+        return build(cls, graph)
+
+    monkeypatch.setattr(ContractionHierarchy, "build", classmethod(counted))
+    return count
+
+
+def _assert_matches_dijkstra(ch, graph):
+    trains = graph.trains
+    for source in range(trains.n_stations):
+        _, dist, _ = dijkstra(graph.stops_edges, source, lambda node: False)
+        for target in range(trains.n_stations):
+            found = ch.query(source, target)
+            if target not in dist:
+                assert found is None, (source, target)
+                continue
+            cost, stops = found
+            assert cost == dist[target], (source, target)
+            # the unpacked path: one segment per station entered, from source to target
+            assert len(stops) == cost
+            station = source
+            for s in stops:
+                assert trains.stop_station[s] == station
+                station = trains.stop_station[s + 1]
+            assert station == target
+
+
+def test_query_matches_dijkstra(schedule_file):
+    graph = load_schedule_data(schedule_file)["graph"]
+    _assert_matches_dijkstra(ContractionHierarchy.build(graph), graph)
+
+
+def test_hierarchy_file(mini_schedule, builds):
+    graph = load_schedule_data(mini_schedule)["graph"]
+    built = load_hierarchy(mini_schedule, graph)
+    assert builds[0] == 1 and os.path.exists(ch_path_for(mini_schedule))
+
+    # read back, not contracted again, also after a touch
+    os.utime(mini_schedule, ns=(0, os.stat(mini_schedule).st_mtime_ns + 10 ** 9))
+    loaded = load_hierarchy(mini_schedule, graph)
+    assert builds[0] == 1
+    for name, _ in contraction._COLUMNS:
+        assert getattr(loaded, name) == getattr(built, name), name
+
+
+def test_stale_hierarchy_file(mini_schedule, builds):
+    old = load_schedule_data(mini_schedule)["graph"]
+    load_hierarchy(mini_schedule, old)
+    # run the last train twice: the same stations, so only the source key tells the file is stale
+    with open(mini_schedule, newline="", encoding="utf-8") as f:
+        lines = f.readlines()
+    last = lines[-1].split(",")[0]
+    with open(mini_schedule, "a", newline="", encoding="utf-8") as f:
+        f.writelines("'99999'" + line[len(last):] for line in lines if line.split(",")[0] == last)
+
+    graph = load_schedule_data(mini_schedule)["graph"]
+    assert graph.trains.n_stations == old.trains.n_stations
+    ch = load_hierarchy(mini_schedule, graph)
+    assert builds[0] == 2
+    _assert_matches_dijkstra(ch, graph)
+
+    # a damaged file is contracted again as well
+    with open(ch_path_for(mini_schedule), "r+b") as f:
+        f.truncate(os.path.getsize(ch_path_for(mini_schedule)) - 4)
+    load_hierarchy(mini_schedule, graph)
+    assert builds[0] == 3
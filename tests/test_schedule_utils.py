@@ -0,0 +1,123 @@
+"""The vectorised schedule loader against the row-by-row one."""
+
+import csv
+
+import pytest
+
+import benchmark
+import schedule_utils
+from schedule_utils import DAY, Timetable, build_station_index, load_schedule
+
+pytestmark = pytest.mark.skipif(schedule_utils.np is None, reason="the vectorised loader needs numpy")
+
+# trains appended to a generated schedule, as (train no., [(islno, station, arrival, departure), ...])
+EDGE_TRAINS = [
+    # runs through two midnights
+    ("'90001'", [(1, "AAA", "00:00:00", "22:00:00"), (2, "BBB", "23:30:00", "23:40:00"),
+                 (3, "CCC", "05:00:00", "05:10:00"), (4, "DDD", "21:00:00", "21:05:00"),
+                 (5, "EEE", "02:00:00", "00:00:00")]),
+    # dwells across midnight: departs before it arrives
+    ("'90002'", [(1, "AAA", "00:00:00", "20:00:00"), (2, "BBB", "23:55:00", "00:05:00"),
+                 (3, "CCC", "01:00:00", "00:00:00")]),
+    # calls at the same station twice, and leaves and ends where it started
+    ("'90003'", [(1, "AAA", "00:00:00", "08:00:00"), (2, "BBB", "09:00:00", "09:05:00"),
+                 (3, "AAA", "10:00:00", "10:05:00"), (4, "BBB", "11:00:00", "11:05:00"),
+                 (5, "AAA", "12:00:00", "00:00:00")]),
+    # stops listed out of islno order, with an equal arrival and departure
+    ("'90004'", [(3, "DDD", "14:00:00", "00:00:00"), (1, "CCC", "00:00:00", "12:00:00"),
+                 (2, "BBB", "13:00:00", "13:00:00")]),
+]
+
+
+def _edge_rows():
+    for number, stops in EDGE_TRAINS:
+        for islno, station, arrival, departure in stops:
+            yield [number, "EDGE", islno, f"{station} ", f"STATION {station}", f"'{arrival}'", f"'{departure}'",
+                   0, "AAA ", "STATION AAA", "EEE ", "STATION EEE"]
+
+
+def _assert_same(path):
+    rows = load_schedule(path, vectorised=False)
+    columns = load_schedule(path, vectorised=True)
+    for slot in Timetable.__slots__:
+        assert getattr(columns, slot) == getattr(rows, slot), slot
+    row_index = build_station_index(rows)
+    column_index = build_station_index(columns)
+    assert column_index.start == row_index.start
+    assert column_index.stops == row_index.stops
+    return rows
+
+
+@pytest.fixture
+def generated_schedule(tmp_path):
+    path = tmp_path / "schedule.csv"
+    benchmark.generate_schedule(str(path), 200, seed=3)
+    # interleave the edge-case trains with a generated one
+    with open(path, newline="", encoding="utf-8") as f:
+        lines = list(csv.reader(f))
+    edge = list(_edge_rows())
+    lines[2:2] = edge[::2]
+    lines.extend(edge[1::2])
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(lines)
+    return str(path)
+
+
+def test_generated_schedule(generated_schedule):
+    tt = _assert_same(generated_schedule)
+    assert max(tt.stop_arr) >= DAY  # some generated trains run past midnight
+
+
+def test_edge_trains(generated_schedule):
+    tt = _assert_same(generated_schedule)
+
+    def times(number):
+        t = tt.train_ids[number]
+        stops = range(tt.train_start[t], tt.train_start[t + 1])
+        return [(tt.station_codes[tt.stop_station[s]], tt.stop_arr[s], tt.stop_dep[s]) for s in stops]
+
+    hour = 3600
+    assert [arr // hour for _, arr, _ in times("90001")] == [0, 23, 24 + 5, 24 + 21, 48 + 2]
+    assert times("90002")[1][1:] == (23 * hour + 55 * 60, DAY + 5 * 60)
+    assert [code for code, _, _ in times("90003")] == ["AAA", "BBB", "AAA", "BBB", "AAA"]
+    assert [code for code, _, _ in times("90004")] == ["CCC", "BBB", "DDD"]
+
+
+def test_quoted_schedule(tmp_path):
+    # quoting sends the vectorised loader to its csv module fallback
+    path = tmp_path / "quoted.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(benchmark.SCHEDULE_HEADER)
+        writer.writerows(_edge_rows())
+    _assert_same(str(path))
+
+
+def test_schedule_without_trailing_newline(tmp_path):
+    path = tmp_path / "short.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(benchmark.SCHEDULE_HEADER)
+        writer.writerows(_edge_rows())
+    with open(path, "rb+") as f:
+        f.truncate(path.stat().st_size - 1)
+    _assert_same(str(path))
+
+
+def test_schedule_with_blank_lines(tmp_path):
+    path = tmp_path / "blank.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(benchmark.SCHEDULE_HEADER)
+        rows = list(_edge_rows())
+        writer.writerows(rows[:3])
+        f.write("\r\n")
+        writer.writerows(rows[3:])
+        f.write("\r\n")
+    assert _assert_same(str(path)).n_stops == len(rows)
+
+
+def test_empty_schedule(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text(",".join(benchmark.SCHEDULE_HEADER) + "\n", encoding="utf-8")
+    assert _assert_same(str(path)).n_stops == 0
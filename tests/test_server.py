@@ -0,0 +1,93 @@
+"""The query server on a Unix socket, against file runs."""
+
+import asyncio
+import csv
+import io
+import os
+
+import pytest
+
+import server
+from conftest import read_rows
+from result_cache import ResultCache
+from solver import solve_problems
+
+pytestmark = pytest.mark.skipif(not hasattr(asyncio, "start_unix_server"), reason="needs Unix sockets")
+
+
+def _csv_body(problems):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, server.PROBLEM_COLUMNS)
+    writer.writeheader()
+    writer.writerows(problems)
+    return out.getvalue().encode("utf-8")
+
+
+async def _post(unix_socket, body, content_type="text/csv"):
+    """Status and body of a ``POST /solve``."""
+    reader, writer = await asyncio.open_unix_connection(unix_socket)
+    writer.write(f"POST /solve HTTP/1.1\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload.decode("utf-8")
+
+
+def _serve(unix_socket, requests, **kwargs):
+    """Run ``requests(unix_socket)`` against a server started with ``kwargs``."""
+
+    async def run():
+        task = asyncio.create_task(server.serve(unix_socket=unix_socket, **kwargs))
+        while not os.path.exists(unix_socket):
+            await asyncio.sleep(0.01)
+        try:
+            return await requests(unix_socket)
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    return asyncio.run(run())
+
+
+def test_csv_batch(tmp_path, mini_problems, problem_file):
+    solve_problems(problem_file, str(tmp_path / "solutions.csv"))
+
+    status, payload = _serve(str(tmp_path / "s.sock"), lambda sock: _post(sock, _csv_body(mini_problems)))
+    assert status == 200
+    assert list(csv.reader(io.StringIO(payload))) == read_rows(tmp_path / "solutions.csv")
+
+
+def test_json_client(tmp_path, mini_problems):
+    rows = _serve(str(tmp_path / "s.sock"), lambda sock: server.request(mini_problems[:3], unix_socket=sock))
+    assert [row["ProblemNo"] for row in rows] == [p["ProblemNo"] for p in mini_problems[:3]]
+    assert all(row["Cost"] != "error" for row in rows)
+
+
+@pytest.mark.parametrize("column, value", [("ChangeTime", "abc"), ("CostFunction", "arrivaltime"),
+                                           ("CostFunction", "fastest")])
+def test_malformed_problem(tmp_path, mini_problems, column, value):
+    arrival = next(p for p in mini_problems if p["CostFunction"].startswith("arrivaltime"))
+    body = _csv_body([mini_problems[0], {**arrival, column: value}])
+
+    async def requests(sock):
+        # answered, and the server still solves the next request
+        return await _post(sock, body), await server.request(mini_problems[:1], unix_socket=sock)
+
+    (status, payload), rows = _serve(str(tmp_path / "s.sock"), requests, cache=ResultCache())
+    assert status == 400
+    assert payload.startswith(f"problem {arrival['ProblemNo']}: ")
+    assert len(rows) == 1
+
+
+def test_failed_request(tmp_path, monkeypatch, mini_problems):
+    async def solve(self, problems):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(server.QueryServer, "solve", solve)
+    status_and_payload = _serve(str(tmp_path / "s.sock"), lambda sock: _post(sock, _csv_body(mini_problems[:1])))
+    assert status_and_payload == (500, "RuntimeError: boom")
@@ -0,0 +1,54 @@
+"""Writing and resuming solution files."""
+
+import pytest
+
+import solver
+from conftest import read_rows
+from solver import solve_problems
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("cut", ["header", "row", "newline"])
+@pytest.mark.parametrize("chunk_size", [7, solver.CHUNK_SIZE])
+def test_resume_torn_output(tmp_path, problem_file, cut, chunk_size):
+    clean = tmp_path / "clean.csv"
+    solve_problems(problem_file, str(clean), chunk_size=chunk_size)
+    data = _read(clean)
+    rows = data.splitlines(keepends=True)
+    if cut == "header":
+        torn = rows[0][:5]
+    elif cut == "row":
+        # a crash in the middle of writing the 16th problem
+        torn = b"".join(rows[:16]) + rows[16][:len(rows[16]) // 2]
+    else:
+        torn = b"".join(rows[:16])
+
+    output = tmp_path / "solutions.csv"
+    output.write_bytes(torn)
+    solve_problems(problem_file, str(output), resume=True, chunk_size=chunk_size)
+    assert _read(output) == data
+
+
+def test_rows_flushed_per_group(tmp_path, monkeypatch, mini_problems, problem_file):
+    output = str(tmp_path / "solutions.csv")
+    iter_batch = solver._iter_batch
+    prefixes = []
+
+    def checked(chunk, trains_cache, engines):
+        answered = set()
+        for members, results in iter_batch(chunk, trains_cache, engines):
+            yield members, results
+            # the writer is done with the group: every answered row up to the first gap is on disk
+            answered.update(members)
+            prefix = next(i for i in range(len(chunk) + 1) if i not in answered)
+            assert len(read_rows(output)) - 1 == prefix
+            prefixes.append(prefix)
+
+    monkeypatch.setattr(solver, "_iter_batch", checked)
+    solve_problems(problem_file, output)
+    assert len(read_rows(output)) - 1 == len(mini_problems)
+    assert len(prefixes) > 1 and 0 < prefixes[0] < len(mini_problems)
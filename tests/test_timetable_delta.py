@@ -0,0 +1,120 @@
+"""Schedule deltas patched into a loaded schedule, against loading the amended csv."""
+
+import csv
+from array import array
+
+import pytest
+
+import solver
+from conftest import read_rows
+from result_cache import ResultCache, problem_key
+from schedule_utils import DAY, Timetable, _parse_time
+
+
+def _schedule_rows(schedule_file):
+    with open(schedule_file, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def _train_no(row):
+    return row["Train No."].strip().strip("'")
+
+
+def _shifted(row, seconds):
+    def shift(t):
+        t = (_parse_time(t) + seconds) % DAY
+        return f"'{t // 3600:02}:{t // 60 % 60:02}:{t % 60:02}'"
+
+    return {**row, "Arrival time": shift(row["Arrival time"]), "Departure time": shift(row["Departure time"])}
+
+
+def _write_delta(path, schedule_file, remove=(), retime=(), add=()):
+    """A delta removing and retiming (by a minute) trains, and adding copies of trains as "9xxxx"."""
+    rows = _schedule_rows(schedule_file)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, ["Action", *rows[0]])
+        writer.writeheader()
+        for no in remove:
+            writer.writerow({"Action": "remove", "Train No.": f"'{no}'"})
+        for row in rows:
+            if _train_no(row) in retime:
+                writer.writerow({"Action": "replace", **_shifted(row, 60)})
+        for n, no in enumerate(add):
+            for row in rows:
+                if _train_no(row) == no:
+                    writer.writerow({"Action": "add", **_shifted(row, 600), "Train No.": f"'{90000 + n}'"})
+    return str(path)
+
+
+def _trains(schedule_file):
+    numbers = []
+    for row in _schedule_rows(schedule_file):
+        if _train_no(row) not in numbers:
+            numbers.append(_train_no(row))
+    return numbers
+
+
+def _arrays(obj):
+    return {name: value for name, value in vars(obj).items() if isinstance(value, array)}
+
+
+def test_patched_equals_reloaded(tmp_path, mini_schedule, mini_problems):
+    trains = _trains(mini_schedule)
+    delta = _write_delta(tmp_path / "delta.csv", mini_schedule, remove=trains[3:5], retime=trains[5:7],
+                         add=trains[7:9])
+    amended = str(tmp_path / "amended.csv")
+    trains_cache = {}
+    solver._get_connections(solver._get_schedule(trains_cache, mini_schedule))
+    update, _ = solver.apply_schedule_delta(trains_cache, mini_schedule, delta, output_file=amended)
+    assert (len(update.removed), len(update.replaced), len(update.added)) == (2, 2, 2)
+
+    patched = trains_cache[mini_schedule]
+    reloaded = solver.load_schedule_data(amended)
+    for slot in Timetable.__slots__:
+        assert getattr(patched["trains"], slot) == getattr(reloaded["trains"], slot), slot
+    for slot in ("start", "stops"):
+        assert getattr(patched["station_index"], slot) == getattr(reloaded["station_index"], slot), slot
+    assert _arrays(patched["graph"]) == _arrays(reloaded["graph"])
+    connections = solver._get_connections(reloaded)
+    for slot in type(connections).__slots__:
+        assert getattr(patched["connections"], slot) == getattr(connections, slot), slot
+
+    # the input is left alone, and both answer every problem alike
+    assert _trains(mini_schedule) == trains
+    for engines in (None, {"arrivaltime": "csa"}):
+        expected = solver._solve_batch([{**p, "Schedule": amended} for p in mini_problems], {}, engines)
+        assert solver._solve_batch(mini_problems, trains_cache, engines) == expected
+
+
+@pytest.mark.parametrize("change", ["remove", "retime", "add"])
+def test_cache_carry_over(tmp_path, mini_schedule, mini_problems, problem_file, change):
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"))
+    solver.solve_problems(problem_file, str(tmp_path / "before.csv"), cache=cache)
+    # a train that some solution rides
+    ridden = next(row[1].split(" : ")[0] for row in read_rows(tmp_path / "before.csv")[1:] if row[1])
+    delta = _write_delta(tmp_path / "delta.csv", mini_schedule, **{change: [ridden]})
+    amended = str(tmp_path / "amended.csv")
+    engines = solver._resolved_engines(None)
+    cached = {problem_key(p, engines) for p in mini_problems}
+
+    update, (kept, dropped) = solver.apply_schedule_delta({}, mini_schedule, delta, cache, amended)
+    assert kept + dropped == len(cached)
+
+    amended_problems = [{**p, "Schedule": amended} for p in mini_problems]
+    lookup = cache.lookup(amended_problems, engines)
+    fresh = solver._solve_batch(amended_problems, {})
+    hits = [(p, result, expected) for p, result, expected in zip(amended_problems, lookup.results, fresh)
+            if result is not None]
+    assert len({problem_key(p, engines) for p, _, _ in hits}) == kept
+    for p, (connection, cost), (_, expected_cost) in hits:
+        assert update.still_valid(p["CostFunction"], connection)
+        assert solver.cost_cell(cost) == solver.cost_cell(expected_cost)
+    kept_cost_functions = {p["CostFunction"].split()[0] for p, _, _ in hits}
+    if change == "remove":
+        assert kept and dropped
+        assert all(ridden not in connection for _, (connection, _), _ in hits)
+    elif change == "retime":
+        assert kept_cost_functions == {"stops", "price"}
+    else:
+        assert kept == 0
+    cache.close()
@@ -0,0 +1,376 @@
+"""Incremental timetable updates.
+
+A delta file amends a schedule train by train. It has the columns of the
+schedule csv plus an ``Action`` column:
+
+    add       a train not yet in the schedule, with all its stops
+    replace   all stops of an existing train (retimed or rerouted)
+    remove    a cancelled train; one row with its ``Train No.`` is enough
+
+:func:`apply_delta` applies a delta to a loaded timetable without reading
+the schedule again. Only the stops of the trains in the delta are parsed
+and normalised; every other train is copied over in runs of unchanged
+trains. The station index, the :class:`ScheduleGraph` and the CSA
+connections are patched the same way: what involves a changed train is
+rebuilt, everything else only renumbered.
+
+The result is exactly what loading the amended schedule gives, as written
+by :func:`write_amended_schedule`: the rows of a replaced train take the
+place of its old rows, added trains follow at the end in delta order.
+"""
+
+import csv
+import io
+import os
+import re
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Collection, Dict, List, Set, Tuple
+
+from schedule_utils import Timetable, StationIndex, _build_timetable, _parse_time
+from graph_builder import ScheduleGraph
+from csa import ConnectionArray
+
+DELTA_ACTIONS = ("add", "replace", "remove")
+
+# cost functions that depend on the stops of a train only, not on its times
+_TIMELESS_COST_FUNCTIONS = ("stops", "price")
+
+
+class TimetableDelta:
+    """Trains to add, replace and remove.
+
+    ``actions`` maps each train number to its action, in file order;
+    ``rows`` holds the schedule rows of the added and replaced trains.
+    """
+
+    def __init__(self):
+        self.actions: Dict[str, str] = {}
+        self.rows: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+
+    def trains(self, action: str) -> List[str]:
+        return [no for no, a in self.actions.items() if a == action]
+
+    def stops(self) -> Dict[str, List[Tuple[int, str, int, int]]]:
+        """Per-train ``(islno, station, arr, dep)`` rows, as ``load_schedule`` reads them."""
+        return {
+            no: [(int(row["islno"]), row["station Code"].strip(), _parse_time(row["Arrival time"]),
+                  _parse_time(row["Departure time"])) for row in rows]
+            for no, rows in self.rows.items()
+        }
+
+
+def read_delta(path: str) -> TimetableDelta:
+    delta = TimetableDelta()
+    with open(path, newline="", encoding="utf-8") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            action = (row.pop("Action", None) or "").strip().lower()
+            train_no = (row.get("Train No.") or "").strip().strip("'")
+            if action not in DELTA_ACTIONS:
+                raise ValueError(f"{path}:{line}: unknown action {action!r}, choose one of {', '.join(DELTA_ACTIONS)}")
+            if not train_no:
+                raise ValueError(f"{path}:{line}: missing Train No.")
+            if delta.actions.setdefault(train_no, action) != action:
+                raise ValueError(f"{path}:{line}: train {train_no} cannot be both "
+                                 f"{delta.actions[train_no]} and {action}")
+            if action != "remove":
+                delta.rows[train_no].append(row)
+    return delta
+
+
+def _connection_trains(connection: str) -> Set[str]:
+    """Train numbers ridden by a connection string (or ``" | "``-joined profile)."""
+    return {
+        part.split(" : ", 1)[0]
+        for journey in connection.split(" | ")
+        for part in journey.split(" ; ")
+        if part
+    }
+
+
+class TimetableUpdate:
+    """Outcome of :func:`apply_delta`.
+
+    ``trains``, ``station_index`` and, if the old ones were passed in,
+    ``graph`` and ``connections`` belong to the amended timetable. They are
+    patched with ``stop_map``, which takes old stop ids to new ones (-1 for
+    the stops of removed and replaced trains), ``station_map``, the same for
+    station ids (None if the stations did not change), ``old_station``, new
+    station ids to old ones (-1 for new stations), ``new_calls``, the stops
+    of the added and replaced trains at each new station id, and
+    ``changed_stations``, the new ids of the stations that lost or gained a
+    call; the others only need renumbering.
+
+    ``rerouted`` are the replaced trains whose stops (islno and station)
+    changed, rather than only their times, and ``stations`` the codes of all
+    stations a train of the delta served before or serves now.
+    """
+
+    def __init__(self, delta: TimetableDelta, trains: Timetable, stop_map: array, station_map: array | None):
+        self.added = set(delta.trains("add"))
+        self.replaced = set(delta.trains("replace"))
+        self.removed = set(delta.trains("remove"))
+        self.trains = trains
+        self.station_index: StationIndex | None = None
+        self.graph: ScheduleGraph | None = None
+        self.connections: ConnectionArray | None = None
+        self.stop_map = stop_map
+        self.station_map = station_map
+        self.old_station = array("i", range(trains.n_stations))
+        if station_map is not None:
+            self.old_station = array("i", [-1]) * trains.n_stations
+            for o, n in enumerate(station_map):
+                if n >= 0:
+                    self.old_station[n] = o
+        self.new_calls: Dict[int, List[int]] = defaultdict(list)
+        self.changed_stations: Set[int] = set()
+        self.rerouted: Set[str] = set()
+        self.stations: Set[str] = set()
+
+    def still_valid(self, cost_function: str, connection: str) -> bool:
+        """Whether a result found before the update is still an optimal answer.
+
+        Removing trains makes no journey shorter, so a result that does not
+        ride a removed train stays optimal. A new train, or one that runs
+        differently, can shorten any journey, even one that never touched
+        its stations, so no result survives it. Retiming a train does not
+        change stops or price.
+        """
+        if cost_function.split()[0] in _TIMELESS_COST_FUNCTIONS:
+            changed = self.rerouted
+        else:
+            changed = self.replaced
+        if self.added or changed:
+            return False
+        return self.removed.isdisjoint(_connection_trains(connection))
+
+    def summary(self) -> str:
+        return (f"{len(self.added)} added, {len(self.replaced)} replaced ({len(self.rerouted)} rerouted), "
+                f"{len(self.removed)} removed, {len(self.stations)} stations affected")
+
+
+def _ints(column, a: int, b: int) -> memoryview:
+    """Raw bytes of ``column[a:b]`` (an int array or memory-mapped column)."""
+    return memoryview(column)[a:b].cast("B")
+
+
+def apply_delta(trains: Timetable, station_index: StationIndex, delta: TimetableDelta,
+                graph: ScheduleGraph | None = None, connections: ConnectionArray | None = None
+                ) -> TimetableUpdate:
+    """Amend a loaded timetable; the originals are left untouched.
+
+    Raises ValueError if the delta adds a train the timetable has, or
+    replaces or removes one it does not have.
+    """
+    for no, action in delta.actions.items():
+        if (no in trains.train_ids) != (action != "add"):
+            raise ValueError(f"cannot {action} train {no}: it is "
+                             f"{'already' if no in trains.train_ids else 'not'} in the schedule")
+
+    # the added and replaced trains, normalised like a schedule of their own
+    changed = _build_timetable(delta.stops())
+    gone = [trains.train_ids[no] for no, action in delta.actions.items() if action != "add"]
+
+    old_start = trains.train_start
+    old_station = trains.stop_station
+    calls = [station_index.start[i + 1] - station_index.start[i] for i in range(trains.n_stations)]
+    for o in gone:
+        for s in range(old_start[o], old_start[o + 1]):
+            calls[old_station[s]] -= 1
+    codes = sorted({code for code, n in zip(trains.station_codes, calls) if n > 0} | set(changed.station_codes))
+    station_ids = {code: i for i, code in enumerate(codes)}
+    station_map = None
+    if codes != trains.station_codes:
+        station_map = array("i", [station_ids.get(code, -1) for code in trains.station_codes])
+    changed_station = array("i", [station_ids[code] for code in changed.station_codes])
+
+    tt = Timetable()
+    tt.station_codes = codes
+    tt.station_ids = station_ids
+    tt.train_nos = sorted(set(trains.train_nos).difference(delta.trains("remove")).union(delta.trains("add")))
+    tt.train_ids = {no: i for i, no in enumerate(tt.train_nos)}
+    stop_map = array("i", [-1]) * trains.n_stops
+
+    def copy_run(o: int, t: int, k: int):
+        """Copy the unchanged old trains ``o .. o + k - 1`` as new trains ``t ..``."""
+        a = old_start[o]
+        b = old_start[o + k]
+        first = tt.n_stops
+        if t == o:
+            tt.stop_train.frombytes(_ints(trains.stop_train, a, b))
+        else:
+            tt.stop_train.extend(map((t - o).__add__, trains.stop_train[a:b]))
+        if station_map is None:
+            tt.stop_station.frombytes(_ints(old_station, a, b))
+        else:
+            tt.stop_station.extend(map(station_map.__getitem__, old_station[a:b]))
+        for column in ("stop_islno", "stop_arr", "stop_dep"):
+            getattr(tt, column).frombytes(_ints(getattr(trains, column), a, b))
+        tt.train_start.extend(first + old_start[o + j] - a for j in range(1, k + 1))
+        stop_map[a:b] = array("i", range(first, first + b - a))
+
+    run = None  # (first old train, first new train, length) of unchanged trains
+    for t, no in enumerate(tt.train_nos):
+        m = changed.train_ids.get(no)
+        if m is None:
+            o = trains.train_ids[no]
+            if run is not None and o == run[0] + run[2] and t == run[1] + run[2]:
+                run = (run[0], run[1], run[2] + 1)
+                continue
+            if run is not None:
+                copy_run(*run)
+            run = (o, t, 1)
+            continue
+        if run is not None:
+            copy_run(*run)
+            run = None
+        a = changed.train_start[m]
+        b = changed.train_start[m + 1]
+        tt.stop_train.extend(array("i", [t]) * (b - a))
+        tt.stop_station.extend(changed_station[x] for x in changed.stop_station[a:b])
+        tt.stop_islno.extend(changed.stop_islno[a:b])
+        tt.stop_arr.extend(changed.stop_arr[a:b])
+        tt.stop_dep.extend(changed.stop_dep[a:b])
+        tt.train_start.append(tt.n_stops)
+    if run is not None:
+        copy_run(*run)
+
+    removed = set(delta.trains("remove"))
+    tt.train_order = array("i", [tt.train_ids[trains.train_nos[o]] for o in trains.train_order
+                                 if trains.train_nos[o] not in removed])
+    tt.train_order.extend(tt.train_ids[no] for no in delta.trains("add"))
+
+    update = TimetableUpdate(delta, tt, stop_map, station_map)
+    for no in changed.train_nos:
+        t = tt.train_ids[no]
+        for s in range(tt.train_start[t], tt.train_start[t + 1]):
+            update.new_calls[tt.stop_station[s]].append(s)
+    update.changed_stations.update(update.new_calls)
+    for o in gone:
+        for s in range(old_start[o], old_start[o + 1]):
+            update.stations.add(trains.station_codes[old_station[s]])
+            n = old_station[s] if station_map is None else station_map[old_station[s]]
+            if n >= 0:
+                update.changed_stations.add(n)
+    update.stations.update(codes[n] for n in update.new_calls)
+    update.station_index = _amend_station_index(update, station_index)
+
+    for no in delta.trains("replace"):
+        o = trains.train_ids[no]
+        t = tt.train_ids[no]
+        before = [(trains.stop_islno[s], trains.station_codes[old_station[s]])
+                  for s in range(old_start[o], old_start[o + 1])]
+        after = [(tt.stop_islno[s], codes[tt.stop_station[s]])
+                 for s in range(tt.train_start[t], tt.train_start[t + 1])]
+        if before != after:
+            update.rerouted.add(no)
+    if graph is not None:
+        update.graph = graph.amended(update)
+    if connections is not None:
+        update.connections = connections.amended(update)
+    return update
+
+
+def _amend_station_index(update: TimetableUpdate, station_index: StationIndex) -> StationIndex:
+    """The old index renumbered, less the stops of removed and replaced trains, plus ``new_calls``."""
+    order = update.trains.index_order()
+    mapped = array("i", map(update.stop_map.__getitem__, station_index.stops))
+    old_start = station_index.start
+    start = array("i", [0])
+    stops = array("i")
+    run = None  # [first, end) of old stations copied as they are
+    for n, o in enumerate(update.old_station):
+        if n not in update.changed_stations:
+            if run is None or run[1] != o:
+                if run is not None:
+                    stops.extend(mapped[old_start[run[0]]:old_start[run[1]]])
+                run = [o, o]
+            run[1] = o + 1
+            start.append(len(stops) + old_start[o + 1] - old_start[run[0]])
+            continue
+        if run is not None:
+            stops.extend(mapped[old_start[run[0]]:old_start[run[1]]])
+            run = None
+        calls = list(filter((-1).__ne__, mapped[old_start[o]:old_start[o + 1]])) if o >= 0 else []
+        for s in update.new_calls.get(n, ()):
+            calls.insert(bisect_right(calls, order(s), key=order), s)
+        stops.extend(calls)
+        start.append(len(stops))
+    if run is not None:
+        stops.extend(mapped[old_start[run[0]]:old_start[run[1]]])
+    return StationIndex(start, stops)
+
+
+def _train_lines(data: bytes, start: int, column: int, train_nos: Collection[str]) -> List[Tuple[int, int, str]]:
+    """``(start, end, train no)`` of the csv lines of ``train_nos`` in ``data``.
+
+    ``start`` is the newline ending the header. Without ``"`` quoting the
+    lines are found by one regular expression over the whole file,
+    otherwise every line is parsed.
+    """
+    targets = {no.encode("utf-8"): no for no in train_nos}
+    if not targets:
+        return []
+    if b'"' in data:
+        hits = []
+        pos = start + 1
+        for line in data[pos:].splitlines(keepends=True):
+            fields = next(csv.reader([line.decode("utf-8")]), [])
+            train_no = fields[column].strip().strip("'") if len(fields) > column else ""
+            if train_no in train_nos:
+                hits.append((pos, train_no))
+            pos += len(line)
+    else:
+        # a line start, ``column`` fields, then one of the numbers (quotes and padding allowed)
+        pattern = re.compile(rb"\n(?:[^,\n]*,){%d}[ \t']*(%b)[ \t']*(?=[,\r\n]|\Z)"
+                             % (column, b"|".join(map(re.escape, targets))))
+        hits = [(m.start() + 1, targets[m.group(1)]) for m in pattern.finditer(data, start)]
+    return [(begin, data.find(b"\n", begin) + 1 or len(data), no) for begin, no in hits]
+
+
+def write_amended_schedule(schedule_file: str, delta: TimetableDelta, output_file: str):
+    """Write ``schedule_file`` with ``delta`` applied to ``output_file``.
+
+    Lines of untouched trains are copied byte for byte. The rows of a
+    replaced train take the place of its first old row; added trains are
+    appended in delta order.
+    """
+    with open(schedule_file, "rb") as f:
+        data = f.read()
+    header_end = data.find(b"\n") + 1 or len(data)
+    header = next(csv.reader([data[:header_end].decode("utf-8")]))
+    newline = b"\r\n" if data[:header_end].endswith(b"\r\n") else b"\n"
+
+    def train_rows(train_no: str) -> bytes:
+        out = io.StringIO()
+        writer = csv.DictWriter(out, header, restval="", extrasaction="ignore", lineterminator=newline.decode())
+        writer.writerows(delta.rows[train_no])
+        return out.getvalue().encode("utf-8")
+
+    amended = []
+    pos = 0
+    replaced: Set[str] = set()
+    for start, end, train_no in _train_lines(data, header_end - 1, header.index("Train No."), delta.actions):
+        amended.append(data[pos:start])
+        if delta.actions[train_no] == "replace" and train_no not in replaced:
+            replaced.add(train_no)
+            amended.append(train_rows(train_no))
+        pos = end
+    amended.append(data[pos:])
+    added = delta.trains("add")
+    if added and not data.endswith(b"\n"):
+        amended.append(newline)
+    amended.extend(train_rows(no) for no in added)
+
+    # write to a temporary file and rename, like the compiled timetable
+    tmp = f"{output_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.writelines(amended)
+        os.replace(tmp, output_file)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
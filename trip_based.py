@@ -0,0 +1,399 @@
+"""Trip-based routing for `arrivaltime` queries.
+
+A *trip* is one daily run of a train. Preprocessing lists, for every stop
+a trip can be left at, the transfers to other trips worth making there;
+a query is then a breadth-first search over trips, round ``n`` scanning
+the trips reachable with ``n - 1`` changes, with no priority queue and no
+per-stop labels. Like raptor, it changes trains only where a station's
+earliest arrival improves: an arrival there as early, with no more
+changes, can make every change this one could.
+
+Times follow the model of ``csa.py`` and ``raptor.py``: day ``k >= 0`` of
+a train runs all its stops ``k * DAY`` later, changing trains needs the
+change time (boarding at the origin only needs the start time), and
+arrival labels are per station.
+
+Transfers depend on the change time, so there is one transfer set per
+schedule and change time. A transfer from stop ``s`` of a train to stop
+``s2`` of another boards the earliest run of the other train that leaves
+at least the change time after the arrival, ``day`` days after the run it
+comes from (a run before the query day's is replaced by the query day's).
+Of these, preprocessing drops
+
+* U-turns: riding back to the previous station, when the other train
+  could have been caught there already, and
+* transfers that reach no station earlier than staying on the train or
+  than another transfer at the same stop (with ``day >= 0``, so it does not
+  get later on the query day's runs).
+
+Witt's reduction also counts transfers at later stops of the train as
+alternatives. That is not used here: the query may skip those stops'
+transfers, in favour of an earlier arrival whose own transfer was in turn
+dropped for a later stop.
+
+A U-turn is only needed to return to the origin, right after boarding
+there: the origin has no arrival of its own that would make it redundant.
+For that, the earliest U-turn from every stop is kept apart as its *back*
+transfer (and an earlier one with ``day < 0``, if any).
+
+The transfer set is written next to the schedule
+(``<schedule>.c<change seconds>.tb``) and keyed by the source CSV like the
+compiled timetable, with the helpers of ``schedule_cache``.
+
+Layout (native byte order)::
+
+    header    _HEADER
+    columns   _COLUMNS in order, as 32-bit ints
+"""
+
+import math
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+from schedule_utils import DAY, Timetable, StationIndex, DepartureIndex
+from schedule_cache import (SOURCE_HEADER, SourceKey, is_current, pack_header, source_key, unpack_header,
+                            write_atomic)
+
+TB_SUFFIX = ".tb"
+
+_MAGIC = b"TB01"
+_FORMAT_VERSION = 1
+
+# change time, n_stops, n_transfers, n_back
+_HEADER = struct.Struct(SOURCE_HEADER + "IIII")
+
+# (attribute, length) where length is a function of (n_stops, n_transfers, n_back)
+_COLUMNS = (
+    ("start", lambda n, m, back: n + 1),
+    ("stop", lambda n, m, back: m),
+    ("day", lambda n, m, back: m),
+    ("back_start", lambda n, m, back: n + 1),
+    ("back_stop", lambda n, m, back: back),
+    ("back_day", lambda n, m, back: back),
+)
+
+
+def tb_path_for(schedule_file: str, change_time_seconds: int) -> str:
+    return f"{schedule_file}.c{change_time_seconds}{TB_SUFFIX}"
+
+
+class TransferSet:
+    """Reduced trip-to-trip transfers of a timetable for one change time.
+
+    The transfers from stop ``s`` (leaving its train there) are positions
+    ``start[s]:start[s + 1]``: to stop ``stop[p]``, on the run ``day[p]``
+    days after the one left. Its back transfers are laid out the same in
+    ``back_start``, ``back_stop`` and ``back_day``.
+    """
+
+    __slots__ = ("change_time", "start", "stop", "day", "back_start", "back_stop", "back_day")
+
+    def __init__(self, change_time: int = 0):
+        self.change_time = change_time
+        self.start = array("i", [0])
+        self.stop = array("i")
+        self.day = array("i")
+        self.back_start = array("i", [0])
+        self.back_stop = array("i")
+        self.back_day = array("i")
+
+    @property
+    def n_stops(self) -> int:
+        return len(self.start) - 1
+
+    @classmethod
+    def build(cls, trains: Timetable, departures: DepartureIndex, change_time: int) -> "TransferSet":
+        """Compute the transfers of ``trains`` (see the module docstring)."""
+        stop_station = trains.stop_station
+        stop_train = trains.stop_train
+        stop_arr = trains.stop_arr
+        stop_dep = trains.stop_dep
+        train_start = trains.train_start
+        dep_start = departures.start
+        dep_stops = departures.stops
+        dep_tod = departures.tod
+
+        ts = cls(change_time)
+        # earliest arrival per station staying on the current train from the
+        # stop at hand, in the frame of its run; reset after each train
+        tau = [math.inf] * trains.n_stations
+        from_stop: List[List[Tuple[int, int]]] = []
+        back_from_stop: List[List[Tuple[int, int]]] = []
+        for t in range(trains.n_trains):
+            first = train_start[t]
+            end = train_start[t + 1]
+            touched = []
+            kept: List[List[Tuple[int, int]]] = [[] for _ in range(first, end)]
+            back: List[List[Tuple[int, int]]] = [[] for _ in range(first, end)]
+            # last stop first, adding the arrivals of staying on board
+            for s in range(end - 1, first, -1):
+                station = stop_station[s]
+                if stop_arr[s] < tau[station]:
+                    tau[station] = stop_arr[s]
+                    touched.append(station)
+                ready = stop_arr[s] + change_time
+                back_station = stop_station[s - 1]
+                # arrivals improved by transfers at this stop
+                better: Dict[int, int] = {}
+                # earliest U-turn arrival: any day, day >= 0
+                back_arr = [math.inf, math.inf]
+                a = dep_start[station]
+                b = dep_start[station + 1]
+                i = bisect_left(dep_tod, ready % DAY, a, b)
+                # in order of waiting time, so early departures prune later ones
+                # (a run before the query day's is taken on the query day, so
+                # it prunes nothing)
+                for j in chain(range(i, b), range(a, i)):
+                    s2 = dep_stops[j]
+                    day = -((stop_dep[s2] - ready) // DAY)
+                    u = stop_train[s2]
+                    if u == t and s2 > s and day == 0:
+                        continue  # staying on board
+                    offset = day * DAY
+                    if (stop_station[s2 + 1] == back_station
+                            and stop_arr[s - 1] + change_time <= stop_dep[s2 + 1] + offset):
+                        arr = stop_arr[s2 + 1] + offset
+                        for any_day in (day >= 0, False):
+                            if arr < back_arr[any_day]:
+                                back_arr[any_day] = arr
+                                back[s - first][any_day:any_day + 1] = [(s2, day)]
+                        continue  # U-turn
+                    useful = False
+                    for s3 in range(s2 + 1, train_start[u + 1]):
+                        arr = stop_arr[s3] + offset
+                        st = stop_station[s3]
+                        if arr < tau[st] and arr < better.get(st, math.inf):
+                            useful = True
+                            if day >= 0:
+                                better[st] = arr
+                    if useful:
+                        kept[s - first].append((s2, day))
+            for st in touched:
+                tau[st] = math.inf
+            from_stop.extend(kept)
+            back_from_stop.extend(back)
+
+        for transfers in from_stop:
+            for s2, day in transfers:
+                ts.stop.append(s2)
+                ts.day.append(day)
+            ts.start.append(len(ts.stop))
+        for transfers in back_from_stop:
+            for s2, day in set(transfers):
+                ts.back_stop.append(s2)
+                ts.back_day.append(day)
+            ts.back_start.append(len(ts.back_stop))
+        return ts
+
+
+def _write(tb_file: str, ts: TransferSet, key: SourceKey):
+    header = pack_header(_HEADER, _MAGIC, _FORMAT_VERSION, key,
+                         ts.change_time, ts.n_stops, len(ts.stop), len(ts.back_stop))
+    write_atomic(tb_file, [header, *(getattr(ts, name).tobytes() for name, _ in _COLUMNS)])
+
+
+def _read(tb_file: str) -> Tuple[tuple, TransferSet] | None:
+    """Read ``tb_file``; return (source key, transfer set) or None."""
+    try:
+        with open(tb_file, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    unpacked = unpack_header(_HEADER, data, _MAGIC, _FORMAT_VERSION)
+    if unpacked is None:
+        return None
+    key, (change_time, *counts) = unpacked
+    if len(data) != _HEADER.size + 4 * sum(length(*counts) for _, length in _COLUMNS):
+        return None
+
+    ts = TransferSet(change_time)
+    pos = _HEADER.size
+    for name, length in _COLUMNS:
+        column = array("i")
+        n = 4 * length(*counts)
+        column.frombytes(data[pos:pos + n])
+        setattr(ts, name, column)
+        pos += n
+    return key, ts
+
+
+def compile_transfers(schedule_file: str, trains: Timetable, departures: DepartureIndex, change_time: int,
+                      tb_file: str | None = None) -> TransferSet:
+    """Compute the transfers of ``trains`` (of ``schedule_file``) and write them."""
+    key = source_key(schedule_file)
+    ts = TransferSet.build(trains, departures, change_time)
+    _write(tb_file or tb_path_for(schedule_file, change_time), ts, key)
+    return ts
+
+
+def load_transfers(schedule_file: str, trains: Timetable, departures: DepartureIndex, change_time: int,
+                   tb_file: str | None = None) -> TransferSet:
+    """Return the transfers of ``schedule_file`` for ``change_time``, computing them if needed.
+
+    The file is trusted like the compiled timetable: matching size and
+    mtime, or else a matching SHA-256. A stale or missing file is rebuilt
+    (and written if possible).
+    """
+    tb_file = tb_file or tb_path_for(schedule_file, change_time)
+    st = os.stat(schedule_file)
+
+    cached = _read(tb_file)
+    if cached is not None:
+        key, ts = cached
+        if (ts.n_stops == trains.n_stops and ts.change_time == change_time
+                and is_current(tb_file, schedule_file, st, key)):
+            return ts
+
+    try:
+        return compile_transfers(schedule_file, trains, departures, change_time, tb_file)
+    except OSError:
+        return TransferSet.build(trains, departures, change_time)
+
+
+def trip_arrivaltime(
+    trains: Timetable,
+    station_index: StationIndex,
+    transfers: TransferSet,
+    from_station: str,
+    to_stations: Iterable[str] | None,
+    start_time: int,
+) -> Tuple[Dict[Hashable, Tuple[Hashable | None, Any]], Dict[Hashable, int], Dict[int, Hashable]]:
+    """Earliest arrival, with the interface of ``csa.csa_arrivaltime``.
+
+    The change time is that of ``transfers``. Among equally early journeys
+    one with the fewest changes is taken.
+    """
+    station_ids = trains.station_ids
+    origin = station_ids.get(from_station, -1)
+    if to_stations is None:
+        targets = None
+    else:
+        targets = {station_ids[s] for s in to_stations if s in station_ids}
+
+    prev: Dict[Hashable, Tuple[Hashable | None, Any]] = {}
+    dist: Dict[Hashable, int] = {}
+    if origin < 0 or targets == set():
+        return prev, dist, {}
+
+    stop_station = trains.stop_station
+    stop_train = trains.stop_train
+    stop_arr = trains.stop_arr
+    stop_dep = trains.stop_dep
+    train_start = trains.train_start
+    tr_start = transfers.start
+    tr_stop = transfers.stop
+    tr_day = transfers.day
+    back_start = transfers.back_start
+    back_stop = transfers.back_stop
+    back_day = transfers.back_day
+
+    # the origin gets no label of its own, as in raptor
+    arrival = [math.inf] * trains.n_stations
+    # station -> (segment, stop) of its earliest arrival
+    arrival_at: Dict[int, Tuple[int, int]] = {}
+    # segments: boarding stop, day of the run, and the (segment, stop) it was reached from
+    seg_board: List[int] = []
+    seg_from: List[Tuple[int, int] | None] = []
+    # per train: (day, boarding stop) of the runs boarded so far, days
+    # ascending and stops descending; a run is scanned from its boarding
+    # stop up to the earliest boarding of itself or an earlier run
+    reached: Dict[int, List[Tuple[int, int]]] = {}
+    # the first and the last of those runs, to turn most transfers away
+    # without a call
+    first_day = array("i", [2 ** 31 - 1]) * trains.n_trains
+    first_board = array("i", [0]) * trains.n_trains
+    last_day = array("i", [2 ** 31 - 1]) * trains.n_trains
+    last_board = array("i", [0]) * trains.n_trains
+
+    def enqueue(queue: List[Tuple[int, int, int]], s: int, k: int, came_from: Tuple[int, int] | None):
+        t = stop_train[s]
+        runs = reached.setdefault(t, [])
+        end = train_start[t + 1] - 1
+        for day, board in runs:
+            if day > k:
+                break
+            end = board
+        if s >= end:
+            return
+        runs[:] = [run for run in runs if run[0] < k or run[1] < s]
+        runs.append((k, s))
+        runs.sort()
+        first_day[t], first_board[t] = runs[0]
+        last_day[t], last_board[t] = runs[-1]
+        queue.append((len(seg_board), k, end))
+        seg_board.append(s)
+        seg_from.append(came_from)
+
+    queue: List[Tuple[int, int, int]] = []
+    for s in station_index[origin]:
+        if s + 1 < train_start[stop_train[s] + 1]:
+            # the first run leaving at or after the start time
+            dep = stop_dep[s]
+            enqueue(queue, s, 0 if dep >= start_time else -((dep - start_time) // DAY), None)
+
+    # arrivals at or after this cannot improve any target
+    bound = math.inf
+    while queue:
+        next_queue: List[Tuple[int, int, int]] = []
+        for seg, k, end in queue:
+            offset = k * DAY
+            # boarded at the origin: riding straight back is a way to return
+            back_at = seg_board[seg] + 1 if seg_from[seg] is None else -1
+            for s in range(seg_board[seg] + 1, end + 1):
+                arr = stop_arr[s] + offset
+                if arr >= bound:
+                    break
+                if s == back_at:
+                    for p in range(back_start[s], back_start[s + 1]):
+                        k2 = k + back_day[p]
+                        enqueue(next_queue, back_stop[p], k2 if k2 > 0 else 0, (seg, s))
+                station = stop_station[s]
+                # changes only where the station's earliest arrival improves
+                if arr >= arrival[station]:
+                    continue
+                arrival[station] = arr
+                arrival_at[station] = (seg, s)
+                if targets is not None and station in targets:
+                    bound = max(arrival[st] for st in targets)
+                for p in range(tr_start[s], tr_start[s + 1]):
+                    s2 = tr_stop[p]
+                    k2 = k + tr_day[p]
+                    if k2 < 0:
+                        k2 = 0
+                    t2 = stop_train[s2]
+                    if s2 >= first_board[t2] and k2 >= first_day[t2] or s2 >= last_board[t2] and k2 >= last_day[t2]:
+                        continue
+                    enqueue(next_queue, s2, k2, (seg, s))
+        queue = next_queue
+
+    goals: Dict[int, Hashable] = {}
+    for station in (arrival_at if targets is None else targets):
+        if station not in arrival_at:
+            continue
+        goal = _journey_prev(arrival_at[station], seg_board, seg_from, prev)
+        goals[station] = goal
+        dist[goal] = int(arrival[station]) - start_time
+    return prev, dist, goals
+
+
+def _journey_prev(node: Tuple[int, int], seg_board: List[int], seg_from: List[Tuple[int, int] | None],
+                  prev: Dict[Hashable, Tuple[Hashable | None, Any]]) -> Hashable:
+    """Add the journey ending at ``node`` to ``prev``; returns ``node``.
+
+    Nodes are ``(segment, stop)``: every segment is a distinct ride, so
+    journeys to different stations share their common prefix.
+    """
+    goal = node
+    while node is not None and node not in prev:
+        seg, s = node
+        board = seg_board[seg]
+        for stop in range(s, board + 1, -1):
+            prev[(seg, stop)] = ((seg, stop - 1), stop - 1)
+        prev[(seg, board + 1)] = (seg_from[seg], board)
+        node = seg_from[seg]
+    return goal